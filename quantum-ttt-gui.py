@@ -1,22 +1,44 @@
 import tkinter as tk
 from tkinter import messagebox
-import math
+import argparse
+import queue
+
+from quantum_ai import AlphaBetaAI, SearchWorker
+from quantum_engine import PAIRS, PLAYERS, QuantumEngine
+from quantum_metrics import EngineMetrics, run_profiled
+from quantum_odds import OccupancyOdds
+from quantum_record import GameRecorder, RecordWriter
+from quantum_render import BoardRenderer
+from quantum_tablebase import Tablebase
 
 class QuantumTicTacToe:
-    def __init__(self, master, info_label, entanglement_listbox):
+    def __init__(self, master, info_label, entanglement_listbox, tablebase=None, scale=1.0):
         self.master = master
         self.info_label = info_label
         self.entanglement_listbox = entanglement_listbox
 
-        self.board = [None] * 9  # Classical particles (X, O)
-        self.entanglements = {}  # Entanglements: box_index -> [entangled_box1, entangled_box2, ...]
-        self.placed_particles = [] # (player_lowercase, (box1, box2)) for quantum particles
-        self.current_player = 'X' # Current player for placing quantum particles
-        self.game_over = False
-        self.winner = None
+        self.engine = QuantumEngine() # Placement, loop detection, collapse and win check shared with the CLI
+        self.engine.events.subscribe(self) # Engine events drive the info label and game-over dialogs
 
         self.selected_boxes = [] # Stores two boxes selected for entanglement
 
+        # Optional endgame tablebase: the turn message says who wins from here, and the computer plays it perfectly
+        self.tablebase = tablebase
+
+        # Computer opponent, switched on with the "Computer plays O" checkbox
+        self.ai = AlphaBetaAI(time_limit=1.0, tablebase=tablebase)
+        self.ai_player = 'O'
+        self.ai_enabled = tk.BooleanVar(master, value=False)
+        self.ai_worker = SearchWorker(self.ai) # Searches off the Tk thread
+        self._ai_request = None # Worker request number of the search for the current decision
+        self._ai_job = None # Pending `after` callback polling the worker
+        self._ai_status = "" # Info message the search progress is appended to
+
+        # Occupancy odds overlay, switched on with the "Show odds" checkbox: each box with particles
+        # shows how often it ends up X or O over the possible collapse outcomes
+        self.odds = OccupancyOdds(self.engine)
+        self.show_odds = tk.BooleanVar(master, value=False)
+
         # Define colors for players and UI elements
         self.player_colors = {'X': '#0000FF', 'O': '#FF0000'} # Blue for X, Red for O (Classical)
         # Paler shades for entangled particles
@@ -30,7 +52,7 @@ class QuantumTicTacToe:
         self.hover_overlay_color = '#E0E0E0' # Light gray for hover effect
 
         # Board dimensions
-        self.cell_size = 100
+        self.cell_size = round(100 * scale)
         self.padding = 2 # Padding between cells
         self.board_canvas_width = (self.cell_size + self.padding * 2) * 3
         self.board_canvas_height = (self.cell_size + self.padding * 2) * 3
@@ -38,11 +60,42 @@ class QuantumTicTacToe:
         self.setup_game_ui()
         self.reset_game()
 
+    # Read-only views of the position, in the shapes the drawing code uses
+    @property
+    def state(self):
+        return self.engine.state # Bitboard position: classical marks, quantum particles, player to move
+
+    @property
+    def board(self):
+        return self.state.board_list() # Classical particles (X, O)
+
+    @property
+    def entanglements(self):
+        return self.state.entanglement_map() # box_index -> [entangled_box1, entangled_box2, ...]
+
+    @property
+    def placed_particles(self):
+        return self.state.particle_list() # (player_lowercase, (box1, box2)) for quantum particles
+
+    @property
+    def current_player(self):
+        return self.state.current_player # Current player for placing quantum particles
+
+    @property
+    def game_over(self):
+        return self.engine.game_over
+
+    @property
+    def winner(self):
+        return self.engine.winner
+
     def setup_game_ui(self):
         # Create a single Canvas for the entire board drawing
         self.board_drawing_canvas = tk.Canvas(self.master, width=self.board_canvas_width, height=self.board_canvas_height,
                                              bg=self.default_bg, highlightthickness=0)
         self.board_drawing_canvas.grid(row=0, column=0, columnspan=2, pady=10, padx=10)
+        # Cells, particles and arcs are created once; redraws reconfigure them (see quantum_render.py)
+        self.renderer = BoardRenderer(self.board_drawing_canvas, self)
 
         # Bind click and hover events to the main drawing canvas
         self.board_drawing_canvas.bind("<Button-1>", self.on_board_click)
@@ -62,219 +115,119 @@ class QuantumTicTacToe:
                                          bg="#FFE4E1", relief=tk.FLAT, command=lambda: self.make_collapse_choice(2))
         self.choice2_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5, pady=5)
 
-        # Reset button
-        reset_button = tk.Button(self.master, text="Reset Game", font=("Arial", 12),
+        # Hovering a choice shows the board it leads to
+        self.choice1_button.bind("<Enter>", lambda event: self.show_collapse_preview(1))
+        self.choice2_button.bind("<Enter>", lambda event: self.show_collapse_preview(2))
+        self.choice1_button.bind("<Leave>", lambda event: self.hide_collapse_preview())
+        self.choice2_button.bind("<Leave>", lambda event: self.hide_collapse_preview())
+        self._collapse_previews = None # Both outcomes of the collapse on offer, from engine.preview_collapse()
+        self._preview_message = None # Info message to put back when the preview goes away
+
+        # Reset button and computer opponent toggle
+        controls_frame = tk.Frame(self.master, bg=self.default_bg)
+        controls_frame.grid(row=2, column=0, columnspan=2, pady=(0,10))
+        reset_button = tk.Button(controls_frame, text="Reset Game", font=("Arial", 12),
                                  bg="#ADD8E6", relief=tk.FLAT, command=self.reset_game)
-        reset_button.grid(row=2, column=0, columnspan=2, pady=(0,10))
+        reset_button.pack(side=tk.LEFT, padx=5)
+        ai_checkbutton = tk.Checkbutton(controls_frame, text=f"Computer plays {self.ai_player}", font=("Arial", 11),
+                                        variable=self.ai_enabled, bg=self.default_bg, command=self.on_ai_toggled)
+        ai_checkbutton.pack(side=tk.LEFT, padx=5)
+        odds_checkbutton = tk.Checkbutton(controls_frame, text="Show odds", font=("Arial", 11),
+                                          variable=self.show_odds, bg=self.default_bg, command=self.update_board_display)
+        odds_checkbutton.pack(side=tk.LEFT, padx=5)
 
         self.hovered_cell_index = -1 # To track which cell is currently hovered over
+        self._motion_position = (0, 0) # Latest pointer position, handled by apply_motion
+        self._motion_job = None
+        self.entanglement_lines = [] # What the entanglement listbox shows
 
     def reset_game(self):
-        self.board = [None] * 9
-        self.entanglements = {}
-        self.placed_particles = []
-        self.current_player = 'X'
-        self.game_over = False
-        self.winner = None
+        self.cancel_ai_turn()
+        self.engine.reset()
         self.selected_boxes = []
 
         self.update_board_display() # This will draw all elements
         self.update_entanglement_display()
         self.update_info_label(f"Welcome! It's Player {self.current_player}'s turn. Select two boxes to entangle.")
         self.collapse_choice_frame.grid_remove()
+        self._collapse_previews = None
+        self._preview_message = None
         self.enable_board_interaction()
+        self.schedule_ai_turn()
 
-    # Helper to get cell coordinates and center
+    # Helper to get cell coordinates and center, computed once by the renderer
     def get_cell_coords(self, index):
-        row = index // 3
-        col = index % 3
-        x1 = col * (self.cell_size + self.padding * 2) + self.padding
-        y1 = row * (self.cell_size + self.padding * 2) + self.padding
-        x2 = x1 + self.cell_size
-        y2 = y1 + self.cell_size
-        center_x = x1 + self.cell_size / 2
-        center_y = y1 + self.cell_size / 2
-        return (x1, y1, x2, y2, center_x, center_y)
+        return self.renderer.cells[index] # (x1, y1, x2, y2, center_x, center_y)
 
     def update_board_display(self):
-        self.board_drawing_canvas.delete("all") # Clear everything for redraw
-
-        # --- Draw Cell Backgrounds, Numbers, and Particles ---
-        for i in range(9):
-            x1, y1, x2, y2, center_x, center_y = self.get_cell_coords(i)
-
-            # Draw cell background
-            bg_color = self.cell_normal_bg
-            if i in self.selected_boxes:
-                bg_color = self.cell_selected_bg
-            self.board_drawing_canvas.create_rectangle(x1, y1, x2, y2, fill=bg_color, outline="gray", tags=f"cell_{i}")
-
-            # Draw box number
-            self.board_drawing_canvas.create_text(x2 - 8, y1 + 8, text=str(i), anchor="ne",
-                               font=("Arial", 9), fill=self.box_number_fg, tags=f"cell_{i}_number")
-
-            # Draw particle (if any)
-            if self.board[i]:
-                # Classical particle
-                self.board_drawing_canvas.create_text(center_x, center_y,
-                                   text=self.board[i].upper(), font=("Arial", 32, "bold"),
-                                   fill=self.player_colors[self.board[i]], tags=f"cell_{i}_particle")
-            else:
-                # Quantum particle(s) or empty
-                entangled_particles_in_cell = []
-                for player_lc, entangled_boxes in self.placed_particles:
-                    if i in entangled_boxes:
-                        entangled_particles_in_cell.append(player_lc.lower())
-                entangled_particles_in_cell.sort() # Sort for consistent display order (e.g., 'xo' instead of 'ox')
-
-                if entangled_particles_in_cell:
-                    # Draw each character individually for correct coloring
-                    approx_char_width = 20 # Approximate width of one character in pixels for font size 32
-                    total_chars = len(entangled_particles_in_cell)
-                    
-                    # Calculate starting X position to center the group of characters
-                    start_x = center_x - (total_chars * approx_char_width / 2)
-                    
-                    for char_idx, char in enumerate(entangled_particles_in_cell):
-                        char_color = self.quantum_player_colors[char] # Get the specific color for 'x' or 'o'
-                        # Position each character relative to the start_x
-                        x_pos = start_x + (char_idx * approx_char_width) + (approx_char_width / 2)
-                        
-                        self.board_drawing_canvas.create_text(x_pos, center_y,
-                                           text=char, font=("Arial", 32, "bold"),
-                                           fill=char_color, tags=f"cell_{i}_particle_part_{char_idx}")
-        
-        # --- Draw Entanglement Arcs (AFTER cells are drawn) ---
-        drawn_entanglements = set() # To avoid drawing duplicate arcs (A-B and B-A)
-        for player_lc, boxes_tuple in self.placed_particles:
-            b1, b2 = boxes_tuple
-            
-            # Ensure we only draw each unique entanglement once
-            normalized_pair = tuple(sorted((b1, b2)))
-            if normalized_pair in drawn_entanglements:
-                continue
-            drawn_entanglements.add(normalized_pair)
-
-            _, _, _, _, cx1, cy1 = self.get_cell_coords(b1)
-            _, _, _, _, cx2, cy2 = self.get_cell_coords(b2)
-
-            # Determine arc color based on the player who placed it
-            arc_color = self.arc_colors[player_lc.upper()]
-
-            # Calculate mid-point and offset for the arc
-            mid_x = (cx1 + cx2) / 2
-            mid_y = (cy1 + cy2) / 2
-
-            # Vector between centers
-            dx = cx2 - cx1
-            dy = cy2 - cy1
-
-            # Perpendicular vector (rotated 90 degrees) for offset
-            # Normalize and scale for consistent offset strength
-            vector_length = math.sqrt(dx**2 + dy**2)
-            offset_strength = 0.2 * self.cell_size # Adjust this value for arc height
-            
-            if vector_length != 0:
-                # Rotate the vector (dx, dy) by 90 degrees to get (-dy, dx)
-                # Then scale it by offset_strength / vector_length
-                offset_vec_x = -dy * (offset_strength / vector_length)
-                offset_vec_y = dx * (offset_strength / vector_length)
-            else: # Should not happen for two distinct boxes, but safeguard
-                offset_vec_x, offset_vec_y = 0, 0
-
-            # Control point for the arc
-            arc_control_x = mid_x + offset_vec_x
-            arc_control_y = mid_y + offset_vec_y
-
-            # Create the curved line using multiple points for smoothness
-            points = [cx1, cy1, arc_control_x, arc_control_y, cx2, cy2]
-            
-            self.board_drawing_canvas.create_line(points, smooth=True, splinesteps=20,
-                                                  fill=arc_color, width=2, tags="entanglement_arc")
-
-        # After drawing all arcs and cells, bring all cell-related tags to the front
-        # This will ensure arcs are visible above background but below text/numbers
-        # The previous tag_lower was indeed the issue.
-        self.board_drawing_canvas.tag_raise("entanglement_arc")
-
+        # The renderer keeps its canvas items between calls and only touches the ones that changed
+        # (a cell that just became classical also loses its hover highlight)
+        odds = self.odds.labels() if self.show_odds.get() else None
+        self.renderer.render(self.board, self.placed_particles, self.selected_boxes, odds=odds)
 
     def on_canvas_motion(self, event):
-        if self.game_over or self.collapse_choice_frame.winfo_ismapped():
+        # Motion events can arrive far faster than the screen updates: keep only the latest
+        # position and handle it once the event queue is idle
+        self._motion_position = (event.x, event.y)
+        if self._motion_job is None:
+            self._motion_job = self.master.after_idle(self.apply_motion)
+
+    def apply_motion(self):
+        self._motion_job = None
+        if self.game_over or self.collapse_choice_frame.winfo_ismapped() or self.is_ai_turn():
             return
-        
-        # Determine which cell is currently being hovered over
-        x, y = event.x, event.y
-        current_hover_index = -1
-        for i in range(9):
-            x1, y1, x2, y2, _, _ = self.get_cell_coords(i)
-            if x1 <= x < x2 and y1 <= y < y2:
-                current_hover_index = i
-                break
 
+        # Determine which cell is currently being hovered over
+        current_hover_index = self.renderer.cell_at(*self._motion_position)
         if current_hover_index != self.hovered_cell_index:
-            # Clear previous hover if any
-            if self.hovered_cell_index != -1 and self.board[self.hovered_cell_index] is None:
-                self.board_drawing_canvas.delete(f"hover_rect_{self.hovered_cell_index}")
-            
-            # Apply new hover if valid and not a classical cell
-            if current_hover_index != -1 and self.board[current_hover_index] is None:
-                x1, y1, x2, y2, _, _ = self.get_cell_coords(current_hover_index)
-                self.board_drawing_canvas.create_rectangle(x1, y1, x2, y2,
-                                                           fill=self.hover_overlay_color, stipple="gray50", outline="",
-                                                           tags=f"hover_rect_{current_hover_index}")
-                # Ensure hover is below numbers/particles but above cell background
-                self.board_drawing_canvas.tag_lower(f"hover_rect_{current_hover_index}", f"cell_{current_hover_index}_number")
-            
+            # Highlight the new cell unless it holds a classical mark
+            if current_hover_index != -1 and not self.state.classical >> current_hover_index & 1:
+                self.renderer.set_hover(current_hover_index)
+            else:
+                self.renderer.set_hover(-1)
             self.hovered_cell_index = current_hover_index
 
     def on_canvas_leave(self, event):
         # Clear hover effect when mouse leaves the entire canvas
-        if self.hovered_cell_index != -1:
-            self.board_drawing_canvas.delete(f"hover_rect_{self.hovered_cell_index}")
+        if self._motion_job is not None:
+            self.master.after_cancel(self._motion_job)
+            self._motion_job = None
+        self.renderer.set_hover(-1)
         self.hovered_cell_index = -1
 
     def update_info_label(self, message):
         self.info_label.config(text=message)
 
     def update_entanglement_display(self):
-        self.entanglement_listbox.delete(0, tk.END)
-        self.entanglement_listbox.insert(tk.END, "--- Current Entanglements ---")
-        if not self.entanglements:
-            self.entanglement_listbox.insert(tk.END, "No entanglements yet.")
-            return
-
-        displayed_entanglements = set()
-        for box in sorted(self.entanglements.keys()):
-            for connected_box in sorted(self.entanglements[box]):
-                pair = tuple(sorted((box, connected_box)))
-                if pair not in displayed_entanglements:
-                    particle_owner = '?'
-                    for player_lc, boxes_tuple in self.placed_particles:
-                        if boxes_tuple == pair:
-                            particle_owner = player_lc.upper()
-                            break
-                    self.entanglement_listbox.insert(tk.END, f"  {particle_owner}: ({pair[0]}, {pair[1]})")
-                    displayed_entanglements.add(pair)
+        # Pair indices follow the (box1, box2) order, so sorting them lists the entanglements by box
+        lines = ["--- Current Entanglements ---"]
+        lines.extend(f"  {self.state.owner_of(p)}: ({PAIRS[p][0]}, {PAIRS[p][1]})" for p in sorted(self.state.moves))
+        if len(lines) == 1:
+            lines.append("No entanglements yet.")
+
+        # Only rewrite the listbox from the first line that differs
+        shown = self.entanglement_lines
+        first = 0
+        while first < len(shown) and first < len(lines) and shown[first] == lines[first]:
+            first += 1
+        if first < len(shown):
+            self.entanglement_listbox.delete(first, tk.END)
+        for line in lines[first:]:
+            self.entanglement_listbox.insert(tk.END, line)
+        self.entanglement_lines = lines
 
     def on_board_click(self, event):
         # Determine which cell was clicked based on event coordinates
-        x, y = event.x, event.y
-        clicked_index = -1
-        for i in range(9):
-            x1, y1, x2, y2, _, _ = self.get_cell_coords(i)
-            if x1 <= x < x2 and y1 <= y < y2:
-                clicked_index = i
-                break
-        
+        clicked_index = self.renderer.cell_at(event.x, event.y)
         if clicked_index == -1: # Clicked outside any cell
             return
 
         # Rest of the logic remains similar to previous on_board_click
-        if self.game_over or self.collapse_choice_frame.winfo_ismapped():
+        if self.game_over or self.collapse_choice_frame.winfo_ismapped() or self.is_ai_turn():
             return
 
-        if self.board[clicked_index] is not None:
-            self.update_info_label(f"Box {clicked_index} is already occupied by a classical '{self.board[clicked_index]}'. Please choose an empty box.")
+        if self.state.classical >> clicked_index & 1:
+            self.update_info_label(f"Box {clicked_index} is already occupied by a classical '{self.state.mark_at(clicked_index)}'. Please choose an empty box.")
             return
 
         if len(self.selected_boxes) < 2:
@@ -299,160 +252,178 @@ class QuantumTicTacToe:
                     self.update_board_display() # Update to remove selection highlights
 
     def place_particle(self, box1, box2):
-        if box1 == box2:
-            self.update_info_label("Boxes must be different.")
+        # Messages come back through the engine event hooks below
+        self.cancel_ai_turn() # Any search still running was for the position before this move
+        if not self.engine.place_particle(box1, box2):
             return False
 
-        for _, existing_boxes in self.placed_particles:
-            if tuple(sorted([box1, box2])) == existing_boxes:
-                self.update_info_label("That entanglement already exists.")
-                return False
-
-        particle_boxes_tuple = tuple(sorted([box1, box2]))
-        self.placed_particles.append((self.current_player.lower(), particle_boxes_tuple))
-
-        self.entanglements.setdefault(box1, []).append(box2)
-        self.entanglements.setdefault(box2, []).append(box1)
-
-        self.update_info_label(f"Player {self.current_player} placed a particle entangled between boxes {box1} and {box2}.")
-
         if self.check_for_loop():
-            self.update_info_label("!!! An entanglement loop has formed! Waveform collapse initiated. !!!")
             self.initiate_collapse_choice()
-        else:
-            self.switch_player()
-            self.update_info_label(f"It's Player {self.current_player}'s turn. Select two boxes to entangle.")
+        elif not self.game_over:
+            self.update_info_label(f"It's Player {self.current_player}'s turn. Select two boxes to entangle.{self.outlook()}")
+        self.schedule_ai_turn()
         return True
 
     def check_for_loop(self):
-        visited = set()
-        recursion_stack = set()
-
-        for node in self.entanglements.keys():
-            if node not in visited:
-                if self._dfs_cycle_detect(node, -1, visited, recursion_stack):
-                    return True
-        return False
-
-    def _dfs_cycle_detect(self, current_node, parent, visited, recursion_stack):
-        visited.add(current_node)
-        recursion_stack.add(current_node)
-
-        for neighbor in self.entanglements.get(current_node, []):
-            if neighbor == parent:
-                continue
-
-            if neighbor in recursion_stack:
-                return True
-
-            if neighbor not in visited:
-                if self._dfs_cycle_detect(neighbor, current_node, visited, recursion_stack):
-                    return True
-
-        recursion_stack.remove(current_node)
-        return False
+        return self.engine.loop is not None
 
     def initiate_collapse_choice(self):
         self.disable_board_interaction()
-        self.collapse_choice_frame.grid()
 
         last_particle_info = self.placed_particles[-1]
         last_particle_player_lowercase, last_particle_boxes = last_particle_info
         box_a, box_b = last_particle_boxes
 
+        self._collapse_info = {
+            "box_a": box_a,
+            "box_b": box_b
+        }
+
         collapse_chooser = 'O' if self.current_player == 'X' else 'X'
-        self.update_info_label(f"Player {collapse_chooser} chooses collapse! Last particle ({last_particle_player_lowercase.upper()}): {box_a} <-> {box_b}")
+        loop_boxes, _ = self.engine.loop
+        if self.is_ai_turn():
+            # No buttons: the computer's choice is scheduled by place_particle
+            self.update_info_label(f"Computer ({collapse_chooser}) chooses collapse... Loop through boxes {', '.join(map(str, loop_boxes))}. "
+                                   f"Last particle ({last_particle_player_lowercase.upper()}): {box_a} <-> {box_b}")
+            return
+        # Both outcomes are worked out now, once; hovering a button just draws one of them
+        self._collapse_previews = self.engine.preview_collapse()
+        self.collapse_choice_frame.grid()
+        self.update_info_label(f"Player {collapse_chooser} chooses collapse! Loop through boxes {', '.join(map(str, loop_boxes))}. "
+                               f"Last particle ({last_particle_player_lowercase.upper()}): {box_a} <-> {box_b}")
 
         self.choice1_button.config(text=f"Resolve {last_particle_player_lowercase.upper()} to {box_a}")
         self.choice2_button.config(text=f"Resolve {last_particle_player_lowercase.upper()} to {box_b}")
 
-        self._collapse_info = {
-            "last_particle_info": last_particle_info,
-            "box_a": box_a,
-            "box_b": box_b,
-            "classical_player_mark": self.current_player.upper()
-        }
+    def show_collapse_preview(self, choice):
+        # Ghost of the board after resolving the last particle to the button's box
+        if self._collapse_previews is None or not self.collapse_choice_frame.winfo_ismapped():
+            return
+        preview = self._collapse_previews[choice - 1]
+        if self._preview_message is None:
+            self._preview_message = self.info_label.cget("text")
+        self.renderer.render(preview.board_list(), preview.particle_list(), ghost=preview.marked)
+
+        player = self.state.owner_of(self.state.moves[-1])
+        resolved = len(preview.result.resolved) - len(preview.result.lost)
+        message = f"If {player} resolves to {preview.chosen_box}: {resolved} new classical mark{'s' if resolved != 1 else ''}."
+        if preview.winner == 'Both':
+            message += " Both players get three in a row: a draw."
+        elif preview.winner:
+            message += f" Player {preview.winner} wins!"
+        elif preview.outcome is not None:
+            message += " The game ends in a draw."
+        self.update_info_label(message)
+
+    def hide_collapse_preview(self):
+        if self._preview_message is None:
+            return
+        self.update_info_label(self._preview_message)
+        self._preview_message = None
+        self.update_board_display()
 
     def make_collapse_choice(self, choice):
         self.collapse_choice_frame.grid_remove()
+        self._collapse_previews = None
+        self._preview_message = None # The outcome is being applied; the real board replaces any preview
         self.enable_board_interaction()
+        self.cancel_ai_turn()
 
-        last_particle_info = self._collapse_info["last_particle_info"]
         box_a = self._collapse_info["box_a"]
         box_b = self._collapse_info["box_b"]
-        classical_player_mark = self._collapse_info["classical_player_mark"]
 
         initial_resolved_box_choice = box_a if choice == 1 else box_b
+        self.engine.resolve_collapse(initial_resolved_box_choice) # Applies the cached preview when there is one
 
-        current_collapse_resolutions = {}
-        resolved_last_particle_to_box = -1
-
-        if self.board[initial_resolved_box_choice] is None:
-            resolved_last_particle_to_box = initial_resolved_box_choice
-        else:
-            self.update_info_label(f"Warning: Chosen box {initial_resolved_box_choice} for {classical_player_mark} is occupied. Trying other box.")
-            other_box = box_b if initial_resolved_box_choice == box_a else box_a
-            if self.board[other_box] is None:
-                resolved_last_particle_to_box = other_box
-            else:
-                self.update_info_label(f"Both chosen boxes ({box_a}, {box_b}) for {classical_player_mark}'s particle are occupied. Particle cannot resolve.")
-                pass
-
-        if resolved_last_particle_to_box != -1:
-            current_collapse_resolutions[last_particle_info] = resolved_last_particle_to_box
-            propagation_queue = [(last_particle_info, resolved_last_particle_to_box)]
-        else:
-            propagation_queue = []
-
-        particles_to_process = list(self.placed_particles)
-
-        while propagation_queue:
-            current_particle_info, current_resolved_box = propagation_queue.pop(0)
-            current_particle_player_lc, current_particle_boxes = current_particle_info
-
-            for other_particle_info in particles_to_process:
-                if other_particle_info == current_particle_info or other_particle_info in current_collapse_resolutions:
-                    continue
+        if not self.game_over:
+            self.update_info_label(f"Collapse complete. It's Player {self.current_player}'s turn. Select two boxes to entangle.{self.outlook()}")
+        self.schedule_ai_turn()
 
-                other_player_lc, other_boxes = other_particle_info
-                classical_mark_for_other_particle = other_player_lc.upper()
+    def outlook(self):
+        # " X wins in 3 with perfect play." when the tablebase covers the position, else ""
+        if self.tablebase is None:
+            return ""
+        outlook = self.tablebase.describe(self.engine)
+        return f" {outlook}." if outlook else ""
 
-                if current_resolved_box in other_boxes:
-                    forced_to_box = other_boxes[0] if other_boxes[1] == current_resolved_box else other_boxes[1]
+    # --- Computer opponent ---
 
-                    if other_particle_info not in current_collapse_resolutions:
-                        if self.board[forced_to_box] is None:
-                            current_collapse_resolutions[other_particle_info] = forced_to_box
-                            propagation_queue.append((other_particle_info, forced_to_box))
-                        else:
-                            self.update_info_label(f"Conflict: Quantum particle {classical_mark_for_other_particle} from {other_boxes} cannot resolve to box {forced_to_box} (occupied).")
-                            pass
+    def is_ai_turn(self):
+        # True when the computer has the next decision: a placement, or the choice of a pending collapse
+        if not self.ai_enabled.get() or self.game_over:
+            return False
+        return PLAYERS[self.state.turn ^ (self.engine.loop is not None)] == self.ai_player
 
-        for particle_info, final_box in current_collapse_resolutions.items():
-            player_lc, _ = particle_info
-            if self.board[final_box] is None:
-                self.board[final_box] = player_lc.upper()
+    def on_ai_toggled(self):
+        # Switching the computer off stops its search; if it owed a collapse choice the buttons go back to the human.
+        # Switching it on when the collapse choice is its own takes the buttons away before its search starts.
+        if not self.ai_enabled.get():
+            self.cancel_ai_turn()
+        if self.check_for_loop():
+            buttons_shown = self.collapse_choice_frame.winfo_ismapped()
+            if self.is_ai_turn() and buttons_shown:
+                self.hide_collapse_preview()
+                self.collapse_choice_frame.grid_remove()
+                self._collapse_previews = None
+                self.initiate_collapse_choice() # Now just announces the computer's choice
+            elif not self.is_ai_turn() and not buttons_shown:
+                self.initiate_collapse_choice()
+        self.schedule_ai_turn()
+
+    def schedule_ai_turn(self):
+        # The search runs on the worker thread; its results are picked up by poll_ai_turn from the
+        # event loop, so the window keeps redrawing and answering however long the computer thinks
+        if self._ai_request is None and self.is_ai_turn():
+            self._ai_request = self.ai_worker.start(self.engine)
+            self._ai_status = self.info_label.cget("text") # Progress is shown after this message
+            self._ai_job = self.master.after(50, self.poll_ai_turn)
+
+    def cancel_ai_turn(self):
+        # Drops the computer's search for the current position, if one is running
+        if self._ai_request is not None:
+            self.ai_worker.cancel()
+            self._ai_request = None
+        if self._ai_job is not None:
+            self.master.after_cancel(self._ai_job)
+            self._ai_job = None
+
+    def poll_ai_turn(self):
+        self._ai_job = None
+        decision = None
+        while True:
+            try:
+                request, kind, depth, move, value = self.ai_worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if request != self._ai_request:
+                continue # From a search that was cancelled
+            if kind == 'progress':
+                best = f"{PAIRS[move][0]}-{PAIRS[move][1]}" if self.engine.loop is None else f"box {move}"
+                self.update_info_label(f"{self._ai_status} (Computer: depth {depth}, best so far {best})")
             else:
-                self.update_info_label(f"Warning: Attempted to place {player_lc.upper()} in box {final_box}, but it was already occupied.")
-
-
-        resolved_particle_infos = current_collapse_resolutions.keys()
-        self.placed_particles = [p for p in self.placed_particles if p not in resolved_particle_infos]
-
-        new_entanglements = {}
-        for player_lc, (b1, b2) in self.placed_particles:
-            new_entanglements.setdefault(b1, []).append(b2)
-            new_entanglements.setdefault(b2, []).append(b1)
-        self.entanglements = new_entanglements
-
-
-        self.update_board_display()
-        self.update_entanglement_display()
-        self.check_win()
+                decision = (kind, move, value)
+        if decision is None:
+            if self._ai_request is not None:
+                self._ai_job = self.master.after(50, self.poll_ai_turn)
+            return
 
-        if not self.game_over:
-            self.switch_player()
-            self.update_info_label(f"Collapse complete. It's Player {self.current_player}'s turn. Select two boxes to entangle.")
+        self._ai_request = None
+        kind, move, value = decision
+        if not self.is_ai_turn():
+            return
+        if kind == 'error':
+            # value is the exception. The computer can't decide here, so it is switched off and the
+            # decision (collapse buttons included) goes back to the human.
+            self.ai_enabled.set(False)
+            self.on_ai_toggled()
+            self.update_info_label(f"The computer player stopped: its search failed ({value!r}). "
+                                   f"Player {PLAYERS[self.state.turn ^ (self.engine.loop is not None)]}, please decide.")
+            return
+        if self.check_for_loop():
+            self.make_collapse_choice(1 if move == self._collapse_info["box_a"] else 2)
+        elif self.place_particle(*PAIRS[move]):
+            self.update_board_display()
+            self.update_entanglement_display()
 
     def disable_board_interaction(self):
         self.board_drawing_canvas.config(state=tk.DISABLED)
@@ -464,59 +435,68 @@ class QuantumTicTacToe:
         self.board_drawing_canvas.config(state=tk.NORMAL)
 
     def switch_player(self):
-        self.current_player = 'O' if self.current_player == 'X' else 'X'
+        self.state.switch_player()
 
     def check_win(self):
-        winning_combinations = [
-            (0, 1, 2), (3, 4, 5), (6, 7, 8),  # Rows
-            (0, 3, 6), (1, 4, 7), (2, 5, 8),  # Columns
-            (0, 4, 8), (2, 4, 6)              # Diagonals
-        ]
-
-        x_wins = False
-        o_wins = False
-
-        for combo in winning_combinations:
-            s1, s2, s3 = combo
-            # Check for X win
-            if self.board[s1] == 'X' and self.board[s1] == self.board[s2] and self.board[s1] == self.board[s3]:
-                x_wins = True
-            # Check for O win
-            if self.board[s1] == 'O' and self.board[s1] == self.board[s2] and self.board[s1] == self.board[s3]:
-                o_wins = True
-        
-        # --- New Win/Draw Logic ---
-        if x_wins and o_wins:
-            self.winner = "Both" # Indicate a simultaneous win for draw purposes
-            self.game_over = True
-            self.update_info_label("It's a draw! Both players achieved three in a row.")
-            messagebox.showinfo("Game Over", "It's a draw! Both players achieved three in a row.")
-        elif x_wins:
-            self.winner = 'X'
-            self.game_over = True
-            self.update_info_label(f"Player {self.winner} wins!")
-            messagebox.showinfo("Game Over", f"Player {self.winner} wins!")
-        elif o_wins:
-            self.winner = 'O'
-            self.game_over = True
-            self.update_info_label(f"Player {self.winner} wins!")
-            messagebox.showinfo("Game Over", f"Player {self.winner} wins!")
-        elif all(self.board[i] is not None for i in range(9)): # Standard draw if board is full
-            self.game_over = True
-            self.update_info_label("It's a draw! No more moves possible.")
-            messagebox.showinfo("Game Over", "It's a draw! No more moves possible.")
-        
-        if self.game_over:
-            self.disable_board_interaction() # Disable interaction once game is over
+        return self.engine.check_win()
 
+    # --- Engine event hooks: the info label and game-over dialogs ---
 
+    def on_invalid_move(self, reason, box1, box2):
+        if reason == 'same_box':
+            self.update_info_label("Boxes must be different.")
+        elif reason == 'duplicate':
+            self.update_info_label("That entanglement already exists.")
+        elif reason == 'occupied':
+            box = box1 if self.state.mark_at(box1) else box2
+            self.update_info_label(f"Box {box} is already occupied by a classical '{self.state.mark_at(box)}'. Please choose an empty box.")
+        else:
+            self.update_info_label("Invalid box numbers.")
+
+    def on_particle_placed(self, player, box1, box2):
+        self.update_info_label(f"Player {player} placed a particle entangled between boxes {box1} and {box2}.")
+
+    def on_loop_detected(self, loop_boxes, loop_pairs, chooser):
+        self.update_info_label("!!! An entanglement loop has formed! Waveform collapse initiated. !!!")
+
+    def on_conflict(self, result, pair, box, player):
+        if pair != result.pair:
+            self.update_info_label(f"Conflict: Quantum particle {player} from {PAIRS[pair]} cannot resolve to box {box} (occupied).")
+        elif box == result.chosen_box:
+            self.update_info_label(f"Warning: Chosen box {box} for {player} is occupied. Trying other box.")
+        else:
+            box_a, box_b = PAIRS[pair]
+            self.update_info_label(f"Both chosen boxes ({box_a}, {box_b}) for {player}'s particle are occupied. Particle cannot resolve.")
+
+    def on_collapse_resolved(self, result):
+        for _, box, player in result.lost:
+            self.update_info_label(f"Warning: Attempted to place {player} in box {box}, but it was already occupied.")
+        # Redraw before any game-over dialog so the final board is visible behind it
+        self.update_board_display()
+        self.update_entanglement_display()
+
+    def on_win(self, player):
+        self.update_info_label(f"Player {player} wins!")
+        messagebox.showinfo("Game Over", f"Player {player} wins!")
+        self.disable_board_interaction() # Disable interaction once game is over
+
+    def on_draw(self, reason):
+        if reason == 'both':
+            message = "It's a draw! Both players achieved three in a row."
+        else:
+            message = "It's a draw! No more moves possible."
+        self.update_info_label(message)
+        messagebox.showinfo("Game Over", message)
+        self.disable_board_interaction() # Disable interaction once game is over
 
 
 class QuantumTicTacToeGUI:
-    def __init__(self, master):
+    def __init__(self, master, tablebase=None, scale=1.0):
         self.master = master
         master.title("Quantum Tic-Tac-Toe")
-        master.geometry("520x720")
+        # The window is sized for the default 312 pixel board and grows with a scaled one
+        board_size = (round(100 * scale) + 4) * 3
+        master.geometry(f"{max(520, board_size + 40)}x{720 + board_size - 312}")
         master.resizable(False, False)
         master.config(bg="#F0F0F0") # Soft light gray background for the window
 
@@ -540,10 +520,32 @@ class QuantumTicTacToeGUI:
                                font=("Arial", 9, "italic"), wraplength=480, fg="#555555", bg=master["bg"])
         rules_label.grid(row=5, column=0, columnspan=2, pady=(10, 15), padx=10, sticky="ew")
 
-        self.game = QuantumTicTacToe(master, self.info_label, self.entanglement_listbox)
+        self.game = QuantumTicTacToe(master, self.info_label, self.entanglement_listbox, tablebase, scale)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantum Tic-Tac-Toe.")
+    parser.add_argument("--tablebase", help="endgame tablebase built by quantum_tablebase.py")
+    parser.add_argument("--record", help="append every finished game to this game record file")
+    parser.add_argument("--scale", type=float, default=1.0, help="board size relative to the default (e.g. 1.5)")
+    parser.add_argument("--profile", help="run the session under cProfile and write the pstats to this file "
+                                          "(the computer player's search thread is not included)")
+    parser.add_argument("--metrics", help="measure the engine's hot paths and write the metrics to this file "
+                                          "on exit (.prom or .txt: Prometheus text format, otherwise JSON)")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = QuantumTicTacToeGUI(root)
-    root.mainloop()
+    app = QuantumTicTacToeGUI(root, Tablebase(args.tablebase) if args.tablebase else None, args.scale)
+    if args.record:
+        GameRecorder(app.game.engine, RecordWriter(args.record))
+    metrics = EngineMetrics() if args.metrics else None
+    if metrics:
+        metrics.attach(app.game.engine)
+    try:
+        if args.profile:
+            run_profiled(args.profile, root.mainloop)
+        else:
+            root.mainloop()
+    finally:
+        if metrics:
+            metrics.write(args.metrics)
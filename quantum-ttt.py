@@ -1,278 +1,236 @@
+import argparse
 import random
 
+from quantum_ai import AlphaBetaAI, ParallelAlphaBetaAI
+from quantum_engine import PLAYERS, QuantumEngine, board_geometry
+from quantum_mcts import MCTSAI
+from quantum_metrics import EngineMetrics, run_profiled
+from quantum_record import GameRecorder, RecordWriter
+from quantum_tablebase import Tablebase
+
+class PromptChooser:
+    # Collapse chooser that asks on stdin which box the last particle resolves to
+    def __call__(self, engine, box_a, box_b):
+        player = engine.state.owner_of(engine.state.moves[-1])
+        print("Choose how the collapse unfolds:")
+        print(f"1. {player}'s particle resolves to box {box_a}")
+        print(f"2. {player}'s particle resolves to box {box_b}")
+
+        while True:
+            try:
+                choice_input = input("Enter your choice (1 or 2): ")
+                choice = int(choice_input)
+                if choice == 1:
+                    return box_a
+                elif choice == 2:
+                    return box_b
+                else:
+                    print("Invalid choice. Please enter 1 or 2.")
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+
 class QuantumTicTacToe:
-    def __init__(self):
-        self.board = [None] * 9  # Represents the 9 squares on the board for classical particles (X, O)
-        self.entanglements = {}  # Stores entanglements: box_index -> [entangled_box1, entangled_box2, ...]
-        self.placed_particles = [] # Stores (player_lowercase, (box1, box2)) for each placed quantum particle
-        self.current_player = 'X' # Tracks the current player (X or O) for placing quantum particles
-        self.game_over = False
-        self.winner = None
+    def __init__(self, collapse_chooser=None, verbose=True, ai=None, ai_player=None, tablebase=None, geometry=None):
+        # Placement, loop detection, collapse and win check shared with the GUI. `geometry` picks
+        # a larger board (quantum_engine.board_geometry); the computer player needs the 3x3 one.
+        self.engine = QuantumEngine(geometry)
+        self.geometry = self.engine.geometry
+        # Picks the collapse outcome; any callable (engine, box_a, box_b) -> box, e.g. RandomChooser()
+        # from quantum_engine to run games without stdin
+        self.collapse_chooser = collapse_chooser or PromptChooser()
+        # Computer player: its moves and collapse choices come from `ai` (e.g. AlphaBetaAI) instead of stdin
+        self.ai = ai
+        self.ai_player = ai_player if ai is not None else None
+        self.tablebase = tablebase # Optional quantum_tablebase.Tablebase, to show who wins from here
+        if verbose:
+            # The console output is an engine subscriber; without it a game prints nothing
+            self.engine.events.subscribe(self)
+
+    # Read-only views of the position, in the shapes the rest of this class displays
+    @property
+    def state(self):
+        return self.engine.state # Bitboard position: classical marks, live particles and player to move
+
+    @property
+    def board(self):
+        return self.state.board_list() # The squares on the board for classical particles (X, O)
+
+    @property
+    def entanglements(self):
+        return self.state.entanglement_map() # box_index -> [entangled_box1, entangled_box2, ...]
+
+    @property
+    def placed_particles(self):
+        return self.state.particle_list() # (player_lowercase, (box1, box2)) for each placed quantum particle
+
+    @property
+    def current_player(self):
+        return self.state.current_player # The current player (X or O) for placing quantum particles
+
+    @property
+    def game_over(self):
+        return self.engine.game_over
+
+    @property
+    def winner(self):
+        return self.engine.winner
 
     def display_board(self):
+        board = self.board
+        placed_particles = self.placed_particles
+        entanglements = self.entanglements
         print("\nQuantum Tic-Tac-Toe Board:")
-        for i in range(9):
-            if self.board[i]:
+        size = self.geometry.size
+        for i in range(len(board)):
+            if board[i]:
                 # Display classical particles in uppercase
-                print(f"[{self.board[i].upper()}]", end="")
+                print(f"[{board[i].upper()}]", end="")
             else:
                 # Display entangled particles in lowercase
                 display_content = ""
-                for player_lc, entangled_boxes in self.placed_particles:
+                for player_lc, entangled_boxes in placed_particles:
                     if i in entangled_boxes:
                         display_content += player_lc.lower() # Use lowercase for entangled particles
                 if display_content:
                     print(f"[{display_content}]", end="")
                 else:
                     print(f"[{i}]", end="") # Show index if empty
-            if (i + 1) % 3 == 0:
+            if (i + 1) % size == 0:
                 print()
         print("\nEntanglements:")
-        if not self.entanglements:
+        if not entanglements:
             print("  No entanglements yet.")
-        for box in sorted(self.entanglements.keys()):
-            entangled_with_boxes = sorted(self.entanglements[box])
+        for box in sorted(entanglements.keys()):
+            entangled_with_boxes = sorted(entanglements[box])
             if entangled_with_boxes:
                 print(f"  Box {box} entangled with: {entangled_with_boxes}")
 
     def place_particle(self, box1, box2):
-        if not (0 <= box1 < 9 and 0 <= box2 < 9):
-            print("Invalid box numbers. Please choose between 0 and 8.")
-            return False
-        if box1 == box2:
-            print("Boxes must be different.")
-            return False
-
-        # Check if either box is already occupied by a classical particle
-        if self.board[box1] is not None:
-            print(f"Box {box1} is already occupied by a classical '{self.board[box1]}'. Cannot place an entangled particle here.")
-            return False
-        if self.board[box2] is not None:
-            print(f"Box {box2} is already occupied by a classical '{self.board[box2]}'. Cannot place an entangled particle here.")
-            return False
-
-        # Check if an entanglement already exists between these two specific boxes
-        for _, existing_boxes in self.placed_particles:
-            if tuple(sorted([box1, box2])) == existing_boxes:
-                print("That entanglement already exists.")
-                return False
-
-        # Store the current player's particle (e.g., 'x' or 'o') entangled between the two boxes
-        particle_boxes_tuple = tuple(sorted([box1, box2]))
-        self.placed_particles.append((self.current_player.lower(), particle_boxes_tuple))
-
-        # Add entanglements symmetrically
-        self.entanglements.setdefault(box1, []).append(box2)
-        self.entanglements.setdefault(box2, []).append(box1)
-
-        print(f"{self.current_player} placed a particle entangled between boxes {box1} and {box2}.")
-
-        if self.check_for_loop():
-            print("\n!!! An entanglement loop has formed! Waveform collapse initiated. !!!")
-            self.display_board()
-            self.collapse_waveform()
-        else:
-            self.switch_player()
-        return True
+        # Plays the whole move, including any collapse it triggers
+        return self.engine.place_particle(box1, box2, self.choose_collapse)
+
+    def choose_collapse(self, engine, box_a, box_b):
+        # The player who didn't close the loop decides; the computer's choice is announced
+        chooser = PLAYERS[engine.state.turn ^ 1]
+        if chooser == self.ai_player:
+            box = self.ai.choose_collapse(engine)
+            print(f"Computer ({chooser}) collapses the particle into box {box}.")
+            return box
+        return self.collapse_chooser(engine, box_a, box_b)
+
+    def play_ai_move(self):
+        box1, box2 = self.ai.choose_move(self.engine)
+        print(f"Computer ({self.current_player}) entangles boxes {box1} and {box2}.")
+        return self.place_particle(box1, box2)
 
     def check_for_loop(self):
-        visited = set()
-        recursion_stack = set()
-
-        for node in self.entanglements.keys():
-            if node not in visited:
-                if self._dfs_cycle_detect(node, -1, visited, recursion_stack):
-                    return True
-        return False
-
-    def _dfs_cycle_detect(self, current_node, parent, visited, recursion_stack):
-        visited.add(current_node)
-        recursion_stack.add(current_node)
-
-        for neighbor in self.entanglements.get(current_node, []):
-            if neighbor == parent:
-                continue
-
-            if neighbor in recursion_stack:
-                return True
+        return self.engine.loop is not None
 
-            if neighbor not in visited:
-                if self._dfs_cycle_detect(neighbor, current_node, visited, recursion_stack):
-                    return True
-
-        recursion_stack.remove(current_node)
-        return False
+    def describe_loop(self):
+        loop_boxes, loop_pairs = self.engine.loop
+        particles = ", ".join(f"{self.state.owner_of(p)} {self.geometry.pairs[p]}" for p in loop_pairs)
+        return f"Loop through boxes {' -> '.join(map(str, loop_boxes + loop_boxes[:1]))} (particles: {particles})"
 
     def collapse_waveform(self):
-        last_particle_info = self.placed_particles[-1]
-        last_particle_player_lowercase, last_particle_boxes = last_particle_info
-        box_a, box_b = last_particle_boxes
-
-        print(f"\nLast placed particle ({last_particle_player_lowercase.upper()} - the player who placed it): between {box_a} and {box_b}.")
+        # Resolves a pending collapse with the collapse chooser
+        box_a, box_b = self.geometry.pairs[self.state.moves[-1]]
+        return self.engine.resolve_collapse(self.choose_collapse(self.engine, box_a, box_b))
 
-        collapse_chooser = 'O' if self.current_player == 'X' else 'X'
-        print(f"Player {collapse_chooser} gets to choose how the collapse unfolds!")
+    def switch_player(self):
+        self.state.switch_player()
 
-        print("Choose how the collapse unfolds:")
-        print(f"1. {last_particle_player_lowercase.upper()}'s particle resolves to box {box_a}")
-        print(f"2. {last_particle_player_lowercase.upper()}'s particle resolves to box {box_b}")
+    def check_win(self):
+        return self.engine.check_win()
 
-        initial_resolved_box_choice = -1 # Sentinel value
-        while True:
-            try:
-                choice_input = input("Enter your choice (1 or 2): ")
-                choice = int(choice_input)
-                if choice == 1:
-                    initial_resolved_box_choice = box_a
-                    break
-                elif choice == 2:
-                    initial_resolved_box_choice = box_b
-                    break
-                else:
-                    print("Invalid choice. Please enter 1 or 2.")
-            except ValueError:
-                print("Invalid input. Please enter a number.")
+    # --- Engine event hooks: the console output ---
 
-        # --- Core Collapse Logic ---
-        # This will store the final classical positions after this collapse event.
-        # We'll use a temporary dictionary to manage resolutions *within this collapse*,
-        # then apply them to the main board.
-        current_collapse_resolutions = {} # particle_info -> final_classical_box_index
-
-        # The classical mark for the particle that triggered this collapse
-        classical_player_mark = self.current_player.upper()
-
-        # Step 1: Resolve the chosen particle
-        # Check if the chosen box is free. If not, try the other box. If both are occupied,
-        # the player's choice leads to a conflict for this particle.
-        resolved_last_particle_to_box = -1
-        if self.board[initial_resolved_box_choice] is None:
-            resolved_last_particle_to_box = initial_resolved_box_choice
-        else:
-            print(f"Warning: Chosen resolution box {initial_resolved_box_choice} for {classical_player_mark} is already occupied by '{self.board[initial_resolved_box_choice]}'.")
-            other_box = box_b if initial_resolved_box_choice == box_a else box_a
-            if self.board[other_box] is None:
-                print(f"Attempting to resolve {classical_player_mark}'s particle to its other box: {other_box}.")
-                resolved_last_particle_to_box = other_box
-            else:
-                print(f"Both chosen boxes for {classical_player_mark}'s particle ({box_a}, {box_b}) are occupied.")
-                print("This particle cannot resolve as chosen due to existing classical marks.")
-                # If the triggering particle can't resolve, this collapse choice is effectively invalid
-                # or leads to an incomplete collapse. For simplicity, we'll proceed without it resolving.
-                # A more complex rule might force the player to choose again or declare a draw.
-                pass # This particle will not be resolved in this collapse
-
-        if resolved_last_particle_to_box != -1:
-            current_collapse_resolutions[last_particle_info] = resolved_last_particle_to_box
-            # Start propagation from this resolved particle
-            propagation_queue = [(last_particle_info, resolved_last_particle_to_box)]
+    def on_invalid_move(self, reason, box1, box2):
+        if reason == 'range':
+            print(f"Invalid box numbers. Please choose between 0 and {self.geometry.box_count - 1}.")
+        elif reason == 'same_box':
+            print("Boxes must be different.")
+        elif reason == 'occupied':
+            # Either box may already be occupied by a classical particle
+            box = box1 if self.state.mark_at(box1) else box2
+            print(f"Box {box} is already occupied by a classical '{self.state.mark_at(box)}'. Cannot place an entangled particle here.")
         else:
-            propagation_queue = [] # No initial particle to propagate from if it couldn't resolve
-
-        # Step 2: Propagate the collapse
-        # We need a copy of placed_particles because it might change during iteration
-        particles_to_process = list(self.placed_particles)
-
-        while propagation_queue:
-            current_particle_info, current_resolved_box = propagation_queue.pop(0)
-            current_particle_player_lc, current_particle_boxes = current_particle_info
-
-            # Find all other particles that were entangled with current_resolved_box
-            # We iterate through all quantum particles to see if any are affected
-            for other_particle_info in particles_to_process:
-                # Skip if it's the same particle or already processed in this collapse
-                if other_particle_info == current_particle_info or other_particle_info in current_collapse_resolutions:
-                    continue
-
-                other_player_lc, other_boxes = other_particle_info
-
-                if current_resolved_box in other_boxes:
-                    # This `other_particle` is forced out of `current_resolved_box`
-                    # It must resolve to its *other* entangled box
-                    forced_to_box = other_boxes[0] if other_boxes[1] == current_resolved_box else other_boxes[1]
-
-                    # Only resolve if the target box is currently empty on the classical board
-                    if self.board[forced_to_box] is None:
-                        # Only resolve if not already resolved in *this* collapse event
-                        if other_particle_info not in current_collapse_resolutions:
-                            current_collapse_resolutions[other_particle_info] = forced_to_box
-                            propagation_queue.append((other_particle_info, forced_to_box))
-                    else:
-                        print(f"Conflict: Quantum particle {other_player_lc.upper()} from {other_boxes} cannot resolve to box {forced_to_box} because it's already occupied by '{self.board[forced_to_box]}'.")
-                        # This particle remains unresolved or might require a more complex rule.
-                        # For now, it simply won't get placed.
-
-        # Apply all resolutions from this collapse event to the main board
-        for particle_info, final_box in current_collapse_resolutions.items():
-            player_lc, _ = particle_info
-            # Ensure the box is still empty *before* placing, as conflicts might have occurred
-            # or another part of the propagation might have filled it.
-            if self.board[final_box] is None:
-                self.board[final_box] = player_lc.upper()
-            else:
-                # This should ideally not happen if propagation queue handles things correctly,
-                # but it's a safeguard for complex interactions.
-                print(f"Warning: Attempted to place {player_lc.upper()} in box {final_box}, but it was already occupied.")
-
-
-        # After resolving particles for this collapse, remove them from placed_particles
-        # We must iterate over a copy of the list or use a list comprehension
-        resolved_particle_infos = current_collapse_resolutions.keys()
-        self.placed_particles = [p for p in self.placed_particles if p not in resolved_particle_infos]
-
-        # Clear entanglements for all resolved particles.
-        # It's safer to rebuild `self.entanglements` only from remaining `self.placed_particles`.
-        new_entanglements = {}
-        for player_lc, (b1, b2) in self.placed_particles:
-            new_entanglements.setdefault(b1, []).append(b2)
-            new_entanglements.setdefault(b2, []).append(b1)
-        self.entanglements = new_entanglements
+            print("That entanglement already exists.")
 
+    def on_particle_placed(self, player, box1, box2):
+        print(f"{player} placed a particle entangled between boxes {box1} and {box2}.")
 
+    def on_loop_detected(self, loop_boxes, loop_pairs, chooser):
+        print("\n!!! An entanglement loop has formed! Waveform collapse initiated. !!!")
+        print(self.describe_loop())
         self.display_board()
-        self.check_win()
 
-        if not self.game_over:
-            self.switch_player()
+        last_particle = self.state.moves[-1]
+        box_a, box_b = self.geometry.pairs[last_particle]
+        print(f"\nLast placed particle ({self.state.owner_of(last_particle)} - the player who placed it): between {box_a} and {box_b}.")
+        print(f"Player {chooser} gets to choose how the collapse unfolds!")
+
+    def on_conflict(self, result, pair, box, player):
+        if pair != result.pair:
+            # A particle was forced out of a box but its other box already holds a classical mark.
+            # It remains unresolved for now.
+            print(f"Conflict: Quantum particle {player} from {self.geometry.pairs[pair]} cannot resolve to box {box} because it's already occupied by '{self.state.mark_at(box)}'.")
+        elif box == result.chosen_box:
+            print(f"Warning: Chosen resolution box {box} for {player} is already occupied by '{self.state.mark_at(box)}'.")
+            if result.resolved and result.resolved[0][0] == result.pair:
+                print(f"Attempting to resolve {player}'s particle to its other box: {result.resolved[0][1]}.")
+        else:
+            box_a, box_b = self.geometry.pairs[pair]
+            print(f"Both chosen boxes for {player}'s particle ({box_a}, {box_b}) are occupied.")
+            print("This particle cannot resolve as chosen due to existing classical marks.")
+
+    def on_collapse_resolved(self, result):
+        for _, box, player in result.lost:
+            # This should not happen in a loop collapse, but it's a safeguard for complex interactions.
+            print(f"Warning: Attempted to place {player} in box {box}, but it was already occupied.")
+        self.display_board()
 
-    def switch_player(self):
-        self.current_player = 'O' if self.current_player == 'X' else 'X'
+    def on_win(self, player):
+        print(f"\nPlayer {player} wins!")
 
-    def check_win(self):
-        winning_combinations = [
-            (0, 1, 2), (3, 4, 5), (6, 7, 8),  # Rows
-            (0, 3, 6), (1, 4, 7), (2, 5, 8),  # Columns
-            (0, 4, 8), (2, 4, 6)              # Diagonals
-        ]
-        for combo in winning_combinations:
-            s1, s2, s3 = combo
-            if self.board[s1] and self.board[s1] == self.board[s2] and self.board[s1] == self.board[s3]:
-                self.winner = self.board[s1]
-                self.game_over = True
-                print(f"\nPlayer {self.winner} wins!")
-                return
-        # A draw occurs if all *classical* squares are filled and no one has won.
-        if all(self.board[i] is not None for i in range(9)) and not self.game_over:
-            self.game_over = True
+    def on_draw(self, reason):
+        if reason == 'both':
+            print(f"\nIt's a draw! Both players achieved {self.in_a_row}.")
+        elif reason == 'no_moves':
+            print("\nIt's a draw! No more moves possible.")
+        else:
             print("\nIt's a draw!")
 
+    @property
+    def in_a_row(self):
+        # How the goal reads in messages: "three in a row" on the classic board
+        length = self.geometry.win_length
+        return f"{'three' if length == 3 else length} in a row"
+
     def play_game(self):
+        last_box = self.geometry.box_count - 1
         print("Welcome to Quantum Tic-Tac-Toe!")
-        print("Goal: Place your entangled particles so that, when the waveform collapses, you’re left with three in a row.")
-        print("To place a particle, mark a pair of boxes (0-8) to entangle them.")
+        print(f"Goal: Place your entangled particles so that, when the waveform collapses, you’re left with {self.in_a_row}.")
+        print(f"To place a particle, mark a pair of boxes (0-{last_box}) to entangle them.")
         print("When a loop forms, the waveform collapses. The player who didn't complete the loop chooses the collapse outcome.")
         print("Entangled particles are denoted by **lowercase 'x' or 'o'**, while classical (resolved) particles are denoted by **uppercase 'X' or 'O'**.")
-        print("\nBoxes are numbered 0 to 8:")
-        print("[0][1][2]")
-        print("[3][4][5]")
-        print("[6][7][8]")
+        print(f"\nBoxes are numbered 0 to {last_box}:")
+        size = self.geometry.size
+        for row in range(size):
+            print("".join(f"[{box}]" for box in range(row * size, row * size + size)))
 
         while not self.game_over:
             self.display_board()
             print(f"\nIt's Player {self.current_player}'s turn.")
+            if self.tablebase is not None:
+                outlook = self.tablebase.describe(self.engine)
+                if outlook:
+                    print(f"Tablebase: {outlook}.")
+            if self.current_player == self.ai_player:
+                self.play_ai_move()
+                continue
             try:
-                box1 = int(input("Enter first box number (0-8): "))
-                box2 = int(input("Enter second box number (0-8): "))
+                box1 = int(input(f"Enter first box number (0-{last_box}): "))
+                box2 = int(input(f"Enter second box number (0-{last_box}): "))
                 if not self.place_particle(box1, box2):
                     continue
             except ValueError:
@@ -280,5 +238,51 @@ class QuantumTicTacToe:
                 continue
 
 if __name__ == "__main__":
-    game = QuantumTicTacToe()
-    game.play_game()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Quantum Tic-Tac-Toe in the terminal.")
+    parser.add_argument("--ai", choices=PLAYERS, help="let the computer play X or O")
+    parser.add_argument("--ai-time", type=float, default=1.0, help="seconds the computer may think per decision (default 1.0)")
+    parser.add_argument("--ai-depth", type=int, default=20, help="deepest search in plies (default 20)")
+    parser.add_argument("--ai-engine", choices=("alphabeta", "mcts"), default="alphabeta",
+                        help="search the computer uses (default alphabeta)")
+    parser.add_argument("--ai-workers", type=int,
+                        help="extra search processes: alphabeta helpers sharing one table (default none), "
+                             "or mcts rollout workers (default one per CPU)")
+    parser.add_argument("--tablebase", help="endgame tablebase built by quantum_tablebase.py")
+    parser.add_argument("--record", help="append the finished game to this game record file")
+    parser.add_argument("--size", type=int, default=3, help="board width and height in boxes (default 3)")
+    parser.add_argument("--win", type=int, help="marks in a row that win (default: the board size)")
+    parser.add_argument("--profile", help="run the session under cProfile and write the pstats to this file")
+    parser.add_argument("--metrics", help="measure the engine's hot paths and write the metrics to this file "
+                                          "on exit (.prom or .txt: Prometheus text format, otherwise JSON)")
+    args = parser.parse_args()
+    try:
+        geometry = board_geometry(args.size, args.win)
+    except ValueError as e:
+        parser.error(str(e))
+    if geometry.box_count != 9 and (args.ai or args.tablebase or args.record):
+        parser.error("--ai, --tablebase and --record need the 3x3 board")
+
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    ai = None
+    if args.ai and args.ai_engine == "mcts":
+        ai = MCTSAI(time_limit=args.ai_time, workers=args.ai_workers)
+    elif args.ai and args.ai_workers:
+        ai = ParallelAlphaBetaAI(args.ai_workers, max_depth=args.ai_depth, time_limit=args.ai_time, tablebase=tablebase)
+    elif args.ai:
+        ai = AlphaBetaAI(max_depth=args.ai_depth, time_limit=args.ai_time, tablebase=tablebase)
+    game = QuantumTicTacToe(ai=ai, ai_player=args.ai, tablebase=tablebase, geometry=geometry)
+    if args.record:
+        GameRecorder(game.engine, RecordWriter(args.record))
+    metrics = EngineMetrics() if args.metrics else None
+    if metrics:
+        metrics.attach(game.engine)
+    try:
+        if args.profile:
+            run_profiled(args.profile, game.play_game)
+        else:
+            game.play_game()
+    finally:
+        if isinstance(ai, (MCTSAI, ParallelAlphaBetaAI)):
+            ai.close()
+        if metrics:
+            metrics.write(args.metrics)
\ No newline at end of file
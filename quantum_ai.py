@@ -0,0 +1,491 @@
+# Computer player: alpha-beta search with iterative deepening over the shared engine.
+#
+# The tree has two kinds of decision nodes:
+#   - placement nodes, where the player to move picks one of the open box pairs
+#   - collapse nodes, right after a placement closed a loop, where the *other* player picks
+#     which box the last particle resolves to
+# Collapses are ordinary decisions for that player (max over the two boxes), never averaged.
+# Scores are negamax style: always from the point of view of whoever decides at the node.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from quantum_engine import BOX_COUNT, PAIR_COUNT, PAIRS, PLAYERS, STANDARD, WIN_LINES, QuantumEngine, iter_bits, pair_index
+
+WIN_SCORE = 10000 # A won game; shortened by the ply it happens at so faster wins score higher
+MATE_BOUND = WIN_SCORE - 100 # Anything above this is a forced win
+
+# Transposition table bound types
+EXACT = 0
+LOWER = 1 # The value is at least this (a beta cutoff)
+UPPER = 2 # The value is at most this (no move raised alpha)
+
+# How much a line is worth by the number of classical marks in it, if the opponent has none
+LINE_WEIGHTS = (0, 10, 60)
+PARTICLE_WEIGHT = 2 # Per particle end sitting in an empty box of a line still open to its owner
+
+# Placement moves are tried in order of how many lines their boxes lie on (centre, corners, edges)
+_BOX_LINES = [sum(line >> box & 1 for line in WIN_LINES) for box in range(BOX_COUNT)]
+PAIR_ORDER = sorted(range(PAIR_COUNT), key=lambda p: -(_BOX_LINES[PAIRS[p][0]] + _BOX_LINES[PAIRS[p][1]]))
+
+
+class SearchTimeout(Exception):
+    # Raised inside the search when the time or node budget runs out
+    pass
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the low bits of the Zobrist hash, so memory stays bounded
+    # however long the AI plays. Each slot holds (key, depth, bound, value, move, generation).
+    # On a collision the new entry wins if the old one is from an earlier search, is for the same
+    # position, or was searched no deeper; otherwise the deeper, current result is kept.
+
+    def __init__(self, size_bits=16):
+        self.mask = (1 << size_bits) - 1
+        self.slots = [None] * (1 << size_bits)
+        self.generation = 0
+
+    def new_search(self):
+        # Entries from earlier searches stay usable but become the first to be evicted
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+
+    def lookup(self, key):
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        index = key & self.mask
+        old = self.slots[index]
+        if old is None or old[0] == key or old[5] != self.generation or old[1] <= depth:
+            self.slots[index] = (key, depth, bound, value, move, self.generation)
+
+
+class SharedTranspositionTable:
+    # The same table in a multiprocessing.shared_memory block, so every search process reads
+    # and fills one cache and memory doesn't grow with the number of workers.
+    #
+    # Word 0 of the block holds the search generation and word 1 the helpers' stop flag (see
+    # SharedStop); after them, each slot is two 64-bit words:
+    #   data:  value + 32768 | depth << 16 | bound << 24 | (move + 1) << 26 | generation << 34
+    #   check: key ^ data
+    # There are no locks. Writers store data then check; a reader accepts a slot only if
+    # check ^ data gives back its key, so a slot torn by two writers reads as a miss instead of
+    # as a wrong entry. Replacement is by depth, as in TranspositionTable.
+
+    def __init__(self, size_bits=18, name=None):
+        # Creates a new table, or attaches to an existing one by name
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=8 * (2 + 2 * (1 << size_bits)))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.words = self.memory.buf.cast('Q')
+        self.mask = (len(self.words) - 2) // 2 - 1
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def generation(self):
+        return self.words[0]
+
+    def new_search(self):
+        # Only the process that created the table ages it; helpers search inside its generation
+        if self.owner:
+            self.words[0] = (self.words[0] + 1) & 0xFF
+
+    def clear(self):
+        self.memory.buf[16:] = bytes(len(self.memory.buf) - 16)
+
+    def close(self):
+        # Detaches this process; the creator also frees the block
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def lookup(self, key):
+        words = self.words
+        index = 2 + 2 * (key & self.mask)
+        data = words[index]
+        if data and words[index + 1] ^ data == key:
+            return (key, data >> 16 & 0xFF, data >> 24 & 3, (data & 0xFFFF) - 32768, (data >> 26 & 0xFF) - 1, data >> 34)
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        words = self.words
+        index = 2 + 2 * (key & self.mask)
+        old = words[index]
+        generation = words[0]
+        if old and words[index + 1] ^ old != key and old >> 34 == generation and old >> 16 & 0xFF > depth:
+            return # A deeper result from this search, for another position, keeps the slot
+        data = value + 32768 | depth << 16 | bound << 24 | (move + 1) << 26 | generation << 34
+        words[index] = data
+        words[index + 1] = key ^ data
+
+
+class SharedStop:
+    # The stop flag in word 1 of a SharedTranspositionTable, with the is_set() of the
+    # threading.Event a search takes as `stop`, so one process can end searches in the others
+    def __init__(self, table):
+        self.words = table.words
+
+    def is_set(self):
+        return self.words[1] != 0
+
+    def set(self):
+        self.words[1] = 1
+
+    def clear(self):
+        self.words[1] = 0
+
+
+class AlphaBetaAI:
+    # choose_move / choose_collapse search a copy of the engine and return the decision for the
+    # player to act. The search stops at max_depth plies, after time_limit seconds or after
+    # node_limit nodes, whichever comes first; the last fully searched depth is used.
+    # With an endgame `tablebase` (quantum_tablebase.Tablebase) positions it covers are
+    # answered exactly, at the root and inside the search.
+
+    def __init__(self, max_depth=20, time_limit=1.0, node_limit=None, table_bits=16, tablebase=None, table=None):
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.table = table if table is not None else TranspositionTable(table_bits) # Or a SharedTranspositionTable
+        self.tablebase = tablebase
+        self.start_depth = 1 # Helper searches start deeper so they don't all repeat the same work
+        self._stop = None
+        # Stats of the last search
+        self.nodes = 0
+        self.depth = 0
+        self.value = 0
+
+    def choose_move(self, engine):
+        # Returns (box1, box2) for the player to move
+        return PAIRS[self.search(engine)]
+
+    def choose_collapse(self, engine):
+        # Returns the box the pending collapse should resolve the last particle to
+        return self.search(engine)
+
+    def __call__(self, engine, box_a, box_b):
+        # Lets the AI be passed straight in as a collapse chooser
+        return self.choose_collapse(engine)
+
+    def search(self, engine, progress=None, stop=None):
+        # Iterative deepening: each finished depth leaves its best moves in the table, which
+        # orders the next, deeper pass. Returns a pair index, or a box at a collapse node.
+        # progress(depth, move, value) is called as each depth finishes; setting the `stop`
+        # event (threading.Event) ends the search early with the best move found so far.
+        if engine.game_over:
+            raise ValueError("The game is over")
+        if engine.geometry is not STANDARD:
+            raise ValueError("The search plays the 3x3 board only")
+        move = self._tablebase_move(engine)
+        if move is not None:
+            return move
+
+        scratch = engine.copy()
+        moves = self._ordered_moves(scratch, -1)
+        best = moves[0]
+        if len(moves) == 1:
+            return best
+
+        self.table.new_search()
+        self.nodes = 0
+        self.depth = 0
+        self.value = 0
+        self._deadline = time.perf_counter() + self.time_limit if self.time_limit else None
+        self._stop = stop
+        for depth in range(self.start_depth, self.max_depth + 1):
+            try:
+                value = self._negamax(scratch, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0)
+            except SearchTimeout:
+                break
+            best = self._root_move
+            self.depth = depth
+            self.value = value
+            if progress is not None:
+                progress(depth, best, value)
+            if abs(value) > MATE_BOUND:
+                break # The result is decided; searching deeper won't change it
+        return best
+
+    def _tablebase_move(self, engine):
+        # The perfect decision if the tablebase covers the position, else None
+        if self.tablebase is None:
+            return None
+        if engine.loop is not None:
+            return self.tablebase.choose_collapse(engine)
+        found = self.tablebase.lookup(engine)
+        return pair_index(*found[1]) if found is not None else None
+
+    def _negamax(self, engine, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 1023:
+            self._check_budget()
+
+        state = engine.state
+        pending = engine.loop is not None
+        actor = state.turn ^ pending # At a collapse node the player who didn't close the loop decides
+        if engine.game_over:
+            return self._terminal(engine, actor, ply)
+        # A pending collapse is always searched, so the horizon never falls between a loop and its collapse
+        if depth <= 0 and not pending:
+            return self._evaluate(state, actor)
+        if self.tablebase is not None and not pending and ply:
+            found = self.tablebase.lookup(engine)
+            if found is not None:
+                value, _, plies = found
+                return value * (WIN_SCORE - ply - plies)
+
+        key = state.zobrist
+        tt_move = -1
+        entry = self.table.lookup(key)
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth and ply:
+                value = self._value_from_table(entry[3], ply)
+                bound = entry[2]
+                if bound == EXACT:
+                    return value
+                if bound == LOWER and value >= beta:
+                    return value
+                if bound == UPPER and value <= alpha:
+                    return value
+
+        alpha_start = alpha
+        best_value = -WIN_SCORE - 1
+        best_move = -1
+        for move in self._ordered_moves(engine, tt_move):
+            if pending:
+                engine.make_collapse(move)
+            else:
+                engine.make_move(*PAIRS[move])
+            # After a collapse the chooser moves next, so the same side decides again;
+            # every other step hands the decision to the opponent
+            if state.turn ^ (engine.loop is not None) == actor:
+                value = self._negamax(engine, depth - 1, alpha, beta, ply + 1)
+            else:
+                value = -self._negamax(engine, depth - 1, -beta, -alpha, ply + 1)
+            if pending:
+                engine.unmake_collapse()
+            else:
+                engine.unmake_move()
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if ply == 0:
+            self._root_move = best_move
+        if best_value <= alpha_start:
+            bound = UPPER
+        elif best_value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, bound, self._value_to_table(best_value, ply), best_move)
+        return best_value
+
+    def _ordered_moves(self, engine, tt_move):
+        # The table's best move first, then the static order
+        if engine.loop is not None:
+            moves = list(PAIRS[engine.state.moves[-1]])
+        else:
+            legal = engine.legal_moves()[0]
+            moves = [p for p in PAIR_ORDER if legal >> p & 1]
+        if tt_move != -1 and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def _check_budget(self):
+        if self._stop is not None and self._stop.is_set():
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    def _terminal(self, engine, actor, ply):
+        winner = engine.winner
+        if winner == PLAYERS[actor]:
+            return WIN_SCORE - ply
+        if winner == PLAYERS[actor ^ 1]:
+            return ply - WIN_SCORE
+        return 0 # Full board, no moves left, or both players completed a line
+
+    def _evaluate(self, state, actor):
+        # Static score for X: lines each player can still complete, weighted by the classical
+        # marks already in them and by the player's particles in their empty boxes
+        x_board = state.x_board
+        o_board = state.o_board
+        x_touch = o_touch = 0
+        for p in iter_bits(state.x_pairs):
+            box1, box2 = PAIRS[p]
+            x_touch |= 1 << box1 | 1 << box2
+        for p in iter_bits(state.o_pairs):
+            box1, box2 = PAIRS[p]
+            o_touch |= 1 << box1 | 1 << box2
+
+        score = 0
+        for line in WIN_LINES:
+            x_marks = x_board & line
+            o_marks = o_board & line
+            if not o_marks:
+                score += LINE_WEIGHTS[bin(x_marks).count('1')] + PARTICLE_WEIGHT * bin(x_touch & line & ~x_marks).count('1')
+            if not x_marks:
+                score -= LINE_WEIGHTS[bin(o_marks).count('1')] + PARTICLE_WEIGHT * bin(o_touch & line & ~o_marks).count('1')
+        return -score if actor else score
+
+    # Win scores depend on the ply they're found at, so the table stores them relative to the node
+    @staticmethod
+    def _value_to_table(value, ply):
+        if value > MATE_BOUND:
+            return value + ply
+        if value < -MATE_BOUND:
+            return value - ply
+        return value
+
+    @staticmethod
+    def _value_from_table(value, ply):
+        if value > MATE_BOUND:
+            return value - ply
+        if value < -MATE_BOUND:
+            return value + ply
+        return value
+
+
+# --- Multi-process search ---
+# Lazy SMP: helper processes run the same iterative deepening search as the main one, each
+# starting a little deeper, against one SharedTranspositionTable. Their results only reach the
+# main search through the table, where they cut and order its nodes; the move played is always
+# the main search's own.
+
+_helper_table = None
+
+
+def _attach_helper(table_name):
+    global _helper_table
+    _helper_table = SharedTranspositionTable(name=table_name)
+
+
+def _helper_search(state, pending, max_depth, time_limit, start_depth):
+    engine = QuantumEngine()
+    engine.load(state, pending)
+    helper = AlphaBetaAI(max_depth=max_depth, time_limit=time_limit, table=_helper_table)
+    helper.start_depth = start_depth
+    helper.search(engine, stop=SharedStop(_helper_table)) # Set when the main search returns
+    return helper.nodes
+
+
+class ParallelAlphaBetaAI(AlphaBetaAI):
+    # AlphaBetaAI plus `workers` helper processes sharing its transposition table.
+    # Call close() when done to stop the helpers and free the shared memory.
+
+    def __init__(self, workers=None, max_depth=20, time_limit=1.0, node_limit=None, table_bits=18, tablebase=None):
+        super().__init__(max_depth, time_limit, node_limit, tablebase=tablebase, table=SharedTranspositionTable(table_bits))
+        self.workers = os.cpu_count() if workers is None else workers
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_attach_helper, initargs=(self.table.name,))
+        self.helper_nodes = 0 # Nodes the helpers searched for the last decision
+        self.helper_stop = SharedStop(self.table)
+
+    def close(self):
+        self._pool.shutdown()
+        self.table.close()
+
+    def search(self, engine, progress=None, stop=None):
+        # The helpers stop as soon as the main search returns, whether at the deadline, early
+        # (a decided result, a single legal move) or because `stop` was set
+        if engine.game_over:
+            raise ValueError("The game is over")
+        if engine.geometry is not STANDARD:
+            raise ValueError("The search plays the 3x3 board only")
+        move = self._tablebase_move(engine)
+        if move is not None:
+            return move
+        state = engine.state.copy()
+        pending = engine.loop is not None
+        self.helper_stop.clear()
+        helpers = [self._pool.submit(_helper_search, state, pending, self.max_depth, self.time_limit, 2 + i % 2)
+                   for i in range(self.workers)]
+        try:
+            best = super().search(engine, progress, stop)
+        finally:
+            # Wait for the helpers to see the flag, so they don't run into the next search
+            self.helper_stop.set()
+            wait(helpers)
+        self.helper_nodes = sum(future.result() for future in helpers)
+        return best
+
+
+# --- Background search ---
+
+class SearchWorker:
+    # Runs an AI's searches on a background thread, so a GUI event loop never waits on one.
+    # start(engine) queues a search of a copy of the position and returns its request number.
+    # Results arrive on `results` as (request, kind, depth, move, value) tuples: kind 'progress'
+    # for each finished depth (the best move so far), then 'done' with the decision ('error'
+    # with the exception as the value if the search failed). cancel()
+    # stops the running search at its next budget check and drops its results, so a poller
+    # should ignore any request but the latest. `ai` is one with search(engine, progress, stop),
+    # like AlphaBetaAI; only the worker thread may use it.
+
+    def __init__(self, ai):
+        self.ai = ai
+        self.results = queue.Queue()
+        self.request = 0 # Number of the latest search
+        self._jobs = queue.Queue()
+        self._stop = None
+        self._thread = threading.Thread(target=self._run, name="SearchWorker", daemon=True)
+        self._thread.start()
+
+    def start(self, engine):
+        self.cancel()
+        self.request += 1
+        self._stop = threading.Event()
+        self._jobs.put((self.request, engine.copy(), self._stop))
+        return self.request
+
+    def cancel(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def close(self):
+        self.cancel()
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            request, engine, stop = job
+            if stop.is_set():
+                continue # Cancelled before it started
+            results = self.results
+            progress = lambda depth, move, value: results.put((request, 'progress', depth, move, value))
+            try:
+                move = self.ai.search(engine, progress, stop)
+            except Exception as error:
+                results.put((request, 'error', 0, None, error))
+                continue
+            if not stop.is_set():
+                results.put((request, 'done', self.ai.depth, move, self.ai.value))
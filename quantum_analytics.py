@@ -0,0 +1,212 @@
+# Statistics over game record files (see quantum_record.py), computed in parallel.
+#
+#   python quantum_analytics.py games.qtr [more.qtr ...] --out summary [--npz summary.npz]
+#
+# The files are streamed in chunks of raw game frames. Each chunk is replayed through the
+# engine by a worker process, which returns a Summary of just that chunk; the partial
+# summaries are merged as they come back. Only a few chunks are in flight at once, so memory
+# stays the same however large the logs are.
+#
+# Reported:
+#   - results by opening pair: games, X wins, O wins, draws for each first placement
+#   - collapse chain lengths: how many particles each collapse resolved
+#   - conflicts: collapses where a particle was forced into an occupied box
+#   - game lengths: placements per game, and collapses per game
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from quantum_engine import PAIR_COUNT, PAIRS, QuantumEngine
+from quantum_record import GameRecord, read_frames
+
+
+class Summary:
+    # Counts over a set of games. Histograms are dicts (value -> count), so two summaries
+    # merge by adding.
+
+    def __init__(self):
+        self.games = 0
+        self.results = {'X': 0, 'O': 0, 'draw': 0}
+        self.openings = [[0, 0, 0, 0] for _ in range(PAIR_COUNT)] # games, X wins, O wins, draws
+        self.chain_lengths = {}
+        self.conflicts = 0 # Conflicts over all collapses
+        self.collapses_with_conflicts = 0
+        self.game_lengths = {}
+        self.collapses_per_game = {}
+
+    def merge(self, other):
+        self.games += other.games
+        for result, count in other.results.items():
+            self.results[result] += count
+        for mine, theirs in zip(self.openings, other.openings):
+            for i in range(4):
+                mine[i] += theirs[i]
+        self.conflicts += other.conflicts
+        self.collapses_with_conflicts += other.collapses_with_conflicts
+        for name in ('chain_lengths', 'game_lengths', 'collapses_per_game'):
+            histogram = getattr(self, name)
+            for value, count in getattr(other, name).items():
+                histogram[value] = histogram.get(value, 0) + count
+        return self
+
+    # --- Output ---
+
+    def write_csv(self, prefix):
+        # One table per file: <prefix>-openings.csv, <prefix>-collapse-chains.csv, <prefix>-game-lengths.csv,
+        # <prefix>-collapses-per-game.csv and <prefix>-totals.csv (a single row of whole-run counts)
+        with open(f"{prefix}-openings.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['box1', 'box2', 'games', 'x_wins', 'o_wins', 'draws', 'x_win_rate'])
+            for pair, (games, x_wins, o_wins, draws) in enumerate(self.openings):
+                if games:
+                    writer.writerow([*PAIRS[pair], games, x_wins, o_wins, draws, f"{x_wins / games:.4f}"])
+        with open(f"{prefix}-collapse-chains.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['particles_resolved', 'collapses'])
+            for length in sorted(self.chain_lengths):
+                writer.writerow([length, self.chain_lengths[length]])
+        with open(f"{prefix}-game-lengths.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['placements', 'games'])
+            for length in sorted(self.game_lengths):
+                writer.writerow([length, self.game_lengths[length]])
+        with open(f"{prefix}-collapses-per-game.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['collapses', 'games'])
+            for collapses in sorted(self.collapses_per_game):
+                writer.writerow([collapses, self.collapses_per_game[collapses]])
+        with open(f"{prefix}-totals.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['games', 'x_wins', 'o_wins', 'draws', 'collapses', 'conflicts', 'collapses_with_conflicts'])
+            writer.writerow([self.games, self.results['X'], self.results['O'], self.results['draw'],
+                             sum(self.chain_lengths.values()), self.conflicts, self.collapses_with_conflicts])
+
+    def write_npz(self, path):
+        import numpy as np # Only needed for this output
+        def histogram(counts):
+            values = np.zeros(max(counts, default=0) + 1, dtype=np.int64)
+            for value, count in counts.items():
+                values[value] = count
+            return values
+        np.savez_compressed(
+            path,
+            opening_pairs=np.array(PAIRS, dtype=np.int8),
+            openings=np.array(self.openings, dtype=np.int64), # games, X wins, O wins, draws per pair
+            chain_lengths=histogram(self.chain_lengths),
+            game_lengths=histogram(self.game_lengths),
+            collapses_per_game=histogram(self.collapses_per_game),
+            totals=np.array([self.games, self.results['X'], self.results['O'], self.results['draw'],
+                             self.conflicts, self.collapses_with_conflicts], dtype=np.int64),
+        )
+
+    def report(self):
+        games = self.games or 1
+        collapses = sum(self.chain_lengths.values()) or 1
+        lines = [
+            f"Games: {self.games}",
+            f"X wins {self.results['X'] / games:.2%}, O wins {self.results['O'] / games:.2%}, "
+            f"draws {self.results['draw'] / games:.2%}",
+            f"Placements per game: {sum(k * v for k, v in self.game_lengths.items()) / games:.2f}",
+            f"Collapses per game: {sum(k * v for k, v in self.collapses_per_game.items()) / games:.2f}",
+            f"Particles per collapse: {sum(k * v for k, v in self.chain_lengths.items()) / collapses:.2f}",
+            f"Collapses with conflicts: {self.collapses_with_conflicts} ({self.conflicts} conflicts)",
+        ]
+        return "\n".join(lines)
+
+
+class _Collector:
+    # Engine subscriber gathering the per-collapse numbers of the game being replayed
+    def __init__(self, summary):
+        self.summary = summary
+        self.collapses = 0
+
+    def on_collapse_resolved(self, result):
+        summary = self.summary
+        length = len(result.resolved)
+        summary.chain_lengths[length] = summary.chain_lengths.get(length, 0) + 1
+        if result.conflicts:
+            summary.conflicts += len(result.conflicts)
+            summary.collapses_with_conflicts += 1
+        self.collapses += 1
+
+
+def analyze_chunk(payloads):
+    # Replays a list of game frames and returns their Summary. Runs in the worker processes.
+    summary = Summary()
+    engine = QuantumEngine()
+    collector = _Collector(summary)
+    engine.events.subscribe(collector)
+    for payload in payloads:
+        record = GameRecord.decode(payload)
+        collector.collapses = 0
+        record.replay(engine)
+        result = engine.winner if engine.winner in ('X', 'O') else 'draw'
+        summary.games += 1
+        summary.results[result] += 1
+        if record.pairs:
+            opening = summary.openings[record.pairs[0]]
+            opening[0] += 1
+            opening[('X', 'O', 'draw').index(result) + 1] += 1
+        length = len(record.pairs)
+        summary.game_lengths[length] = summary.game_lengths.get(length, 0) + 1
+        summary.collapses_per_game[collector.collapses] = summary.collapses_per_game.get(collector.collapses, 0) + 1
+    return summary
+
+
+def _chunks(paths, size):
+    chunk = []
+    for path in paths:
+        for payload in read_frames(path):
+            chunk.append(payload)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze(paths, workers=None, chunk_size=5000):
+    # Summary of every game in the files. workers=0 does the work in this process.
+    total = Summary()
+    if workers == 0:
+        for chunk in _chunks(paths, chunk_size):
+            total.merge(analyze_chunk(chunk))
+        return total
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = set()
+        for chunk in _chunks(paths, chunk_size):
+            if len(in_flight) >= workers * 2:
+                # Hold off reading until a worker frees up, so the backlog stays bounded
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+            in_flight.add(pool.submit(analyze_chunk, chunk))
+        for future in in_flight:
+            total.merge(future.result())
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statistics over Quantum Tic-Tac-Toe game record files.")
+    parser.add_argument("paths", nargs="+", help="game record files written with --record")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU, 0 for none)")
+    parser.add_argument("--chunk", type=int, default=5000, help="games per work unit (default 5000)")
+    parser.add_argument("--out", help="write <OUT>-openings.csv, <OUT>-collapse-chains.csv, <OUT>-game-lengths.csv, "
+                                        "<OUT>-collapses-per-game.csv and <OUT>-totals.csv")
+    parser.add_argument("--npz", help="also write every table to this NumPy .npz file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = analyze(args.paths, args.workers, args.chunk)
+    elapsed = time.perf_counter() - started
+    print(summary.report())
+    print(f"Analyzed in {elapsed:.1f}s ({summary.games / max(elapsed, 1e-9):.0f} games/s)")
+    if args.out:
+        summary.write_csv(args.out)
+    if args.npz:
+        summary.write_npz(args.npz)
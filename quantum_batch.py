@@ -0,0 +1,189 @@
+# Batch engine: many independent random games advanced in lockstep with NumPy, for Monte
+# Carlo statistics (first-player advantage, how often collapses happen, game lengths).
+#
+# Same rules as QuantumEngine, but every game is a row of a few arrays:
+#   - board (N, 9) int8: 1 for a classical X, -1 for a classical O, 0 for empty
+#   - pairs (N, 36) int8: 1 / -1 for a live X / O particle on that pair index (see PAIRS), else 0
+#   - labels (N, 9) int8: entanglement component of each box, named by its smallest box
+#   - turn (N,) int8: 0 when X is to move, 1 when O is to move
+#   - result (N,) int8: RUNNING, X_WINS, O_WINS or one of the DRAW_* codes
+# Each step() places one random legal particle in every running game and resolves the
+# collapses it triggers, all as whole-array operations.
+#
+#   python quantum_batch.py --games 1000000     (needs NumPy: pip install numpy)
+
+import argparse
+import time
+
+import numpy as np
+
+from quantum_engine import BOX_COUNT, PAIR_COUNT, PAIRS, WIN_LINES, iter_bits
+
+RUNNING = 0
+X_WINS = 1
+O_WINS = 2
+DRAW_BOTH = 3 # Both players completed a line in the same collapse
+DRAW_FULL = 4
+DRAW_NO_MOVES = 5
+
+PAIR_A = np.array([a for a, _ in PAIRS], dtype=np.intp)
+PAIR_B = np.array([b for _, b in PAIRS], dtype=np.intp)
+LINE_BOXES = np.array([list(iter_bits(line)) for line in WIN_LINES], dtype=np.intp) # (8, 3)
+
+
+class BatchEngine:
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        size = self.size
+        self.board = np.zeros((size, BOX_COUNT), dtype=np.int8)
+        self.pairs = np.zeros((size, PAIR_COUNT), dtype=np.int8)
+        self.labels = np.tile(np.arange(BOX_COUNT, dtype=np.int8), (size, 1))
+        self.turn = np.zeros(size, dtype=np.int8)
+        self.result = np.zeros(size, dtype=np.int8)
+        # Per-game counters for the statistics
+        self.placements = np.zeros(size, dtype=np.int16)
+        self.collapses = np.zeros(size, dtype=np.int16)
+
+    @property
+    def running(self):
+        return self.result == RUNNING
+
+    def legal_moves(self):
+        # (N, 36) bool: pairs that are free and have both boxes empty
+        empty = self.board == 0
+        return (self.pairs == 0) & empty[:, PAIR_A] & empty[:, PAIR_B]
+
+    def step(self):
+        # One random move in every running game; the collapse choice is random too.
+        # Returns how many games are still running.
+        legal = self.legal_moves()
+        running = self.running
+        # Players left without a move end the game in a draw
+        stuck = running & ~legal.any(axis=1)
+        self.result[stuck] = DRAW_NO_MOVES
+        games = np.flatnonzero(running & ~stuck)
+        if games.size:
+            # Uniform choice among the legal pairs: the largest random key wins
+            keys = np.where(legal[games], self.rng.random((games.size, PAIR_COUNT)), -1.0)
+            pairs = keys.argmax(axis=1)
+            first = self.rng.random(games.size) < 0.5
+            self.play(games, pairs, first)
+        return int(np.count_nonzero(self.running))
+
+    def play(self, games, pairs, first):
+        # Plays pairs[i] in games[i] for the player to move. Where it closes a loop the particle
+        # collapses into its lower box if first[i], else its higher box.
+        a = PAIR_A[pairs]
+        b = PAIR_B[pairs]
+        labels = self.labels[games]
+        label_a = labels[np.arange(games.size), a]
+        label_b = labels[np.arange(games.size), b]
+        loop = label_a == label_b # Both boxes already linked: this particle closes a loop
+
+        self.pairs[games, pairs] = np.where(self.turn[games] == 0, 1, -1)
+        self.placements[games] += 1
+
+        # Merge the components of games without a loop: relabel the larger name to the smaller
+        merge = ~loop
+        low = np.minimum(label_a, label_b)[merge, None]
+        high = np.maximum(label_a, label_b)[merge, None]
+        self.labels[games[merge]] = np.where(labels[merge] == high, low, labels[merge])
+
+        if loop.any():
+            self._collapse(games[loop], pairs[loop], np.where(first[loop], a[loop], b[loop]))
+            self._check_win(games[loop])
+
+        # Every placement passes the turn, collapse or not, unless the game just ended
+        ended = self.result[games] != RUNNING
+        self.turn[games[~ended]] ^= 1
+
+    def _collapse(self, games, pairs, chosen):
+        # Resolves the component of each closing particle. A box that becomes classical forces every
+        # other live particle on it into its other box, round after round. The live particles
+        # form a forest plus the closing one, so no box is ever claimed twice.
+        rows = np.arange(games.size)
+        board = self.board[games]
+        live = self.pairs[games]
+        claimed = np.zeros((games.size, BOX_COUNT), dtype=bool)
+
+        board[rows, chosen] = live[rows, pairs]
+        claimed[rows, chosen] = True
+        pending = live != 0
+        pending[rows, pairs] = False
+        while True:
+            touch_a = claimed[:, PAIR_A]
+            touch_b = claimed[:, PAIR_B]
+            forced = pending & (touch_a ^ touch_b)
+            if not forced.any():
+                break
+            game_index, pair_index = np.nonzero(forced)
+            target = np.where(touch_a[game_index, pair_index], PAIR_B[pair_index], PAIR_A[pair_index])
+            board[game_index, target] = live[game_index, pair_index]
+            claimed[game_index, target] = True
+            pending &= ~forced
+
+        # Resolved particles leave the live set; their boxes become their own components
+        live[(live != 0) & ~pending] = 0
+        labels = self.labels[games]
+        labels[claimed] = np.broadcast_to(np.arange(BOX_COUNT, dtype=np.int8), claimed.shape)[claimed]
+        self.board[games] = board
+        self.pairs[games] = live
+        self.labels[games] = labels
+        self.collapses[games] += 1
+
+    def _check_win(self, games):
+        lines = self.board[games][:, LINE_BOXES].sum(axis=2) # (games, 8) line totals
+        x_wins = (lines == 3).any(axis=1)
+        o_wins = (lines == -3).any(axis=1)
+        full = (self.board[games] != 0).all(axis=1)
+        result = np.select([x_wins & o_wins, x_wins, o_wins, full], [DRAW_BOTH, X_WINS, O_WINS, DRAW_FULL], RUNNING)
+        self.result[games] = result
+
+    def run(self):
+        # Plays every game to the end
+        while self.step():
+            pass
+        return self.result
+
+
+def simulate(games, batch_size=100000, seed=None):
+    # Plays `games` random games in batches and returns the totals per result, plus
+    # placements and collapses over all games
+    rng = np.random.default_rng(seed)
+    totals = {'games': 0, 'x_wins': 0, 'o_wins': 0, 'draw_both': 0, 'draw_full': 0, 'draw_no_moves': 0,
+              'placements': 0, 'collapses': 0}
+    while totals['games'] < games:
+        batch = BatchEngine(min(batch_size, games - totals['games']), rng.integers(1 << 63))
+        result = batch.run()
+        counts = np.bincount(result, minlength=DRAW_NO_MOVES + 1)
+        totals['games'] += batch.size
+        totals['x_wins'] += int(counts[X_WINS])
+        totals['o_wins'] += int(counts[O_WINS])
+        totals['draw_both'] += int(counts[DRAW_BOTH])
+        totals['draw_full'] += int(counts[DRAW_FULL])
+        totals['draw_no_moves'] += int(counts[DRAW_NO_MOVES])
+        totals['placements'] += int(batch.placements.sum())
+        totals['collapses'] += int(batch.collapses.sum())
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo statistics from random Quantum Tic-Tac-Toe games.")
+    parser.add_argument("--games", type=int, default=100000, help="number of games to play (default 100000)")
+    parser.add_argument("--batch", type=int, default=100000, help="games advanced together (default 100000)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    totals = simulate(args.games, args.batch, args.seed)
+    elapsed = time.perf_counter() - started
+    games = totals['games']
+    print(f"{games} games in {elapsed:.1f}s ({games / elapsed:.0f} games/s)")
+    print(f"X wins: {totals['x_wins'] / games:.2%}  O wins: {totals['o_wins'] / games:.2%}")
+    print(f"Draws: both lines {totals['draw_both'] / games:.2%}, full board {totals['draw_full'] / games:.2%}, "
+          f"no moves {totals['draw_no_moves'] / games:.2%}")
+    print(f"Placements per game: {totals['placements'] / games:.2f}  Collapses per game: {totals['collapses'] / games:.2f}")
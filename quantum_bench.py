@@ -0,0 +1,334 @@
+# Benchmarks for the engine's hot paths and the GUI redraw.
+#
+#   python quantum_bench.py --out bench.json                          run everything, save the results
+#   python quantum_bench.py --baseline bench.json --out new.json      ... and compare with earlier ones
+#
+# Microbenchmarks time one engine operation at a time over a fixed corpus of positions, built
+# from seeded random games plus long-chain positions (every box of a board strung on one chain,
+# so loop detection and collapse walk the whole board):
+#   place_particle   QuantumEngine.place_particle, loop detection included
+#   check_for_loop   the loop test a placement makes: union-find lookup, then the loop walk
+#   collapse         collapse propagation, as resolve_collapse / make_collapse_choice run it
+#   check_win        QuantumEngine.check_win after a collapse
+# Macrobenchmarks:
+#   random_games     whole random games through the public API
+#   redraw           BoardRenderer.render as update_board_display calls it after every move,
+#                    on a canvas stub, so no display is needed; redraw_full redraws from scratch
+#
+# A round repeats a benchmark's batch of work (e.g. one engine copy per corpus position),
+# timing only the work itself, with the garbage collector off, until it has timed long
+# enough to be reliable. Batches stay small so the positions stay in cache as in real play.
+# Of several rounds the fastest counts; its time per operation is the result. Against a baseline, a
+# benchmark slower by more than its threshold is a regression and the exit status is 1; a baseline
+# with another --seed or --quick setting is refused. Compare results from the same machine; on a
+# shared or virtual one, more --rounds or a looser --threshold keep noise out.
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+
+from quantum_engine import PAIRS, QuantumEngine, RandomChooser, board_geometry, find_loop, iter_bits
+from quantum_render import BoardRenderer
+
+VERSION = 1
+DEFAULT_THRESHOLD = 0.25 # A benchmark more than 25% slower than its baseline fails
+
+
+class Corpus:
+    # Engines at the positions the benchmarks start from. Each entry is (engine, argument):
+    #   placements: a legal move for the player to move
+    #   closing: a legal move that closes a loop
+    #   pending: a position whose collapse is waiting, with the box to collapse into
+    #   settled: a position right after a collapse, before the win check
+    def __init__(self, seed=2024, games=60):
+        self.placements = []
+        self.closing = []
+        self.pending = []
+        self.settled = []
+        rng = random.Random(seed)
+        engine = QuantumEngine()
+        for _ in range(games):
+            engine.reset()
+            while not engine.game_over:
+                legal, closing = engine.legal_moves()
+                pair = rng.choice(list(iter_bits(legal)))
+                self.placements.append((engine.copy(), PAIRS[pair]))
+                if closing >> pair & 1:
+                    self.closing.append((engine.copy(), PAIRS[pair]))
+                engine.place_particle(*PAIRS[pair])
+                if engine.loop is not None:
+                    box = rng.choice(PAIRS[engine.state.moves[-1]])
+                    self.pending.append((engine.copy(), box))
+                    engine.collapse(box)
+                    self.settled.append((engine.copy(), None))
+                    if not engine.check_win():
+                        engine.state.switch_player()
+
+    @staticmethod
+    def long_chain(size, win_length=None):
+        # (engine, closing move): one particle between each pair of neighbouring boxes of a
+        # snake through the whole board, and the move joining the snake's two ends
+        geometry = board_geometry(size, win_length)
+        snake = []
+        for row in range(size):
+            cols = range(size) if row % 2 == 0 else range(size - 1, -1, -1)
+            snake.extend(row * size + col for col in cols)
+        engine = QuantumEngine(geometry)
+        for box1, box2 in zip(snake, snake[1:]):
+            engine.place_particle(box1, box2)
+        return engine, (snake[0], snake[-1])
+
+
+class CanvasStub:
+    # Enough of tkinter.Canvas for BoardRenderer; counts the calls it makes
+    def __init__(self):
+        self.items = 0
+        self.ops = 0
+
+    def _create(self, *args, **kw):
+        self.items += 1
+        self.ops += 1
+        return self.items
+
+    create_rectangle = create_text = create_line = _create
+
+    def itemconfig(self, item, **kw):
+        self.ops += 1
+
+    def coords(self, item, *args):
+        self.ops += 1
+
+
+class RedrawStyle:
+    # The sizes and colors the GUI hands its renderer
+    cell_size = 100
+    padding = 2
+    cell_normal_bg = '#FFFFFF'
+    cell_selected_bg = '#FFFFCC'
+    box_number_fg = 'gray'
+    hover_overlay_color = '#E0E0E0'
+    player_colors = {'X': '#0000FF', 'O': '#FF0000'}
+    quantum_player_colors = {'x': '#87CEFA', 'o': '#FFA07A'}
+    arc_colors = {'X': '#4169E1', 'O': '#CD5C5C'}
+
+
+def time_round(setup, run, min_time):
+    # Runs batches until min_time of them has been timed: setup() untimed, run(batch) timed.
+    # run returns how many operations it did. Returns (seconds, ops).
+    elapsed = 0.0
+    ops = 0
+    gc_was_enabled = gc.isenabled()
+    try:
+        while elapsed < min_time:
+            batch = setup()
+            gc.disable()
+            started = time.perf_counter()
+            ops += run(batch)
+            elapsed += time.perf_counter() - started
+            if gc_was_enabled:
+                gc.enable()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return elapsed, ops
+
+
+def time_rounds(setup, run, rounds, min_time=0.1):
+    # Returns (seconds per op of the fastest of `rounds` rounds, ops in that round)
+    best = None
+    for _ in range(rounds):
+        elapsed, ops = time_round(setup, run, min_time)
+        if best is None or elapsed / ops < best[0]:
+            best = (elapsed / ops, ops)
+    return best
+
+
+# --- Microbenchmarks ---
+
+def copies(entries, times=1):
+    # Fresh engines for a batch, as the operations change them
+    return [(engine.copy(), argument) for _ in range(times) for engine, argument in entries]
+
+
+def run_place_particle(prepared):
+    for engine, (box1, box2) in prepared:
+        engine.place_particle(box1, box2)
+    return len(prepared)
+
+
+def run_check_for_loop(prepared):
+    for engine, (box1, box2) in prepared:
+        geometry = engine.geometry
+        if engine.components.connected(box1, box2):
+            find_loop(engine.state.live_pairs, geometry.pair_index[box1][box2], geometry)
+    return len(prepared)
+
+
+def run_collapse(prepared):
+    for engine, box in prepared:
+        engine.collapse(box)
+    return len(prepared)
+
+
+def run_check_win(prepared):
+    for engine, _ in prepared:
+        engine.check_win()
+    return len(prepared)
+
+
+def pending_long_chain(size, win_length=None):
+    engine, (box1, box2) = Corpus.long_chain(size, win_length)
+    engine.place_particle(box1, box2)
+    return [(engine, box1)]
+
+
+# --- Macrobenchmarks ---
+
+def run_random_games(games, seed=7):
+    rng = random.Random(seed)
+    chooser = RandomChooser(rng)
+    engine = QuantumEngine()
+    for _ in range(games):
+        engine.reset()
+        while not engine.game_over:
+            pair = rng.choice(list(iter_bits(engine.legal_moves()[0])))
+            engine.place_particle(*PAIRS[pair], chooser)
+    return games
+
+
+def redraw_frames(games, seed=11):
+    # The (board, particles, selected) of every redraw the GUI makes over some random games:
+    # after each box selected and after each move
+    rng = random.Random(seed)
+    chooser = RandomChooser(rng)
+    engine = QuantumEngine()
+    frames = []
+    for _ in range(games):
+        engine.reset()
+        frames.append((engine.state.board_list(), engine.state.particle_list(), []))
+        while not engine.game_over:
+            box1, box2 = PAIRS[rng.choice(list(iter_bits(engine.legal_moves()[0])))]
+            frames.append((engine.state.board_list(), engine.state.particle_list(), [box1]))
+            engine.place_particle(box1, box2, chooser)
+            frames.append((engine.state.board_list(), engine.state.particle_list(), []))
+    return frames
+
+
+def run_redraw(frames, full=False):
+    canvas = CanvasStub()
+    renderer = BoardRenderer(canvas, RedrawStyle)
+    for board, particles, selected in frames:
+        if full:
+            renderer.invalidate()
+        renderer.render(board, particles, selected)
+    return len(frames)
+
+
+def benchmarks(corpus):
+    # name -> (setup, run, threshold or None for the default); setup returns one batch of work
+    chain_9 = [Corpus.long_chain(3)]
+    chain_144 = [Corpus.long_chain(12, 5)]
+    pending_9 = pending_long_chain(3)
+    pending_144 = pending_long_chain(12, 5)
+    frames = redraw_frames(5)
+    return {
+        'place_particle': (lambda: copies(corpus.placements), run_place_particle, None),
+        'place_particle_chain_3x3': (lambda: copies(chain_9, 50), run_place_particle, None),
+        'place_particle_chain_12x12': (lambda: copies(chain_144, 5), run_place_particle, None),
+        'check_for_loop': (lambda: copies(corpus.closing), run_check_for_loop, None),
+        'check_for_loop_chain_12x12': (lambda: copies(chain_144, 5), run_check_for_loop, None),
+        'collapse': (lambda: copies(corpus.pending), run_collapse, None),
+        'collapse_chain_3x3': (lambda: copies(pending_9, 50), run_collapse, None),
+        'collapse_chain_12x12': (lambda: copies(pending_144, 5), run_collapse, None),
+        'check_win': (lambda: copies(corpus.settled), run_check_win, None),
+        'random_games': (lambda: 10, run_random_games, 0.3),
+        'redraw': (lambda: frames, run_redraw, 0.3),
+        'redraw_full': (lambda: frames, lambda batch: run_redraw(batch, full=True), 0.3),
+    }
+
+
+def run_all(names=None, rounds=5, seed=2024, quick=False):
+    corpus = Corpus(seed, games=15 if quick else 60)
+    min_time = 0.02 if quick else 0.1
+    results = {}
+    for name, (setup, run, threshold) in benchmarks(corpus).items():
+        if names and name not in names:
+            continue
+        per_op, ops = time_rounds(setup, run, rounds, min_time)
+        results[name] = {'us_per_op': per_op * 1e6, 'ops': ops, 'rounds': rounds,
+                         'threshold': DEFAULT_THRESHOLD if threshold is None else threshold}
+    return {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'quick': quick,
+        'benchmarks': results,
+    }
+
+
+def compare(results, baseline, threshold=None):
+    # Returns (rows, regressions): rows of (name, baseline us, new us, change, failed) for every
+    # benchmark in both, and the names that got slower than their threshold allows.
+    # Raises ValueError if the two runs timed different work (format version, corpus seed or
+    # --quick), since their times then say nothing about a regression.
+    differences = [f"{key} {baseline.get(key)!r} vs {results[key]!r}" for key in ('version', 'seed', 'quick')
+                   if baseline.get(key) != results[key]]
+    if differences:
+        raise ValueError(f"The baseline was made with different benchmark settings ({', '.join(differences)})")
+    rows = []
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            continue
+        limit = threshold if threshold is not None else result['threshold']
+        change = result['us_per_op'] / base['us_per_op'] - 1
+        failed = change > limit
+        rows.append((name, base['us_per_op'], result['us_per_op'], change, failed))
+        if failed:
+            regressions.append(name)
+    return rows, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the Quantum Tic-Tac-Toe engine and GUI redraw.")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved earlier with --out")
+    parser.add_argument("--threshold", type=float,
+                        help="allowed slowdown against the baseline for every benchmark, e.g. 0.1 for 10%% "
+                             "(default: each benchmark's own, 0.25 for most)")
+    parser.add_argument("--only", help="comma-separated benchmark names to run")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per benchmark; the fastest counts (default 5)")
+    parser.add_argument("--seed", type=int, default=2024, help="seed of the position corpus (default 2024)")
+    parser.add_argument("--quick", action="store_true", help="smaller corpus and fewer repetitions")
+    args = parser.parse_args()
+
+    results = run_all(args.only.split(",") if args.only else None, args.rounds, args.seed, args.quick)
+    for name, result in results['benchmarks'].items():
+        print(f"{name:28} {result['us_per_op']:12.2f} us/op  ({result['ops']} ops per round)")
+    if 'random_games' in results['benchmarks']:
+        print(f"Random games: {1e6 / results['benchmarks']['random_games']['us_per_op']:.0f} games/s")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            rows, regressions = compare(results, baseline, args.threshold)
+        except ValueError as e:
+            sys.exit(f"{args.baseline}: {e}")
+        for key in ('python', 'platform'):
+            if baseline.get(key) != results[key]:
+                print(f"Warning: the baseline ran on {key} {baseline.get(key)}, this run on {results[key]}")
+        print(f"\nAgainst {args.baseline}:")
+        for name, base, new, change, failed in rows:
+            print(f"{name:28} {base:12.2f} -> {new:10.2f} us/op  {change:+7.1%}{'  REGRESSION' if failed else ''}")
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmark(s) slower than allowed: {', '.join(regressions)}")
@@ -0,0 +1,1043 @@
+# Shared game state for the CLI (quantum-ttt.py) and GUI (quantum-ttt-gui.py) front ends.
+#
+# A position is held as a handful of integers so that search and simulation code can copy
+# it in a few assignments and use it as a dict key:
+#   - x_board / o_board: 9-bit masks of the classical X and O marks (bit i = box i)
+#   - x_pairs / o_pairs: 36-bit masks of the live quantum particles of each player,
+#     one bit per unordered box pair (see PAIRS below)
+#   - moves: the live particles as pair indices, in the order they were placed
+#   - turn: 0 when X is to move, 1 when O is to move
+#   - zobrist: a 64-bit hash of all of the above (except the order of moves), kept up to date
+#     by every mutation so search code can key tables on it
+
+import random
+from collections import deque
+
+PLAYERS = ('X', 'O')
+
+_ZOBRIST_SEED = 0x5EED_0F_0779
+_TABLE_BOXES = 16 # Boards up to this many boxes get full lookup tables indexed by box mask
+
+
+def iter_bits(mask):
+    # Yields the indices of the set bits of mask, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Geometry:
+    # A size x size board on which win_length classical marks in a row (across, down or
+    # diagonally) win. Holds the tables the engine works from:
+    #   - pairs: every unordered box pair; pair_index[box1][box2] is the reverse lookup
+    #   - box_pairs[box]: mask of every pair touching that box
+    #   - win_lines: mask of each winning line; box_lines[box]: indices of the lines through box
+    #   - blocked_pairs[mask]: every pair touching a box in mask (e.g. the classical boxes)
+    #     pairs_within[mask]: every pair with both boxes in mask (e.g. one entanglement component)
+    #     Small boards have these as tables; larger ones compute them from box_pairs on demand.
+    #   - Zobrist keys: one random 64-bit number per (player, box) classical mark, per (player, pair)
+    #     live particle, for O to move, and per pair for "this particle closed a loop that is still
+    #     pending". A fixed seed keeps hashes stable across runs so they can be stored.
+    # Use board_geometry() rather than the constructor, so every engine on a board shares one set.
+
+    def __init__(self, size=3, win_length=None):
+        self.size = size
+        self.win_length = win_length or size
+        if not 2 <= self.win_length <= size:
+            raise ValueError(f"A {size}x{size} board can't have {self.win_length} in a row")
+        box_count = self.box_count = size * size
+        self.pairs = [(a, b) for a in range(box_count) for b in range(a + 1, box_count)]
+        self.pair_count = len(self.pairs)
+        self.pair_index = [[-1] * box_count for _ in range(box_count)]
+        self.box_pairs = [0] * box_count
+        for index, (a, b) in enumerate(self.pairs):
+            self.pair_index[a][b] = self.pair_index[b][a] = index
+            self.box_pairs[a] |= 1 << index
+            self.box_pairs[b] |= 1 << index
+        self.full_board = (1 << box_count) - 1
+        self.all_pairs = (1 << self.pair_count) - 1
+
+        # Rows, then columns, then both diagonal directions
+        lines = []
+        length = self.win_length
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for r in range(size):
+                for c in range(size):
+                    end_r = r + dr * (length - 1)
+                    end_c = c + dc * (length - 1)
+                    if 0 <= end_r < size and 0 <= end_c < size:
+                        lines.append([(r + dr * i) * size + c + dc * i for i in range(length)])
+        self.win_lines = [sum(1 << box for box in line) for line in lines]
+        self.box_lines = [[] for _ in range(box_count)]
+        for index, line in enumerate(lines):
+            for box in line:
+                self.box_lines[box].append(index)
+
+        if box_count <= _TABLE_BOXES:
+            self.blocked_pairs = [0] * (1 << box_count)
+            self.pairs_within = [0] * (1 << box_count)
+            for mask in range(1, 1 << box_count):
+                low = (mask & -mask).bit_length() - 1
+                rest = mask & (mask - 1)
+                self.blocked_pairs[mask] = self.blocked_pairs[rest] | self.box_pairs[low]
+                self.pairs_within[mask] = self.pairs_within[rest] | (self.box_pairs[low] & self.blocked_pairs[rest])
+        else:
+            self.blocked_pairs = _PairsTouching(self.box_pairs)
+            self.pairs_within = _PairsWithin(self.box_pairs)
+
+        rng = random.Random(_ZOBRIST_SEED)
+        self.zobrist_mark = [[rng.getrandbits(64) for _ in range(box_count)] for _ in PLAYERS]
+        self.zobrist_pair = [[rng.getrandbits(64) for _ in range(self.pair_count)] for _ in PLAYERS]
+        self.zobrist_turn = rng.getrandbits(64)
+        self.zobrist_pending = [rng.getrandbits(64) for _ in range(self.pair_count)]
+
+    def __reduce__(self):
+        # Pickles as its dimensions, so positions sent to other processes don't carry the tables
+        return board_geometry, (self.size, self.win_length)
+
+    def __repr__(self):
+        return f"Geometry(size={self.size}, win_length={self.win_length})"
+
+
+class _PairsTouching:
+    # blocked_pairs of a large board: the union of box_pairs over the boxes of the mask
+    __slots__ = ('box_pairs',)
+
+    def __init__(self, box_pairs):
+        self.box_pairs = box_pairs
+
+    def __getitem__(self, mask):
+        box_pairs = self.box_pairs
+        pairs = 0
+        for box in iter_bits(mask):
+            pairs |= box_pairs[box]
+        return pairs
+
+
+class _PairsWithin:
+    # pairs_within of a large board. A pair with both boxes in the mask appears twice among the
+    # masks' box_pairs and one with a single box in it once, so the inside pairs are those in the
+    # union but not in the exclusive-or.
+    __slots__ = ('box_pairs',)
+
+    def __init__(self, box_pairs):
+        self.box_pairs = box_pairs
+
+    def __getitem__(self, mask):
+        box_pairs = self.box_pairs
+        touching = crossing = 0
+        for box in iter_bits(mask):
+            touching |= box_pairs[box]
+            crossing ^= box_pairs[box]
+        return touching & ~crossing
+
+
+_geometries = {}
+
+
+def board_geometry(size=3, win_length=None):
+    # The shared Geometry of a size x size, win_length in a row board
+    key = (size, win_length or size)
+    if key not in _geometries:
+        _geometries[key] = Geometry(size, win_length)
+    return _geometries[key]
+
+
+# The classic 3x3 board. The rest of this module's tables, and the search, tablebase, batch and
+# record modules built on them, are for this board only.
+STANDARD = board_geometry(3)
+
+BOX_COUNT = STANDARD.box_count
+
+# All 36 unordered box pairs, and the reverse lookup (box1, box2) -> pair index
+PAIRS = STANDARD.pairs
+PAIR_COUNT = STANDARD.pair_count
+PAIR_INDEX = STANDARD.pair_index
+
+# BOX_PAIRS[box] is the mask of every pair touching that box
+BOX_PAIRS = STANDARD.box_pairs
+
+FULL_BOARD = STANDARD.full_board
+ALL_PAIRS = STANDARD.all_pairs
+
+# Tables indexed by a 9-bit box mask:
+#   BLOCKED_PAIRS[mask]: every pair touching a box in mask (e.g. the classical boxes)
+#   PAIRS_WITHIN[mask]: every pair with both boxes in mask (e.g. one entanglement component)
+BLOCKED_PAIRS = STANDARD.blocked_pairs
+PAIRS_WITHIN = STANDARD.pairs_within
+
+# Masks of the three-in-a-row lines
+WIN_LINES = STANDARD.win_lines
+
+ZOBRIST_MARK = STANDARD.zobrist_mark
+ZOBRIST_PAIR = STANDARD.zobrist_pair
+ZOBRIST_TURN = STANDARD.zobrist_turn
+ZOBRIST_PENDING = STANDARD.zobrist_pending
+
+
+# The 8 symmetries of the 3x3 board (rotations and reflections), as box permutations:
+# SYMMETRIES[t][box] is where transform t sends box. Entry 0 is the identity.
+SYMMETRIES = [tuple(r * 3 + c for r, c in (transform(box // 3, box % 3) for box in range(BOX_COUNT))) for transform in (
+    lambda r, c: (r, c),          # Identity
+    lambda r, c: (c, 2 - r),      # Rotate 90 degrees clockwise
+    lambda r, c: (2 - r, 2 - c),  # Rotate 180 degrees
+    lambda r, c: (2 - c, r),      # Rotate 270 degrees clockwise
+    lambda r, c: (r, 2 - c),      # Mirror left-right
+    lambda r, c: (2 - r, c),      # Mirror top-bottom
+    lambda r, c: (c, r),          # Mirror on the main diagonal
+    lambda r, c: (2 - c, 2 - r),  # Mirror on the anti-diagonal
+)]
+# INVERSE_SYMMETRY[t] undoes transform t
+INVERSE_SYMMETRY = [next(u for u, other in enumerate(SYMMETRIES) if all(other[perm[box]] == box for box in range(BOX_COUNT)))
+                    for perm in SYMMETRIES]
+# PAIR_SYMMETRIES[t][pair] is where transform t sends a pair index
+PAIR_SYMMETRIES = [tuple(PAIR_INDEX[perm[a]][perm[b]] for a, b in PAIRS) for perm in SYMMETRIES]
+
+# Masks are mapped through a transform with table lookups rather than bit by bit:
+# _BOARD_IMAGE[t] maps a whole 9-bit board, _PAIR_IMAGE[t][k] maps byte k of a 36-bit pair mask
+_BOARD_IMAGE = [[0] * (1 << BOX_COUNT) for _ in SYMMETRIES]
+_PAIR_IMAGE = [[[0] * 256 for _ in range(5)] for _ in SYMMETRIES]
+for _t, _perm in enumerate(SYMMETRIES):
+    for _mask in range(1, 1 << BOX_COUNT):
+        _low = (_mask & -_mask).bit_length() - 1
+        _BOARD_IMAGE[_t][_mask] = _BOARD_IMAGE[_t][_mask & (_mask - 1)] | 1 << _perm[_low]
+    for _k in range(5):
+        for _byte in range(1, 256):
+            _low = (_byte & -_byte).bit_length() - 1
+            _image = _PAIR_IMAGE[_t][_k][_byte & (_byte - 1)]
+            if _k * 8 + _low < PAIR_COUNT:
+                _image |= 1 << PAIR_SYMMETRIES[_t][_k * 8 + _low]
+            _PAIR_IMAGE[_t][_k][_byte] = _image
+
+
+def transform_board(t, mask):
+    return _BOARD_IMAGE[t][mask]
+
+
+def transform_pairs(t, mask):
+    table = _PAIR_IMAGE[t]
+    return (table[0][mask & 255] | table[1][mask >> 8 & 255] | table[2][mask >> 16 & 255]
+            | table[3][mask >> 24 & 255] | table[4][mask >> 32])
+
+
+def canonicalize(state):
+    # Maps a position to the representative of its symmetry class: the smallest
+    # (x_board, o_board, x_pairs, o_pairs) over the 8 transforms, plus the turn. Returns
+    # (key, t) where t is the transform that produced it; moves found for the canonical
+    # position map back with INVERSE_SYMMETRY[t].
+    x_board = state.x_board
+    o_board = state.o_board
+    x_pairs = state.x_pairs
+    o_pairs = state.o_pairs
+    best = (x_board, o_board, x_pairs, o_pairs)
+    best_t = 0
+    for t in range(1, 8):
+        boards = _BOARD_IMAGE[t]
+        candidate = (boards[x_board], boards[o_board])
+        if candidate > best[:2]:
+            continue # The boards alone already lose; skip mapping the pair masks
+        candidate += (transform_pairs(t, x_pairs), transform_pairs(t, o_pairs))
+        if candidate < best:
+            best = candidate
+            best_t = t
+    return best + (state.turn,), best_t
+
+
+def pair_index(box1, box2):
+    return PAIR_INDEX[box1][box2]
+
+
+class GameState:
+    __slots__ = ('x_board', 'o_board', 'x_pairs', 'o_pairs', 'moves', 'turn', 'zobrist', 'geometry')
+
+    def __init__(self, geometry=None):
+        self.geometry = geometry or STANDARD
+        self.x_board = 0
+        self.o_board = 0
+        self.x_pairs = 0
+        self.o_pairs = 0
+        self.moves = ()  # Tuples are immutable, so copies can share them
+        self.turn = 0
+        self.zobrist = 0
+
+    def copy(self):
+        other = GameState.__new__(GameState)
+        other.x_board = self.x_board
+        other.o_board = self.o_board
+        other.x_pairs = self.x_pairs
+        other.o_pairs = self.o_pairs
+        other.moves = self.moves
+        other.turn = self.turn
+        other.zobrist = self.zobrist
+        other.geometry = self.geometry
+        return other
+
+    def rehash(self):
+        # Recomputes zobrist from scratch, for positions built field by field (no pending collapse)
+        geometry = self.geometry
+        zobrist = geometry.zobrist_turn if self.turn else 0
+        for box in iter_bits(self.x_board):
+            zobrist ^= geometry.zobrist_mark[0][box]
+        for box in iter_bits(self.o_board):
+            zobrist ^= geometry.zobrist_mark[1][box]
+        for p in iter_bits(self.x_pairs):
+            zobrist ^= geometry.zobrist_pair[0][p]
+        for p in iter_bits(self.o_pairs):
+            zobrist ^= geometry.zobrist_pair[1][p]
+        self.zobrist = zobrist
+
+    def key(self):
+        # The placement order of the live particles does not change the game, so it is left out.
+        # Positions are only compared on the same board, so neither is the geometry.
+        return (self.x_board, self.o_board, self.x_pairs, self.o_pairs, self.turn)
+
+    def __eq__(self, other):
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"GameState(board={self.board_list()}, particles={self.particle_list()}, turn={PLAYERS[self.turn]!r})"
+
+    # --- Queries ---
+
+    @property
+    def classical(self):
+        return self.x_board | self.o_board
+
+    @property
+    def live_pairs(self):
+        return self.x_pairs | self.o_pairs
+
+    @property
+    def current_player(self):
+        return PLAYERS[self.turn]
+
+    def mark_at(self, box):
+        bit = 1 << box
+        if self.x_board & bit:
+            return 'X'
+        if self.o_board & bit:
+            return 'O'
+        return None
+
+    def owner_of(self, pair):
+        return 'X' if self.x_pairs >> pair & 1 else 'O'
+
+    # --- Mutations ---
+
+    def add_particle(self, pair):
+        if self.turn == 0:
+            self.x_pairs |= 1 << pair
+        else:
+            self.o_pairs |= 1 << pair
+        self.zobrist ^= self.geometry.zobrist_pair[self.turn][pair]
+        self.moves += (pair,)
+
+    def remove_particles(self, pairs_mask):
+        zobrist_pair = self.geometry.zobrist_pair
+        for p in iter_bits(self.x_pairs & pairs_mask):
+            self.zobrist ^= zobrist_pair[0][p]
+        for p in iter_bits(self.o_pairs & pairs_mask):
+            self.zobrist ^= zobrist_pair[1][p]
+        self.x_pairs &= ~pairs_mask
+        self.o_pairs &= ~pairs_mask
+        self.moves = tuple(p for p in self.moves if not pairs_mask >> p & 1)
+
+    def set_classical(self, box, player):
+        if player == 'X':
+            self.x_board |= 1 << box
+            self.zobrist ^= self.geometry.zobrist_mark[0][box]
+        else:
+            self.o_board |= 1 << box
+            self.zobrist ^= self.geometry.zobrist_mark[1][box]
+
+    def switch_player(self):
+        self.turn ^= 1
+        self.zobrist ^= self.geometry.zobrist_turn
+
+    # --- Views in the list/dict shapes the front ends display ---
+
+    def board_list(self):
+        return [self.mark_at(i) for i in range(self.geometry.box_count)]
+
+    def particle_list(self):
+        # (player_lowercase, (box1, box2)) for each live quantum particle, in placement order
+        pairs = self.geometry.pairs
+        return [(self.owner_of(p).lower(), pairs[p]) for p in self.moves]
+
+    def entanglement_map(self):
+        # box_index -> [entangled_box1, entangled_box2, ...]
+        entanglements = {}
+        pairs = self.geometry.pairs
+        for p in self.moves:
+            b1, b2 = pairs[p]
+            entanglements.setdefault(b1, []).append(b2)
+            entanglements.setdefault(b2, []).append(b1)
+        return entanglements
+
+
+class DisjointSet:
+    # Union-find over the boxes, linking the two boxes of every live particle.
+    # A new particle closes an entanglement loop exactly when its boxes are already linked.
+    # While `trail` is a list, every write is journaled as (box, old parent, old rank) so that
+    # rollback() can undo it; QuantumEngine turns this on for make/unmake.
+    __slots__ = ('parent', 'rank', 'trail', 'geometry')
+
+    def __init__(self, geometry=None):
+        self.geometry = geometry or STANDARD
+        self.parent = list(range(self.geometry.box_count))
+        self.rank = [0] * self.geometry.box_count
+        self.trail = None
+
+    def copy(self):
+        other = DisjointSet.__new__(DisjointSet)
+        other.parent = self.parent[:]
+        other.rank = self.rank[:]
+        other.trail = None
+        other.geometry = self.geometry
+        return other
+
+    def find(self, box):
+        parent = self.parent
+        root = box
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression: point every box on the way straight at the root
+        trail = self.trail
+        while parent[box] != root:
+            if trail is not None:
+                trail.append((box, parent[box], self.rank[box]))
+            parent[box], box = root, parent[box]
+        return root
+
+    def connected(self, box1, box2):
+        return self.find(box1) == self.find(box2)
+
+    def union(self, box1, box2):
+        root1 = self.find(box1)
+        root2 = self.find(box2)
+        if root1 == root2:
+            return False
+        # Union by rank: hang the shallower tree under the deeper one
+        rank = self.rank
+        if rank[root1] < rank[root2]:
+            root1, root2 = root2, root1
+        if self.trail is not None:
+            self.trail.append((root2, root2, rank[root2]))
+            self.trail.append((root1, root1, rank[root1]))
+        self.parent[root2] = root1
+        if rank[root1] == rank[root2]:
+            rank[root1] += 1
+        return True
+
+    def rebuild(self, live_pairs):
+        # Links can't be cut, so after a collapse removes particles the sets are rebuilt from the survivors
+        self.rebuild_component(range(len(self.parent)), live_pairs)
+
+    def rebuild_component(self, boxes, live_pairs):
+        # Same as rebuild, limited to the boxes of one component. No box outside the
+        # component points into it, so the rest of the sets stay valid.
+        parent = self.parent
+        rank = self.rank
+        trail = self.trail
+        box_pairs = self.geometry.box_pairs
+        pairs = self.geometry.pairs
+        for box in boxes:
+            if trail is not None:
+                trail.append((box, parent[box], rank[box]))
+            parent[box] = box
+            rank[box] = 0
+        for box in boxes:
+            for p in iter_bits(live_pairs & box_pairs[box]):
+                self.union(*pairs[p])
+
+    def rollback(self, mark):
+        # Undoes every journaled write made after len(trail) was `mark`
+        trail = self.trail
+        parent = self.parent
+        rank = self.rank
+        while len(trail) > mark:
+            box, old_parent, old_rank = trail.pop()
+            parent[box] = old_parent
+            rank[box] = old_rank
+
+
+def component_of(live_pairs, box, geometry=STANDARD):
+    # All boxes linked to `box` through live particles, including box itself
+    box_pairs = geometry.box_pairs
+    pairs = geometry.pairs
+    seen = 1 << box
+    boxes = [box]
+    for current in boxes:
+        for p in iter_bits(live_pairs & box_pairs[current]):
+            b1, b2 = pairs[p]
+            other = b2 if b1 == current else b1
+            if not seen >> other & 1:
+                seen |= 1 << other
+                boxes.append(other)
+    return boxes
+
+
+def find_loop(live_pairs, pair, geometry=STANDARD):
+    # Returns the boxes and particles (pair indices) of the loop that `pair` closes, walking
+    # the existing entanglements from one of its boxes to the other. `pair` must not be live yet.
+    box_pairs = geometry.box_pairs
+    pairs = geometry.pairs
+    start, goal = pairs[pair]
+    came_from = {start: None}  # box -> (previous box, pair used to reach it)
+    frontier = [start]
+    while frontier and goal not in came_from:
+        next_frontier = []
+        for box in frontier:
+            for p in iter_bits(live_pairs & box_pairs[box]):
+                b1, b2 = pairs[p]
+                other = b2 if b1 == box else b1
+                if other not in came_from:
+                    came_from[other] = (box, p)
+                    next_frontier.append(other)
+        frontier = next_frontier
+    if goal not in came_from:
+        return None
+    loop_boxes = [goal]
+    loop_pairs = [pair]
+    box = goal
+    while came_from[box] is not None:
+        box, p = came_from[box]
+        loop_boxes.append(box)
+        loop_pairs.append(p)
+    return loop_boxes, loop_pairs
+
+
+class CollapseResult:
+    # Outcome of one waveform collapse:
+    #   - pair / chosen_box: the particle that closed the loop and the box chosen for it
+    #   - resolved: (pair, box, player) for every particle that became classical, in resolution order
+    #   - conflicts: (pair, box, player) each time a particle was forced into a box that already
+    #     held a classical mark; such particles stay quantum
+    #   - lost: (pair, box, player) for resolved particles whose box was taken by an earlier
+    #     resolution of the same collapse; they are removed without leaving a mark
+    __slots__ = ('pair', 'chosen_box', 'resolved', 'conflicts', 'lost', 'pairs')
+
+    def __init__(self, pair, chosen_box, pairs=PAIRS):
+        self.pairs = pairs # The board's pair list, to show pair indices as boxes
+        self.pair = pair
+        self.chosen_box = chosen_box
+        self.resolved = []
+        self.conflicts = []
+        self.lost = []
+
+    @property
+    def resolved_mask(self):
+        mask = 0
+        for p, _, _ in self.resolved:
+            mask |= 1 << p
+        return mask
+
+    def __repr__(self):
+        pairs = self.pairs
+        return (f"CollapseResult(pair={pairs[self.pair]}, chosen_box={self.chosen_box}, "
+                f"resolved={[(pairs[p], box, player) for p, box, player in self.resolved]}, "
+                f"conflicts={[(pairs[p], box, player) for p, box, player in self.conflicts]}, "
+                f"lost={[(pairs[p], box, player) for p, box, player in self.lost]})")
+
+
+class CollapsePreview:
+    # What resolving the pending collapse into chosen_box leads to, worked out on a scratch copy:
+    #   - result: the CollapseResult (resolved particles, conflicts, lost marks)
+    #   - state: the position right after the collapse, before the turn passes
+    #   - marked: mask of the boxes the collapse turns classical
+    #   - outcome: the ('win', player) or ('draw', reason) event the collapse ends the game with, or None
+    # components, line_counts and lines_won are the scratch engine's, for resolve_collapse to adopt.
+    __slots__ = ('chosen_box', 'result', 'state', 'marked', 'outcome', 'components', 'line_counts', 'lines_won')
+
+    def __init__(self, engine, chosen_box):
+        scratch = engine.copy()
+        self.chosen_box = chosen_box
+        self.result = scratch.collapse(chosen_box)
+        self.outcome = scratch._settle()
+        self.state = scratch.state
+        self.marked = (self.state.x_board | self.state.o_board) ^ (engine.state.x_board | engine.state.o_board)
+        self.components = scratch.components
+        self.line_counts = scratch.line_counts
+        self.lines_won = scratch.lines_won
+
+    @property
+    def winner(self):
+        # 'X', 'O', 'Both' or None, as engine.winner would be
+        if self.outcome is None:
+            return None
+        kind, detail = self.outcome
+        if kind == 'win':
+            return detail
+        return 'Both' if detail == 'both' else None
+
+    def board_list(self):
+        return self.state.board_list()
+
+    def particle_list(self):
+        return self.state.particle_list()
+
+
+class EventBus:
+    # Delivers engine events to subscribers. A subscriber is any object defining some of these hooks:
+    #   on_reset()                                a new game started
+    #   on_invalid_move(reason, box1, box2)       reason: 'range', 'same_box', 'occupied' or 'duplicate'
+    #   on_particle_placed(player, box1, box2)
+    #   on_loop_detected(loop_boxes, loop_pairs, chooser)  chooser: the player who picks the collapse
+    #   on_conflict(result, pair, box, player)     see CollapseResult.conflicts
+    #   on_collapse_resolved(result)
+    #   on_turn_changed(player)                    player: who moves next
+    #   on_win(player)
+    #   on_draw(reason)                            reason: 'both' (two lines at once), 'full' or
+    #                                              'no_moves' (no pair of boxes left to entangle)
+    # The engine only builds and emits an event when `active` is set, so with no subscribers
+    # a headless game pays no formatting or I/O cost.
+    EVENTS = ('reset', 'invalid_move', 'particle_placed', 'loop_detected', 'conflict', 'collapse_resolved', 'turn_changed', 'win', 'draw')
+
+    def __init__(self):
+        self.handlers = {}  # event name -> bound hooks
+        self.active = False
+
+    def subscribe(self, subscriber):
+        for event in self.EVENTS:
+            hook = getattr(subscriber, 'on_' + event, None)
+            if hook is not None:
+                self.handlers.setdefault(event, []).append(hook)
+        self.active = bool(self.handlers)
+
+    def unsubscribe(self, subscriber):
+        for event in list(self.handlers):
+            hooks = [hook for hook in self.handlers[event] if hook.__self__ is not subscriber]
+            if hooks:
+                self.handlers[event] = hooks
+            else:
+                del self.handlers[event]
+        self.active = bool(self.handlers)
+
+    def emit(self, event, *args):
+        for hook in self.handlers.get(event, ()):
+            hook(*args)
+
+
+# Tags for the undo stack entries
+_MOVE = 'move'
+_COLLAPSE = 'collapse'
+
+
+class QuantumEngine:
+    # The game rules shared by both front ends: particle placement, loop detection, collapse and
+    # the win check. Front ends learn what happened by subscribing to `events`.
+    # `geometry` sets the board (see board_geometry()); the default is the classic 3x3.
+    #
+    # Wins are tracked incrementally: line_counts[player][line] is how many of the line's boxes
+    # hold that player's classical mark and lines_won[player] how many lines are complete. Only a
+    # collapse places marks, and it updates the lines through the boxes it marked, so the win
+    # check never rescans the board.
+
+    def __init__(self, geometry=None):
+        self.geometry = geometry or STANDARD
+        self.events = EventBus()
+        self.reset()
+
+    def reset(self):
+        geometry = self.geometry
+        self.undo_stack = [] # Deltas pushed by make_move / make_collapse
+        self.state = GameState(geometry)
+        self.components = DisjointSet(geometry) # Which boxes are linked by entanglements, for loop detection
+        self.line_counts = [[0] * len(geometry.win_lines) for _ in PLAYERS]
+        self.lines_won = [0, 0]
+        self.previews = None # (position, previews) cached by preview_collapse()
+        self.loop = None # (boxes, pair indices) of the loop closed by the last placement, if any
+        self.game_over = False
+        self.winner = None # 'X', 'O', 'Both' when both complete a line at once, or None
+        if self.events.active:
+            self.events.emit('reset')
+
+    def load(self, state, pending=False):
+        # Starts from a position read from a table, a file or another process. With pending, the
+        # last particle in state.moves has just closed a loop and its collapse is still to be
+        # chosen. state.zobrist is taken as is.
+        geometry = self.geometry = state.geometry
+        self.undo_stack = []
+        self.state = state.copy()
+        self.components = DisjointSet(geometry)
+        self.components.rebuild(state.x_pairs | state.o_pairs)
+        self.line_counts = [[0] * len(geometry.win_lines) for _ in PLAYERS]
+        self.lines_won = [0, 0]
+        for owner, board in enumerate((state.x_board, state.o_board)):
+            counts = self.line_counts[owner]
+            for box in iter_bits(board):
+                for line in geometry.box_lines[box]:
+                    counts[line] += 1
+                    if counts[line] == geometry.win_length:
+                        self.lines_won[owner] += 1
+        self.previews = None
+        self.loop = None
+        self.game_over = False
+        self.winner = None
+        if pending:
+            pair = state.moves[-1]
+            self.loop = find_loop((state.x_pairs | state.o_pairs) & ~(1 << pair), pair, geometry)
+        else:
+            self._settle()
+
+    def copy(self):
+        # A scratch engine at the same position for search: no subscribers and an empty undo stack
+        other = QuantumEngine.__new__(QuantumEngine)
+        other.geometry = self.geometry
+        other.events = EventBus()
+        other.undo_stack = []
+        other.state = self.state.copy()
+        other.components = self.components.copy()
+        other.line_counts = [counts[:] for counts in self.line_counts]
+        other.lines_won = self.lines_won[:]
+        other.previews = None
+        other.loop = self.loop
+        other.game_over = self.game_over
+        other.winner = self.winner
+        return other
+
+    def validate(self, box1, box2):
+        # Returns why the current player can't entangle these boxes, or None if they can
+        box_count = self.geometry.box_count
+        if not (0 <= box1 < box_count and 0 <= box2 < box_count):
+            return 'range'
+        if box1 == box2:
+            return 'same_box'
+        classical = self.state.x_board | self.state.o_board
+        if classical >> box1 & 1 or classical >> box2 & 1:
+            return 'occupied'
+        if (self.state.x_pairs | self.state.o_pairs) >> self.geometry.pair_index[box1][box2] & 1:
+            return 'duplicate'
+        return None
+
+    def place_particle(self, box1, box2, chooser=None):
+        # Plays one move for the current player. If it closes a loop, the collapse is resolved
+        # right away with `chooser`; without one it stays pending until resolve_collapse().
+        # Returns False if the move is not allowed.
+        reason = self.validate(box1, box2)
+        if reason is not None:
+            if self.events.active:
+                self.events.emit('invalid_move', reason, box1, box2)
+            return False
+
+        player = self.state.current_player
+        loop = self.add_particle(box1, box2)
+        if self.events.active:
+            self.events.emit('particle_placed', player, box1, box2)
+
+        if loop is None:
+            self.state.switch_player()
+            if self.events.active:
+                self.events.emit('turn_changed', self.state.current_player)
+            if self._out_of_moves():
+                self.game_over = True
+                if self.events.active:
+                    self.events.emit('draw', 'no_moves')
+            return True
+
+        if self.events.active:
+            self.events.emit('loop_detected', loop[0], loop[1], PLAYERS[self.state.turn ^ 1])
+        if chooser is not None:
+            box_a, box_b = self.geometry.pairs[self.state.moves[-1]]
+            self.resolve_collapse(chooser(self, box_a, box_b))
+        return True
+
+    def resolve_collapse(self, chosen_box):
+        # Finishes the move that closed a loop: collapses, checks for a win and passes the turn.
+        # If preview_collapse() already worked out this choice, its result is adopted instead.
+        result = self._adopt_preview(chosen_box)
+        if result is None:
+            result = self.collapse(chosen_box)
+        if self.events.active:
+            for pair, box, player in result.conflicts:
+                self.events.emit('conflict', result, pair, box, player)
+            self.events.emit('collapse_resolved', result)
+        self.check_win()
+        if not self.game_over:
+            self.state.switch_player()
+            if self.events.active:
+                self.events.emit('turn_changed', self.state.current_player)
+        return result
+
+    def preview_collapse(self):
+        # Both outcomes of the pending collapse, as (CollapsePreview for box_a, CollapsePreview for
+        # box_b). They are computed on scratch copies the first time they are asked for at a
+        # position and cached, so showing them again is free; resolve_collapse() then applies the
+        # chosen one rather than propagating again.
+        state = self.state
+        position = state.key() + (state.moves,)
+        if self.previews is None or self.previews[0] != position:
+            box_a, box_b = self.geometry.pairs[state.moves[-1]]
+            self.previews = (position, (CollapsePreview(self, box_a), CollapsePreview(self, box_b)))
+        return self.previews[1]
+
+    def _adopt_preview(self, chosen_box):
+        # Moves the engine to the cached preview of this choice; returns its result, or None when
+        # there is no preview for the current position
+        previews = self.previews
+        self.previews = None
+        if previews is None:
+            return None
+        position, choices = previews
+        state = self.state
+        if position != state.key() + (state.moves,):
+            return None
+        for preview in choices:
+            if preview.chosen_box == chosen_box:
+                # Copies, so the preview still shows what it showed
+                self.state = preview.state.copy()
+                self.components = preview.components.copy()
+                self.line_counts = [counts[:] for counts in preview.line_counts]
+                self.lines_won = preview.lines_won[:]
+                self.loop = None
+                return preview.result
+        return None
+
+    def check_win(self):
+        outcome = self._settle()
+        if outcome is not None and self.events.active:
+            self.events.emit(*outcome)
+        return self.game_over
+
+    def _settle(self):
+        # Sets game_over / winner from the classical board and returns the matching
+        # ('win', player) or ('draw', reason) event, or None while the game goes on
+        x_wins = self.lines_won[0] > 0
+        o_wins = self.lines_won[1] > 0
+
+        if x_wins and o_wins:
+            # Both players completing a line in the same collapse is a draw
+            self.winner = 'Both'
+            self.game_over = True
+            return ('draw', 'both')
+        if x_wins or o_wins:
+            self.winner = 'X' if x_wins else 'O'
+            self.game_over = True
+            return ('win', self.winner)
+        if self.state.x_board | self.state.o_board == self.geometry.full_board:
+            self.game_over = True
+            return ('draw', 'full')
+        if self._out_of_moves():
+            self.game_over = True
+            return ('draw', 'no_moves')
+        return None
+
+    def _out_of_moves(self):
+        # The live particles form a forest, so with three or more free boxes some pair of them is
+        # always open; only with one or two left can the player to move be stuck, and with two
+        # the one pair between them is the only move
+        state = self.state
+        free = self.geometry.full_board ^ (state.x_board | state.o_board)
+        free_count = bin(free).count('1')
+        if free_count > 2:
+            return False
+        if free_count < 2:
+            return True
+        box1, box2 = iter_bits(free)
+        return bool((state.x_pairs | state.o_pairs) >> self.geometry.pair_index[box1][box2] & 1)
+
+    def legal_moves(self):
+        # Returns (legal, closing): masks over the pair indices (36 on the 3x3 board) of the moves
+        # the player to move may make, and of those that would close a loop and trigger a collapse
+        if self.game_over or self.loop is not None:
+            return 0, 0
+        state = self.state
+        geometry = self.geometry
+        classical = state.x_board | state.o_board
+        legal = geometry.all_pairs & ~geometry.blocked_pairs[classical] & ~(state.x_pairs | state.o_pairs)
+        if not legal:
+            return 0, 0
+        # A pair closes a loop when both its boxes are in the same component
+        find = self.components.find
+        groups = {}
+        for box in iter_bits(geometry.full_board ^ classical):
+            root = find(box)
+            groups[root] = groups.get(root, 0) | 1 << box
+        closing = 0
+        pairs_within = geometry.pairs_within
+        for group in groups.values():
+            if group & (group - 1): # A single box has no pairs inside
+                closing |= pairs_within[group]
+        return legal, legal & closing
+
+    def add_particle(self, box1, box2):
+        # Places the current player's particle between two validated boxes.
+        # Returns the loop it closes, or None.
+        geometry = self.geometry
+        pair = geometry.pair_index[box1][box2]
+        # The new particle closes a loop exactly when its boxes are already linked
+        self.loop = find_loop(self.state.live_pairs, pair, geometry) if self.components.connected(box1, box2) else None
+        self.state.add_particle(pair)
+        if self.loop is not None:
+            self.state.zobrist ^= geometry.zobrist_pending[pair]
+        self.components.union(box1, box2)
+        return self.loop
+
+    def collapse(self, chosen_box):
+        # Resolves the last placed particle into chosen_box (one of its two boxes) and propagates:
+        # every other particle sharing a box that just became classical is forced into its other box.
+        # Only the particles of the collapsing component are visited.
+        state = self.state
+        geometry = self.geometry
+        pairs = geometry.pairs
+        box_pairs = geometry.box_pairs
+        pair = state.moves[-1]
+        box_a, box_b = pairs[pair]
+        classical = state.x_board | state.o_board
+        x_pairs = state.x_pairs
+        live = x_pairs | state.o_pairs
+        player = PLAYERS[state.o_pairs >> pair & 1]
+        result = CollapseResult(pair, chosen_box, pairs)
+
+        start = chosen_box
+        if classical >> chosen_box & 1:
+            # The chosen box is taken, so the particle falls back to its other box if it can
+            result.conflicts.append((pair, chosen_box, player))
+            start = box_b if chosen_box == box_a else box_a
+            if classical >> start & 1:
+                result.conflicts.append((pair, start, player))
+                start = -1
+
+        resolved_mask = 0
+        queue = deque()
+        if start != -1:
+            resolved_mask = 1 << pair
+            result.resolved.append((pair, start, player))
+            queue.append(start)
+
+        while queue:
+            box = queue.popleft()
+            # The box -> particles index is the live pair mask restricted to the box's pairs
+            for p in iter_bits(live & box_pairs[box] & ~resolved_mask):
+                b1, b2 = pairs[p]
+                forced_to_box = b1 if b2 == box else b2
+                if classical >> forced_to_box & 1:
+                    result.conflicts.append((p, forced_to_box, 'X' if x_pairs >> p & 1 else 'O'))
+                else:
+                    resolved_mask |= 1 << p
+                    result.resolved.append((p, forced_to_box, 'X' if x_pairs >> p & 1 else 'O'))
+                    queue.append(forced_to_box)
+
+        # Apply the resolutions to the classical board, counting each new mark on its lines
+        box_lines = geometry.box_lines
+        win_length = geometry.win_length
+        line_counts = self.line_counts
+        lines_won = self.lines_won
+        for resolution in result.resolved:
+            _, box, mark = resolution
+            bit = 1 << box
+            if classical & bit:
+                result.lost.append(resolution)
+                continue
+            classical |= bit
+            state.set_classical(box, mark)
+            owner = 0 if mark == 'X' else 1
+            counts = line_counts[owner]
+            for line in box_lines[box]:
+                counts[line] += 1
+                if counts[line] == win_length:
+                    lines_won[owner] += 1
+
+        component = component_of(live, box_a, geometry)
+        state.zobrist ^= geometry.zobrist_pending[pair]
+        state.remove_particles(resolved_mask)
+        self.components.rebuild_component(component, state.x_pairs | state.o_pairs)
+        self.loop = None
+        return result
+
+    # --- Search API ---
+    # make_move / make_collapse play without validation or events and push a small delta on
+    # undo_stack; unmake_move / unmake_collapse pop it. Boards and pair masks are ints and the
+    # move stack is a tuple, so a delta just keeps references to the old values, plus how long
+    # the union-find journal was. Don't interleave with place_particle / resolve_collapse.
+
+    def make_move(self, box1, box2):
+        # Places a legal particle. If it closes a loop the collapse is left pending for make_collapse
+        # and the mover keeps the turn; otherwise the turn passes. Returns the loop or None.
+        state = self.state
+        components = self.components
+        if components.trail is None:
+            components.trail = []
+        self.undo_stack.append((_MOVE, len(components.trail), state.moves, state.turn, state.zobrist, self.loop))
+        loop = self.add_particle(box1, box2)
+        if loop is None:
+            state.switch_player()
+            if self._out_of_moves():
+                self.game_over = True
+        return loop
+
+    def unmake_move(self):
+        if self.undo_stack[-1][0] is not _MOVE:
+            raise ValueError("The last change was a collapse; use unmake_collapse()")
+        state = self.state
+        mask = ~(1 << state.moves[-1])
+        state.x_pairs &= mask
+        state.o_pairs &= mask
+        _, mark, state.moves, state.turn, state.zobrist, self.loop = self.undo_stack.pop()
+        self.game_over = False # Moves are only made in unfinished games
+        self._rollback_components(mark)
+
+    def make_collapse(self, chosen_box):
+        # Resolves the pending collapse, checks for a win and passes the turn unless the game ended
+        state = self.state
+        components = self.components
+        if components.trail is None:
+            components.trail = []
+        x_counts, o_counts = line_counts = self.line_counts
+        self.undo_stack.append((_COLLAPSE, len(components.trail), state.x_board, state.o_board, state.x_pairs,
+                                state.o_pairs, state.moves, state.turn, state.zobrist, self.loop, self.game_over,
+                                self.winner, line_counts, self.lines_won))
+        # The collapse updates the line counts in place, so it gets copies and the delta keeps the originals
+        self.line_counts = [x_counts[:], o_counts[:]]
+        self.lines_won = self.lines_won[:]
+        result = self.collapse(chosen_box)
+        if self._settle() is None:
+            state.switch_player()
+        return result
+
+    def unmake_collapse(self):
+        if self.undo_stack[-1][0] is not _COLLAPSE:
+            raise ValueError("The last change was a move; use unmake_move()")
+        state = self.state
+        (_, mark, state.x_board, state.o_board, state.x_pairs, state.o_pairs, state.moves, state.turn,
+         state.zobrist, self.loop, self.game_over, self.winner, self.line_counts, self.lines_won) = self.undo_stack.pop()
+        self._rollback_components(mark)
+
+    def _rollback_components(self, mark):
+        self.components.rollback(mark)
+        if not self.undo_stack:
+            self.components.trail = None
+
+
+# --- Collapse choosers ---
+# When a loop forms, the player who didn't close it picks the box the last particle resolves to.
+# A chooser is any callable chooser(engine, box_a, box_b) returning box_a or box_b; the classes
+# below are the stock strategies. The interactive prompt lives with the CLI in quantum-ttt.py.
+
+class FirstBoxChooser:
+    # Always resolves to the lower-numbered box
+    def __call__(self, engine, box_a, box_b):
+        return box_a
+
+
+class RandomChooser:
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+
+    def __call__(self, engine, box_a, box_b):
+        return box_a if self.rng.random() < 0.5 else box_b
+
+
+class SearchChooser:
+    # Delegates to a search AI: any object with a choose_collapse(engine) method returning a box
+    def __init__(self, ai):
+        self.ai = ai
+
+    def __call__(self, engine, box_a, box_b):
+        return self.ai.choose_collapse(engine)
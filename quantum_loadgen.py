@@ -0,0 +1,151 @@
+# Load generator for quantum_server.py: many clients playing random games at once.
+#
+#   python quantum_loadgen.py --sessions 2000 --duration 10
+#
+# Each session is one connection holding both seats, playing random legal moves as fast as the
+# server answers. A local engine mirrors the game to pick legal moves. Every request is timed
+# from sending it to the reply that answers it; the report gives moves/sec, the latency
+# percentiles and the bytes received per move. With --sync delta the clients ask for deltas
+# (see quantum_sync.py) instead of whole states, keep a StateMirror of each game from them and
+# check it against the local engine after every reply; the report counts the mismatches.
+# Moves are sent with their boxes in either order, as a person would type them.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from quantum_engine import PAIRS, QuantumEngine, iter_bits
+from quantum_sync import StateMirror, snapshot
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class LoadClient:
+    def __init__(self, host, port, rng, latencies, sync='state'):
+        self.host = host
+        self.port = port
+        self.rng = rng
+        self.latencies = latencies # Shared list of request latencies in seconds
+        self.sync = sync
+        self.reply = 'deltas' if sync == 'delta' else 'state'
+        self.received = 0 # Bytes
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.desyncs = 0 # Replies after which the delta mirror differed from the local engine
+
+    async def request(self, reader, writer, message, expect):
+        # Sends a request and waits for the message of type `expect` (or an error) answering it
+        started = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Server closed the connection")
+            self.received += len(line)
+            reply = json.loads(line)
+            if reply['type'] == 'error':
+                self.errors += 1
+                raise RuntimeError(reply['message'])
+            if reply['type'] == expect:
+                self.latencies.append(time.perf_counter() - started)
+                return reply
+
+    def check_mirror(self, mirror, reply, engine):
+        # Applies a deltas reply and compares the mirror with the local game; a mismatch is
+        # counted and the mirror realigned, so one missed delta isn't counted on every later move
+        mirror.apply_all(reply['deltas'])
+        expected = snapshot(engine, mirror.version)
+        if mirror.snapshot() != expected:
+            self.desyncs += 1
+            mirror.load(expected)
+
+    def _delta_gap(self):
+        # Replies arrive in order on one connection, so a version gap is a server bug
+        self.errors += 1
+        raise RuntimeError("Gap in the delta versions")
+
+    async def run(self, deadline):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        engine = QuantumEngine()
+        try:
+            while time.perf_counter() < deadline:
+                created = await self.request(reader, writer, {'op': 'create', 'sync': self.sync}, 'created')
+                session = created['session']
+                engine.reset()
+                mirror = None
+                if self.sync == 'delta':
+                    mirror = StateMirror(self._delta_gap)
+                    mirror.load(created['snapshot'])
+                while not engine.game_over and time.perf_counter() < deadline:
+                    box1, box2 = PAIRS[self.rng.choice(list(iter_bits(engine.legal_moves()[0])))]
+                    if self.rng.random() < 0.5:
+                        box1, box2 = box2, box1
+                    engine.place_particle(box1, box2)
+                    reply = await self.request(reader, writer, {'op': 'move', 'session': session, 'boxes': [box1, box2]}, self.reply)
+                    self.moves += 1
+                    if mirror is not None:
+                        self.check_mirror(mirror, reply, engine)
+                    if engine.loop is not None:
+                        # We hold both seats, so the collapse request comes to us
+                        box = self.rng.choice(PAIRS[engine.state.moves[-1]])
+                        reply = await self.request(reader, writer, {'op': 'collapse', 'session': session, 'box': box}, self.reply)
+                        engine.resolve_collapse(box)
+                        if mirror is not None:
+                            self.check_mirror(mirror, reply, engine)
+                self.games += 1
+                writer.write(json.dumps({'op': 'leave', 'session': session}).encode() + b'\n')
+        except (ConnectionError, RuntimeError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_load(host, port, sessions, duration, seed=None, sync='state'):
+    rng = random.Random(seed)
+    latencies = []
+    clients = [LoadClient(host, port, random.Random(rng.getrandbits(32)), latencies, sync) for _ in range(sessions)]
+    started = time.perf_counter()
+    await asyncio.gather(*(client.run(started + duration) for client in clients))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'sessions': sessions,
+        'seconds': elapsed,
+        'moves': sum(client.moves for client in clients),
+        'games': sum(client.games for client in clients),
+        'errors': sum(client.errors for client in clients),
+        'desyncs': sum(client.desyncs for client in clients),
+        'received': sum(client.received for client in clients),
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the Quantum Tic-Tac-Toe game server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, default=1000, help="concurrent games (default 1000)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run (default 10)")
+    parser.add_argument("--seed", type=int, help="random seed")
+    parser.add_argument("--sync", choices=["state", "delta"], default="state", help="whole states or deltas (default state)")
+    args = parser.parse_args()
+
+    stats = asyncio.run(run_load(args.host, args.port, args.sessions, args.duration, args.seed, args.sync))
+    print(f"{stats['sessions']} sessions, {stats['games']} games, {stats['moves']} moves in {stats['seconds']:.1f}s "
+          f"({stats['moves'] / stats['seconds']:.0f} moves/s)")
+    print(f"Latency: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms "
+          f"over {stats['requests']} requests, {stats['errors']} errors")
+    print(f"Received {stats['received'] / max(stats['moves'], 1):.0f} bytes per move")
+    if args.sync == "delta":
+        print(f"Delta mirrors out of sync after {stats['desyncs']} replies")
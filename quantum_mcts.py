@@ -0,0 +1,227 @@
+# Computer player: Monte Carlo tree search with UCT, rollouts spread over worker processes.
+#
+# Like the alpha-beta player (quantum_ai.py) the tree has placement nodes and collapse nodes,
+# and a collapse node belongs to the player who didn't close the loop: they pick the box that
+# is best for them, it isn't a coin flip. Only rollouts (random play to the end) treat moves
+# and collapses as random.
+#
+# Leaf parallelism: the tree lives in this process. Each selected leaf is sent to a
+# ProcessPoolExecutor as a batch of rollouts, with several leaves in flight at once; "virtual
+# visits" on the path keep selection from piling onto a leaf whose results haven't come back.
+# The tree is kept between moves, so work on the line actually played isn't thrown away.
+
+import math
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from quantum_engine import PAIRS, PLAYERS, STANDARD, QuantumEngine, iter_bits
+
+
+class Node:
+    # One position in the tree. `wins` are from the point of view of the player who chose the
+    # move leading here (the actor at the parent), counting draws as half.
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'wins', 'actor', 'key', 'winner')
+
+    def __init__(self, engine, move=None, parent=None):
+        self.move = move # Pair index, or box at a collapse node's children
+        self.parent = parent
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0
+        self.key = position_key(engine)
+        if engine.game_over:
+            self.actor = None
+            self.untried = []
+            self.winner = engine.winner # 'X', 'O', 'Both' or None for a draw
+        elif engine.loop is not None:
+            self.actor = engine.state.turn ^ 1 # The player who didn't close the loop picks the collapse
+            self.untried = list(PAIRS[engine.state.moves[-1]])
+            self.winner = None
+        else:
+            self.actor = engine.state.turn
+            self.untried = list(iter_bits(engine.legal_moves()[0]))
+            self.winner = None
+
+    def best_child(self, exploration):
+        log_visits = math.log(self.visits)
+        best = None
+        best_score = -1.0
+        for child in self.children:
+            score = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best = child
+                best_score = score
+        return best
+
+
+def position_key(engine):
+    # The position plus the particle whose collapse is pending, if any
+    return engine.state.key(), engine.state.moves[-1] if engine.loop is not None else -1
+
+
+def rollout_batch(state, pending, count, seed):
+    # Plays `count` random games from the position and returns (X wins, O wins, draws).
+    # Runs in the worker processes, so it only takes picklable arguments.
+    rng = random.Random(seed)
+    engine = QuantumEngine()
+    x_wins = o_wins = draws = 0
+    for _ in range(count):
+        engine.load(state, pending)
+        while not engine.game_over:
+            if engine.loop is not None:
+                engine.resolve_collapse(rng.choice(PAIRS[engine.state.moves[-1]]))
+            else:
+                box1, box2 = PAIRS[rng.choice(list(iter_bits(engine.legal_moves()[0])))]
+                engine.place_particle(box1, box2)
+        if engine.winner == 'X':
+            x_wins += 1
+        elif engine.winner == 'O':
+            o_wins += 1
+        else:
+            draws += 1
+    return x_wins, o_wins, draws
+
+
+class MCTSAI:
+    # choose_move / choose_collapse run the search for time_limit seconds and return the most
+    # visited decision. workers is the number of rollout processes (0 runs rollouts in this
+    # process); each task plays rollouts_per_leaf games from one leaf.
+
+    def __init__(self, time_limit=1.0, workers=None, rollouts_per_leaf=8, exploration=1.4, seed=None):
+        self.time_limit = time_limit
+        self.workers = os.cpu_count() if workers is None else workers
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+        self._pool = None
+        # Stats of the last search
+        self.rollouts = 0
+        self.reused = 0 # Visits carried over from the previous search
+
+    def choose_move(self, engine):
+        # Returns (box1, box2) for the player to move
+        return PAIRS[self.search(engine)]
+
+    def choose_collapse(self, engine):
+        # Returns the box the pending collapse should resolve the last particle to
+        return self.search(engine)
+
+    def __call__(self, engine, box_a, box_b):
+        return self.choose_collapse(engine)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def search(self, engine):
+        if engine.game_over:
+            raise ValueError("The game is over")
+        if engine.geometry is not STANDARD:
+            raise ValueError("The search plays the 3x3 board only")
+        root = self._reuse_root(engine)
+        self.reused = root.visits
+        if len(root.untried) + len(root.children) == 1:
+            self.root = root
+            return (root.untried or [root.children[0].move])[0]
+
+        if self.workers and self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        capacity = self.workers * 2 if self.workers else 1
+        scratch = engine.copy()
+        deadline = time.perf_counter() + self.time_limit
+        in_flight = {}
+        self.rollouts = 0
+        while time.perf_counter() < deadline:
+            while len(in_flight) < capacity and time.perf_counter() < deadline:
+                path = self._select(root, scratch)
+                leaf = path[-1]
+                if leaf.actor is None:
+                    # A finished game needs no rollout: score it straight away
+                    result = (leaf.winner == 'X', leaf.winner == 'O', leaf.winner not in PLAYERS)
+                    self._rewind(scratch, path)
+                    self._backpropagate(path, result, 1)
+                    continue
+                state = scratch.state.copy()
+                pending = scratch.loop is not None
+                self._rewind(scratch, path)
+                for node in path:
+                    node.visits += self.rollouts_per_leaf # Virtual visits until the results arrive
+                seed = self.rng.getrandbits(32)
+                if self._pool is None:
+                    self._backpropagate(path, rollout_batch(state, pending, self.rollouts_per_leaf, seed), 0)
+                    break
+                in_flight[self._pool.submit(rollout_batch, state, pending, self.rollouts_per_leaf, seed)] = path
+            if in_flight:
+                done, _ = wait(in_flight, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._backpropagate(in_flight.pop(future), future.result(), 0)
+        # Leaves still out are short batches; let them land so the tree stays consistent
+        for future, path in in_flight.items():
+            self._backpropagate(path, future.result(), 0)
+
+        self.root = root
+        if not root.children:
+            return root.untried[0] # No time for even one rollout
+        return max(root.children, key=lambda child: child.visits).move
+
+    def _reuse_root(self, engine):
+        # Finds the current position among the last search's nodes a few decisions down (our move,
+        # its collapse, the reply and its collapse), or starts a fresh tree
+        key = position_key(engine)
+        frontier = [self.root] if self.root is not None else []
+        for _ in range(5):
+            next_frontier = []
+            for node in frontier:
+                if node.key == key:
+                    node.parent = None
+                    node.move = None
+                    return node
+                next_frontier.extend(node.children)
+            frontier = next_frontier
+        return Node(engine)
+
+    def _select(self, root, engine):
+        # Walks down by UCT, playing the moves on engine, and expands one untried move.
+        # Returns the path from the root to the new leaf.
+        node = root
+        path = [node]
+        while not node.untried and node.children:
+            node = node.best_child(self.exploration)
+            self._play(engine, node.move)
+            path.append(node)
+        if node.untried:
+            move = node.untried.pop(self.rng.randrange(len(node.untried)))
+            self._play(engine, move)
+            child = Node(engine, move, node)
+            node.children.append(child)
+            path.append(child)
+        return path
+
+    @staticmethod
+    def _play(engine, move):
+        if engine.loop is not None:
+            engine.make_collapse(move)
+        else:
+            engine.make_move(*PAIRS[move])
+
+    @staticmethod
+    def _rewind(engine, path):
+        for parent in reversed(path[:-1]):
+            if parent.key[1] != -1:
+                engine.unmake_collapse()
+            else:
+                engine.unmake_move()
+
+    def _backpropagate(self, path, result, visits):
+        # Adds a batch of (X wins, O wins, draws) to every node on the path. Each node scores it
+        # for the player who moved into it; visits were already counted unless `visits` says so.
+        x_wins, o_wins, draws = result
+        self.rollouts += x_wins + o_wins + draws
+        for parent, node in zip(path, path[1:]):
+            node.visits += visits
+            node.wins += (x_wins if parent.actor == 0 else o_wins) + draws * 0.5
+        path[0].visits += visits
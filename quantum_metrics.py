@@ -0,0 +1,190 @@
+# Opt-in instrumentation of the engine's hot paths, and the --profile mode of the front ends.
+#
+#   metrics = EngineMetrics()
+#   metrics.attach(engine)      # from now on this engine is measured
+#   ...play...
+#   metrics.write("metrics.json")   # or "metrics.prom" for the Prometheus text format
+#
+# Measured, each as a histogram:
+#   loop_check_seconds           one placement's loop check (add_particle); loops_found counts the hits
+#   collapse_seconds             one collapse propagated on the engine
+#   preview_seconds              working out both outcomes of a pending collapse (preview_collapse)
+#   collapse_propagated_particles  particles the propagation queue took in one collapse
+#   collapse_conflicts           particles forced towards an occupied box in one collapse
+#   win_check_seconds            one check for a win or draw
+# Every collapse of the game counts in collapse_propagated_particles and collapse_conflicts. One
+# that applies a cached preview (previews_adopted counts those) isn't propagated again, so its
+# time is in preview_seconds rather than collapse_seconds.
+#
+# attach() shadows those engine methods on the instance with timed wrappers; the engine code
+# itself has no hooks, so an engine that was never attached runs exactly the code it always did.
+# Only the attached engine is measured: the scratch copies that previews and searches work on
+# are not, so the metrics describe the game that was played.
+
+import cProfile
+import json
+import sys
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds of the histogram buckets; values above the last go in a +Inf bucket
+TIME_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+SIZE_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64, 128)
+
+PREFIX = 'quantum_ttt_'
+
+
+class Histogram:
+    # Bucketed observations, as in Prometheus: counts[i] is how many values were at most
+    # bounds[i] and above the bound before it; the last count is the +Inf bucket
+    def __init__(self, bounds, help_text):
+        self.bounds = bounds
+        self.help_text = help_text
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        labels = [format_bound(bound) for bound in self.bounds] + ['+Inf']
+        return {'count': self.count, 'sum': self.sum, 'buckets': dict(zip(labels, self.counts))}
+
+    def prometheus_lines(self, name):
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            cumulative += count
+            le = '+Inf' if bound is None else format_bound(bound)
+            lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+def format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+class EngineMetrics:
+    def __init__(self):
+        self.histograms = {
+            'loop_check_seconds': Histogram(TIME_BUCKETS, "Time to place a particle and check it for a closed loop."),
+            'collapse_seconds': Histogram(TIME_BUCKETS, "Time to collapse a loop, including propagation."),
+            'preview_seconds': Histogram(TIME_BUCKETS, "Time to work out both outcomes of a pending collapse."),
+            'collapse_propagated_particles': Histogram(SIZE_BUCKETS, "Particles queued by one collapse's propagation."),
+            'collapse_conflicts': Histogram(SIZE_BUCKETS, "Particles forced towards an occupied box in one collapse."),
+            'win_check_seconds': Histogram(TIME_BUCKETS, "Time to check the board for a win or draw."),
+        }
+        self.loops_found = 0
+        self.previews_adopted = 0
+
+    def attach(self, engine):
+        # Replaces add_particle, collapse, preview_collapse, _adopt_preview and _settle (behind
+        # check_win and make_collapse) on this engine with measuring wrappers around the class's
+        # own methods
+        histograms = self.histograms
+        loop_checks = histograms['loop_check_seconds']
+        collapses = histograms['collapse_seconds']
+        previews = histograms['preview_seconds']
+        propagated = histograms['collapse_propagated_particles']
+        conflicts = histograms['collapse_conflicts']
+        win_checks = histograms['win_check_seconds']
+        add_particle = engine.add_particle
+        collapse = engine.collapse
+        preview_collapse = engine.preview_collapse
+        adopt_preview = engine._adopt_preview
+        settle = engine._settle
+
+        def timed_add_particle(box1, box2):
+            started = perf_counter()
+            loop = add_particle(box1, box2)
+            loop_checks.observe(perf_counter() - started)
+            if loop is not None:
+                self.loops_found += 1
+            return loop
+
+        def timed_collapse(chosen_box):
+            started = perf_counter()
+            result = collapse(chosen_box)
+            collapses.observe(perf_counter() - started)
+            propagated.observe(len(result.resolved))
+            conflicts.observe(len(result.conflicts))
+            return result
+
+        def timed_preview_collapse():
+            cached = engine.previews
+            started = perf_counter()
+            choices = preview_collapse()
+            if engine.previews is not cached: # Not just read from the cache
+                previews.observe(perf_counter() - started)
+            return choices
+
+        def counted_adopt_preview(chosen_box):
+            result = adopt_preview(chosen_box)
+            if result is not None:
+                self.previews_adopted += 1
+                propagated.observe(len(result.resolved))
+                conflicts.observe(len(result.conflicts))
+            return result
+
+        def timed_settle():
+            started = perf_counter()
+            outcome = settle()
+            win_checks.observe(perf_counter() - started)
+            return outcome
+
+        engine.add_particle = timed_add_particle
+        engine.collapse = timed_collapse
+        engine.preview_collapse = timed_preview_collapse
+        engine._adopt_preview = counted_adopt_preview
+        engine._settle = timed_settle
+
+    def detach(self, engine):
+        # Back to the class's methods
+        for name in ('add_particle', 'collapse', 'preview_collapse', '_adopt_preview', '_settle'):
+            engine.__dict__.pop(name, None)
+
+    # --- Export ---
+
+    def snapshot(self):
+        # Plain dict for JSON: per histogram its count, sum and per-bucket (not cumulative) counts
+        metrics = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+        metrics['loops_found'] = self.loops_found
+        metrics['previews_adopted'] = self.previews_adopted
+        return metrics
+
+    def prometheus_text(self):
+        lines = []
+        for name, histogram in self.histograms.items():
+            lines.extend(histogram.prometheus_lines(PREFIX + name))
+        name = PREFIX + 'loops_found_total'
+        lines += [f"# HELP {name} Placements that closed a loop.", f"# TYPE {name} counter", f"{name} {self.loops_found}"]
+        name = PREFIX + 'previews_adopted_total'
+        lines += [f"# HELP {name} Collapses that applied a cached preview.", f"# TYPE {name} counter",
+                  f"{name} {self.previews_adopted}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Prometheus text format for a .prom or .txt file, a JSON snapshot otherwise
+        if path.endswith(('.prom', '.txt')):
+            text = self.prometheus_text()
+        else:
+            text = json.dumps(self.snapshot(), indent=2) + "\n"
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def run_profiled(path, session):
+    # Runs session() under cProfile and dumps the stats to path, even if the session fails;
+    # read them with `python -m pstats <path>`. Only the calling thread is profiled.
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(session)
+    finally:
+        profiler.dump_stats(path)
+        print(f"Profile written to {path} (python -m pstats {path})", file=sys.stderr)
@@ -0,0 +1,121 @@
+# Occupancy odds: for every box, the fraction of the possible collapse outcomes in which it
+# ends up X, O or empty.
+#
+#   odds = OccupancyOdds(engine)
+#   odds.probabilities()[4]   -> (0.5, 0.25, 0.25): box 4 is X in half the outcomes, O in a quarter
+#
+# Collapse outcomes are the ways every live particle can become classical in one of its two
+# boxes with no box taking two marks. Components of the entanglement graph collapse
+# independently, so a box's odds depend on its own component only:
+#   - a component with no loop is a tree. Leaving any one of its V boxes empty forces every
+#     particle away from that box, so it has exactly V outcomes, one per empty box. The box
+#     whose particle a given box takes is its neighbour towards the empty one, so one pass over
+#     the subtree sizes gives every box's X / O / empty counts.
+#   - the component whose loop is waiting to collapse has two outcomes, one for each way round
+#     the loop. Boxes off the loop take the particle towards it in both.
+# Nothing is enumerated, so large boards with many live particles cost time linear in the
+# particles. Each component's counts are cached until a move or collapse changes it.
+
+from quantum_engine import PLAYERS
+
+
+class OccupancyOdds:
+    def __init__(self, engine):
+        self.engine = engine
+        self.cache = {} # Component (its X pairs, its O pairs) -> {box: (x, o, empty, outcomes)}
+
+    def counts(self):
+        # Per box (x, o, empty, outcomes): in how many of its component's collapse outcomes the
+        # box ends up X, O or empty. Classical boxes and boxes without particles have one outcome.
+        state = self.engine.state
+        geometry = state.geometry
+        classical = state.classical
+        counts = [(state.x_board >> box & 1, state.o_board >> box & 1, 1 - (classical >> box & 1), 1)
+                  for box in range(geometry.box_count)]
+
+        find = self.engine.components.find
+        components = {}
+        for p in state.moves:
+            components.setdefault(find(geometry.pairs[p][0]), []).append(p)
+
+        cache = {}
+        for pairs in components.values():
+            x_pairs = tuple(sorted(p for p in pairs if state.x_pairs >> p & 1))
+            o_pairs = tuple(sorted(p for p in pairs if state.o_pairs >> p & 1))
+            key = (x_pairs, o_pairs)
+            component = self.cache.get(key)
+            if component is None:
+                component = self._component_counts(geometry, x_pairs, o_pairs)
+            cache[key] = component
+            for box, box_counts in component.items():
+                counts[box] = box_counts
+        self.cache = cache # Components that changed since the last call drop out
+        return counts
+
+    def probabilities(self):
+        # Per box (x, o, empty) as fractions of its component's outcomes
+        return [(x / total, o / total, empty / total) for x, o, empty, total in self.counts()]
+
+    def _component_counts(self, geometry, x_pairs, o_pairs):
+        # neighbours[box] lists (other box, owner index) for each particle on the box
+        neighbours = {}
+        for owner, pairs in enumerate((x_pairs, o_pairs)):
+            for p in pairs:
+                box1, box2 = geometry.pairs[p]
+                neighbours.setdefault(box1, []).append((box2, owner))
+                neighbours.setdefault(box2, []).append((box1, owner))
+        if len(x_pairs) + len(o_pairs) == len(neighbours):
+            return self._loop_counts(neighbours) # One more particle than a tree: the pending loop
+        return self._tree_counts(neighbours)
+
+    def _tree_counts(self, neighbours):
+        # Roots the tree anywhere. With the empty box in the subtree of a child c, box b takes the
+        # particle it shares with c, which happens for size[c] choices of empty box; with the
+        # empty box outside b's subtree, b takes the particle to its parent (V - size[b] choices).
+        boxes = len(neighbours)
+        root = next(iter(neighbours))
+        parent = {root: (None, None)} # box -> (parent box, owner of the particle between them)
+        order = [root]
+        for box in order:
+            for other, owner in neighbours[box]:
+                if other not in parent:
+                    parent[other] = (box, owner)
+                    order.append(other)
+        size = dict.fromkeys(order, 1)
+        taken = {box: [0, 0] for box in order} # X / O outcome counts per box
+        for box in reversed(order):
+            up, owner = parent[box]
+            if up is not None:
+                size[up] += size[box]
+                taken[up][owner] += size[box]
+                taken[box][owner] += boxes - size[box]
+        return {box: (x, o, 1, boxes) for box, (x, o) in taken.items()}
+
+    def _loop_counts(self, neighbours):
+        # Peels leaves until only the loop is left: a peeled box takes the particle towards the
+        # loop in both outcomes; a loop box takes each of its two loop particles in one of them
+        degree = {box: len(others) for box, others in neighbours.items()}
+        taken = {box: [0, 0] for box in neighbours}
+        leaves = [box for box, count in degree.items() if count == 1]
+        peeled = set()
+        while leaves:
+            box = leaves.pop()
+            peeled.add(box)
+            for other, owner in neighbours[box]:
+                if other not in peeled:
+                    taken[box][owner] += 2
+                    degree[other] -= 1
+                    if degree[other] == 1:
+                        leaves.append(other)
+        for box, others in neighbours.items():
+            if box not in peeled:
+                for other, owner in others:
+                    if other not in peeled:
+                        taken[box][owner] += 1
+        return {box: (x, o, 0, 2) for box, (x, o) in taken.items()}
+
+    def labels(self):
+        # Per box "x 40% o 40%" if it has particles, else ""; the GUI overlay shows these
+        x_name, o_name = (player.lower() for player in PLAYERS)
+        return [f"{x_name} {x / total:.0%} {o_name} {o / total:.0%}" if total > 1 else ""
+                for x, o, empty, total in self.counts()]
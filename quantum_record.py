@@ -0,0 +1,181 @@
+# Game records: every placement and collapse choice of a game, in a compact binary file.
+#
+# File layout:
+#   header: magic b'QTTR', version byte
+#   then one frame per game: varint(payload length), payload
+# Payload:
+#   varint(number of placements << 3 | number of collapses % 8)
+#   one byte per placement: its pair index (see PAIRS). Players alternate, X first, so the
+#     player isn't stored.
+#   the collapse choices, one bit each in the order the collapses happened, least significant
+#     bit first, in the bytes left in the payload: 0 = the particle's lower box, 1 = its higher box
+# A typical game takes about a dozen bytes. Files are only ever appended to, and the reader
+# streams them a game at a time, so logs can grow without bound.
+
+from quantum_engine import PAIRS, STANDARD, QuantumEngine
+
+MAGIC = b'QTTR'
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(f):
+    # Reads a varint from a binary file; returns None at a clean end of file
+    value = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            if shift:
+                raise ValueError("Truncated game record")
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+class GameRecord:
+    # The moves of one game: pairs[i] is the pair index of the i-th placement, choices[j] is
+    # True if the j-th collapse resolved the closing particle into its higher box
+
+    def __init__(self, pairs=None, choices=None):
+        self.pairs = pairs if pairs is not None else []
+        self.choices = choices if choices is not None else []
+
+    def __eq__(self, other):
+        if not isinstance(other, GameRecord):
+            return NotImplemented
+        return self.pairs == other.pairs and self.choices == other.choices
+
+    def __repr__(self):
+        return f"GameRecord(pairs={self.pairs}, choices={self.choices})"
+
+    def encode(self):
+        bits = bytearray((len(self.choices) + 7) // 8)
+        for i, choice in enumerate(self.choices):
+            if choice:
+                bits[i >> 3] |= 1 << (i & 7)
+        payload = encode_varint(len(self.pairs) << 3 | len(self.choices) & 7) + bytes(self.pairs) + bytes(bits)
+        return encode_varint(len(payload)) + payload
+
+    @classmethod
+    def decode(cls, payload):
+        # Builds a record from a frame's payload (without its length prefix)
+        counts = 0
+        shift = 0
+        index = 0
+        while True:
+            byte = payload[index]
+            index += 1
+            counts |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        count = counts >> 3
+        pairs = list(payload[index:index + count])
+        bits = payload[index + count:]
+        # The low bits of the count say how much of the last byte is used (0: all of it)
+        collapses = len(bits) * 8 - (-counts & 7 if bits else 0)
+        choices = [bool(bits[i >> 3] >> (i & 7) & 1) for i in range(collapses)]
+        return cls(pairs, choices)
+
+    def replay(self, engine=None):
+        # Plays the record through an engine (a fresh one by default) and returns it. Events
+        # fire as in a live game, so a subscribed front end shows the game move by move.
+        engine = engine if engine is not None else QuantumEngine()
+        engine.reset()
+        choices = iter(self.choices)
+        chooser = lambda engine, box_a, box_b: box_b if next(choices) else box_a
+        for pair in self.pairs:
+            if not engine.place_particle(*PAIRS[pair], chooser):
+                raise ValueError(f"Recorded move {PAIRS[pair]} is not legal here")
+        return engine
+
+
+class GameRecorder:
+    # Engine subscriber that builds the record of the game being played and, with a writer,
+    # appends it when the game ends. A reset starts a new record.
+
+    def __init__(self, engine, writer=None):
+        if engine.geometry is not STANDARD:
+            raise ValueError("Game records hold 3x3 games only")
+        self.engine = engine
+        self.writer = writer
+        self.record = GameRecord()
+        engine.events.subscribe(self)
+
+    def on_reset(self):
+        self.record = GameRecord()
+
+    def on_particle_placed(self, player, box1, box2):
+        self.record.pairs.append(self.engine.state.moves[-1])
+
+    def on_collapse_resolved(self, result):
+        self.record.choices.append(result.chosen_box == PAIRS[result.pair][1])
+
+    def on_win(self, player):
+        self._finish()
+
+    def on_draw(self, reason):
+        self._finish()
+
+    def _finish(self):
+        if self.writer is not None:
+            self.writer.write(self.record)
+            self.writer.flush()
+
+
+class RecordWriter:
+    # Appends records to a file, writing the header if the file is new
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER)
+
+    def write(self, record):
+        self.file.write(record.encode())
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_frames(path):
+    # Yields the raw payload of each game in a file, for GameRecord.decode, without decoding
+    # them (e.g. to hand them to other processes)
+    with open(path, 'rb') as f:
+        if f.read(len(HEADER)) != HEADER:
+            raise ValueError(f"{path} is not a version {VERSION} game record file")
+        while True:
+            length = read_varint(f)
+            if length is None:
+                return
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError("Truncated game record")
+            yield payload
+
+
+def read_records(path):
+    # Yields the records of a file one at a time
+    for payload in read_frames(path):
+        yield GameRecord.decode(payload)
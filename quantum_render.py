@@ -0,0 +1,196 @@
+# Retained-mode drawing of the board on a Tk canvas.
+#
+# Every canvas item the board can need is created once, up front: per cell a background, the
+# box number, the classical mark and a slot for each quantum particle glyph, and per pair of
+# boxes one entanglement arc. Their geometry (cell rectangles, arc control points) is computed
+# at the same time. render() then compares the position with what is on the canvas and only
+# reconfigures the items that differ; unused items are hidden rather than deleted.
+#
+# The cells sit on a regular grid, so the cell under the pointer is a couple of divisions
+# (cell_at), and the hover highlight is a single item moved from cell to cell. The layout
+# follows style.cell_size, so a scaled board costs nothing extra per mouse event.
+#
+# A ghost preview (e.g. of a collapse outcome) is just another render() of that position with the
+# marks it would add drawn in the paler particle colors; rendering the real position again
+# afterwards only touches the cells the preview changed. An optional line of text per cell (the
+# occupancy odds overlay) is diffed the same way.
+
+import math
+
+from quantum_engine import BOX_COUNT, PAIR_COUNT, PAIR_INDEX, PAIRS
+
+MAX_GLYPHS = BOX_COUNT - 1 # A box can be entangled with every other box at most once
+GLYPH_WIDTH = 20 # Approximate width of one character in pixels for font size 32
+
+
+class BoardRenderer:
+    # `style` supplies the sizes and colors: cell_size, padding, cell_normal_bg, cell_selected_bg,
+    # box_number_fg, hover_overlay_color, player_colors, quantum_player_colors and arc_colors
+    # (the GUI front end has them all).
+
+    def __init__(self, canvas, style):
+        self.canvas = canvas
+        self.style = style
+        # Layout constants: each cell is a cell_size square inset by padding in a pitch-wide slot
+        self.cell_size = style.cell_size
+        self.padding = style.padding
+        self.pitch = self.cell_size + self.padding * 2
+        self.cells = [self._cell_coords(i) for i in range(BOX_COUNT)] # (x1, y1, x2, y2, center_x, center_y)
+        self.arc_points = [self._arc_points(*PAIRS[p]) for p in range(PAIR_COUNT)]
+        self._create_items()
+        # What the canvas shows now: per cell (background, mark, glyphs), per pair the arc's player
+        self._drawn_cells = [None] * BOX_COUNT
+        self._drawn_arcs = [None] * PAIR_COUNT
+        self.hover = -1 # Cell under the hover highlight
+
+    def _cell_coords(self, index):
+        size = self.cell_size
+        x1 = index % 3 * self.pitch + self.padding
+        y1 = index // 3 * self.pitch + self.padding
+        return (x1, y1, x1 + size, y1 + size, x1 + size / 2, y1 + size / 2)
+
+    def cell_at(self, x, y):
+        # The cell containing canvas point (x, y), or -1 outside the cells (including the padding)
+        col, x_in = divmod(x, self.pitch)
+        row, y_in = divmod(y, self.pitch)
+        if not (0 <= col < 3 and 0 <= row < 3):
+            return -1
+        padding = self.padding
+        if not (padding <= x_in < padding + self.cell_size and padding <= y_in < padding + self.cell_size):
+            return -1
+        return int(row) * 3 + int(col)
+
+    def set_hover(self, index):
+        # Moves the hover highlight to a cell, or hides it with -1
+        if index == self.hover:
+            return
+        if index == -1:
+            self.canvas.itemconfig(self.hover_item, state="hidden")
+        else:
+            self.canvas.coords(self.hover_item, *self.cells[index][:4])
+            if self.hover == -1:
+                self.canvas.itemconfig(self.hover_item, state="normal")
+        self.hover = index
+
+    def _arc_points(self, b1, b2):
+        # A spline from one cell center to the other, bowed sideways through a control point
+        # offset from the midpoint perpendicular to the line between the centers
+        cx1, cy1 = self.cells[b1][4:]
+        cx2, cy2 = self.cells[b2][4:]
+        dx = cx2 - cx1
+        dy = cy2 - cy1
+        offset = 0.2 * self.cell_size / math.sqrt(dx**2 + dy**2)
+        return [cx1, cy1, (cx1 + cx2) / 2 - dy * offset, (cy1 + cy2) / 2 + dx * offset, cx2, cy2]
+
+    def _create_items(self):
+        canvas = self.canvas
+        style = self.style
+        self.cell_items = []
+        self.mark_items = []
+        self.glyph_items = []
+        self.odds_items = []
+        for i, (x1, y1, x2, y2, _, _) in enumerate(self.cells):
+            self.cell_items.append(canvas.create_rectangle(x1, y1, x2, y2, fill=style.cell_normal_bg, outline="gray", tags=f"cell_{i}"))
+        # Stacked over every cell background and under every number and particle
+        self.hover_item = canvas.create_rectangle(0, 0, 0, 0, fill=style.hover_overlay_color, stipple="gray50",
+                                                  outline="", state="hidden", tags="hover_rect")
+        for i, (x1, y1, x2, y2, center_x, center_y) in enumerate(self.cells):
+            canvas.create_text(x2 - 8, y1 + 8, text=str(i), anchor="ne", font=("Arial", 9),
+                               fill=style.box_number_fg, tags=f"cell_{i}_number")
+            self.mark_items.append(canvas.create_text(center_x, center_y, text="", font=("Arial", 32, "bold"),
+                                                      state="hidden", tags=f"cell_{i}_particle"))
+            self.glyph_items.append([canvas.create_text(center_x, center_y, text="", font=("Arial", 32, "bold"),
+                                                        state="hidden", tags=f"cell_{i}_particle")
+                                     for _ in range(MAX_GLYPHS)])
+            self.odds_items.append(canvas.create_text(x1 + 6, y2 - 6, text="", anchor="sw", font=("Arial", 8),
+                                                      fill=style.box_number_fg, state="hidden", tags=f"cell_{i}_odds"))
+        # Arcs last, so they are drawn over the cells
+        self.arc_items = [canvas.create_line(points, smooth=True, splinesteps=20, width=2,
+                                             state="hidden", tags="entanglement_arc")
+                          for points in self.arc_points]
+
+    def invalidate(self):
+        # Forgets what is on the canvas, so the next render() sets every item
+        self._drawn_cells = [None] * BOX_COUNT
+        self._drawn_arcs = [None] * PAIR_COUNT
+
+    def render(self, board, particles, selected=(), ghost=0, odds=None):
+        # Brings the canvas in line with the position: board is the classical mark per box,
+        # particles the (player_lowercase, (box1, box2)) list of GameState.particle_list().
+        # The marks of the boxes in the `ghost` mask are drawn as a preview; odds, if given, is
+        # a caption per box (OccupancyOdds.labels()).
+        # Returns how many items were reconfigured.
+        glyphs = [[] for _ in range(BOX_COUNT)]
+        arcs = [None] * PAIR_COUNT
+        for player_lc, (b1, b2) in particles:
+            glyphs[b1].append(player_lc)
+            glyphs[b2].append(player_lc)
+            arcs[PAIR_INDEX[b1][b2]] = player_lc.upper()
+
+        updated = 0
+        style = self.style
+        if self.hover != -1 and board[self.hover]:
+            self.set_hover(-1) # No highlight on a classical cell
+            updated += 1
+        for i in range(BOX_COUNT):
+            bg = style.cell_selected_bg if i in selected else style.cell_normal_bg
+            # Quantum glyphs only show in boxes without a classical mark, sorted so 'o' comes before 'x'
+            cell = (bg, board[i], () if board[i] else tuple(sorted(glyphs[i])), ghost >> i & 1, odds[i] if odds else "")
+            drawn = self._drawn_cells[i]
+            if cell != drawn:
+                updated += self._update_cell(i, cell, drawn)
+                self._drawn_cells[i] = cell
+
+        canvas = self.canvas
+        drawn_arcs = self._drawn_arcs
+        for p in range(PAIR_COUNT):
+            player = arcs[p]
+            if player != drawn_arcs[p]:
+                if player is None:
+                    canvas.itemconfig(self.arc_items[p], state="hidden")
+                else:
+                    canvas.itemconfig(self.arc_items[p], state="normal", fill=style.arc_colors[player])
+                drawn_arcs[p] = player
+                updated += 1
+        return updated
+
+    def _update_cell(self, i, cell, drawn):
+        canvas = self.canvas
+        style = self.style
+        bg, mark, glyphs, ghosted, caption = cell
+        old_bg, old_mark, old_glyphs, old_ghosted, old_caption = drawn if drawn is not None else (None,) * 5
+        updated = 0
+        if bg != old_bg:
+            canvas.itemconfig(self.cell_items[i], fill=bg)
+            updated += 1
+        if mark != old_mark or ghosted != old_ghosted:
+            if mark:
+                fill = style.quantum_player_colors[mark.lower()] if ghosted else style.player_colors[mark]
+                canvas.itemconfig(self.mark_items[i], state="normal", text=mark.upper(), fill=fill)
+            else:
+                canvas.itemconfig(self.mark_items[i], state="hidden")
+            updated += 1
+        if glyphs != old_glyphs:
+            # Center the row of characters in the cell; only slots whose text or position changed are touched
+            center_x, center_y = self.cells[i][4:]
+            start_x = center_x - len(glyphs) * GLYPH_WIDTH / 2
+            old_count = len(old_glyphs) if old_glyphs is not None else -1
+            items = self.glyph_items[i]
+            for k, char in enumerate(glyphs):
+                if old_count == len(glyphs) and old_glyphs[k] == char:
+                    continue
+                canvas.coords(items[k], start_x + k * GLYPH_WIDTH + GLYPH_WIDTH / 2, center_y)
+                canvas.itemconfig(items[k], state="normal", text=char, fill=style.quantum_player_colors[char])
+                updated += 1
+            hide_from = len(glyphs)
+            hide_to = max(old_count, hide_from) if drawn is not None else MAX_GLYPHS
+            for k in range(hide_from, hide_to):
+                canvas.itemconfig(items[k], state="hidden")
+                updated += 1
+        if caption != old_caption:
+            if caption:
+                canvas.itemconfig(self.odds_items[i], state="normal", text=caption)
+            else:
+                canvas.itemconfig(self.odds_items[i], state="hidden")
+            updated += 1
+        return updated
@@ -0,0 +1,373 @@
+# Game server: many concurrent Quantum Tic-Tac-Toe sessions in one asyncio process.
+#
+#   python quantum_server.py --port 8765
+#
+# Protocol: one JSON object per line over TCP, both ways. Requests may carry an "id", which is
+# echoed in the reply to the sender.
+#   {"op": "create", "seats": ["X", "O"]}        new session; take the listed seats (default both)
+#   {"op": "join", "session": 7, "seat": "O"}    take a free seat in a session
+#     either may add "sync": "delta" to get versioned deltas instead of whole states
+#   {"op": "move", "session": 7, "boxes": [0, 4]}
+#   {"op": "collapse", "session": 7, "box": 4}  answer to a collapse_request
+#   {"op": "state", "session": 7}
+#   {"op": "snapshot", "session": 7}            whole state at the current delta version
+#   {"op": "leave", "session": 7}
+# Server messages:
+#   {"type": "created" | "joined", "session": 7, "seats": [...]}  plus "snapshot" with delta sync
+#   {"type": "state", "session": 7, "board": [...], "particles": [[a, b, "X"], ...], "turn": "X",
+#    "collapse": {"chooser": "O", "boxes": [a, b]} or null, "game_over": false, "winner": null}
+#   {"type": "deltas", "session": 7, "deltas": [...]}   instead of "state" with delta sync
+#   {"type": "snapshot", "session": 7, "snapshot": {...}}
+#   {"type": "collapse_request", "session": 7, "chooser": "O", "boxes": [a, b]}
+#   {"type": "closed", "session": 7, "reason": "idle" | "left" | "error"}
+#   {"type": "error", "message": "..."}
+#
+# When a placement closes a loop, the move's task awaits the deciding seat's "collapse" reply
+# (the server counterpart of the CLI's collapse prompt) while the connections keep reading.
+# Each connection sends from a bounded queue; a client that stops reading until it fills is
+# disconnected rather than letting its backlog grow. Sessions idle for longer than
+# idle_timeout are closed, and their engines go back to a pool for the next session.
+# Delta and snapshot formats are described in quantum_sync.py.
+
+import argparse
+import asyncio
+import json
+import time
+
+from quantum_engine import PAIRS, PLAYERS, QuantumEngine
+from quantum_sync import StateDeltas
+
+
+class Connection:
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        self.sessions = set() # Ids of the sessions this client holds a seat in
+        self.closed = False
+        self.sender = asyncio.ensure_future(self._send_loop())
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close() # Too slow a reader: drop it rather than buffer without limit
+
+    async def _send_loop(self):
+        writer = self.writer
+        queue = self.queue
+        try:
+            while True:
+                message = await queue.get()
+                writer.write(json.dumps(message).encode() + b'\n')
+                # Write whatever else is queued before waiting for the socket buffer to drain
+                while not queue.empty():
+                    writer.write(json.dumps(queue.get_nowait()).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sender.cancel()
+            self.writer.close()
+
+
+class Session:
+    __slots__ = ('id', 'engine', 'seats', 'last_active', 'collapse', 'task', 'deltas', 'delta_conns')
+
+    def __init__(self, session_id, engine):
+        self.id = session_id
+        self.engine = engine
+        self.seats = {'X': None, 'O': None} # seat -> Connection
+        self.last_active = time.monotonic()
+        self.collapse = None # Future awaiting the chooser's box while a collapse is pending
+        self.task = None # The move being played, while it waits on a collapse
+        self.deltas = None # StateDeltas, once a seat asks for delta sync
+        self.delta_conns = set()
+
+    def connections(self):
+        return {conn for conn in self.seats.values() if conn is not None}
+
+
+def is_int(value):
+    # JSON integers only: not floats, strings or true/false (bool is an int in Python)
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def session_id(request):
+    # The request's "session" if it is an int, else None (which matches no session)
+    value = request.get('session')
+    return value if is_int(value) else None
+
+
+class QuantumServer:
+    def __init__(self, max_sessions=10000, idle_timeout=300.0, collapse_timeout=60.0, queue_size=256, pool_size=1024):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.collapse_timeout = collapse_timeout # After this the collapse goes to the particle's lower box
+        self.queue_size = queue_size
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.engine_pool = [] # Engines of closed sessions, reset and ready for reuse
+        self.next_id = 1
+        self.server = None
+        self._evictor = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self._evictor = asyncio.ensure_future(self._evict_idle())
+        return self.server
+
+    async def close(self):
+        self._evictor.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    # --- Sessions ---
+
+    def _open_session(self):
+        engine = self.engine_pool.pop() if self.engine_pool else QuantumEngine()
+        session = Session(self.next_id, engine)
+        self.next_id += 1
+        self.sessions[session.id] = session
+        return session
+
+    def _close_session(self, session, reason):
+        del self.sessions[session.id]
+        if session.task is not None:
+            session.task.cancel()
+        if session.deltas is not None:
+            session.deltas.close()
+        for conn in session.connections():
+            conn.sessions.discard(session.id)
+            conn.send({'type': 'closed', 'session': session.id, 'reason': reason})
+        if len(self.engine_pool) < self.pool_size:
+            session.engine.reset()
+            self.engine_pool.append(session.engine)
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.05))
+            cutoff = time.monotonic() - self.idle_timeout
+            for session in [s for s in self.sessions.values() if s.last_active < cutoff]:
+                self._close_session(session, 'idle')
+
+    def _state_message(self, session, request_id=None):
+        engine = session.engine
+        state = engine.state
+        collapse = None
+        if engine.loop is not None:
+            collapse = {'chooser': PLAYERS[state.turn ^ 1], 'boxes': list(PAIRS[state.moves[-1]])}
+        message = {
+            'type': 'state', 'session': session.id, 'board': state.board_list(),
+            'particles': [[*PAIRS[p], state.owner_of(p)] for p in state.moves],
+            'turn': state.current_player, 'collapse': collapse,
+            'game_over': engine.game_over, 'winner': engine.winner,
+        }
+        if request_id is not None:
+            message['id'] = request_id
+        return message
+
+    def _broadcast(self, session, conn, request_id):
+        # The state, or the deltas since the last broadcast, to every seat; the requester's copy
+        # carries its request id
+        deltas = session.deltas.take() if session.deltas is not None else None
+        for other in session.connections():
+            if other in session.delta_conns:
+                message = {'type': 'deltas', 'session': session.id, 'deltas': deltas}
+                if other is conn and request_id is not None:
+                    message['id'] = request_id
+            else:
+                message = self._state_message(session, request_id if other is conn else None)
+            other.send(message)
+
+    def _seated(self, session, conn, seats, request, reply):
+        for seat in seats:
+            session.seats[seat] = conn
+        conn.sessions.add(session.id)
+        message = {'type': reply, 'session': session.id, 'seats': seats, 'id': request.get('id')}
+        if request.get('sync') == 'delta':
+            if session.deltas is None:
+                session.deltas = StateDeltas(session.engine)
+            session.delta_conns.add(conn)
+            message['snapshot'] = session.deltas.snapshot()
+        conn.send(message)
+
+    # --- Connections ---
+
+    async def _handle(self, reader, writer):
+        conn = Connection(writer, self.queue_size)
+        try:
+            while not conn.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request['op']
+                except (ValueError, KeyError, TypeError):
+                    conn.send({'type': 'error', 'message': 'Expected a JSON object with an "op"'})
+                    continue
+                handler = getattr(self, '_op_' + str(op), None)
+                if handler is None:
+                    conn.send({'type': 'error', 'message': f"Unknown op {op!r}", 'id': request.get('id')})
+                    continue
+                error = handler(conn, request)
+                if error:
+                    conn.send({'type': 'error', 'message': error, 'id': request.get('id')})
+        except ConnectionError:
+            pass
+        finally:
+            conn.close()
+            for session_id in list(conn.sessions):
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    self._close_session(session, 'left')
+
+    def _session_for(self, conn, request):
+        session = self.sessions.get(session_id(request))
+        if session is None or session.id not in conn.sessions:
+            return None
+        session.last_active = time.monotonic()
+        return session
+
+    # Op handlers return an error message, or None
+
+    def _op_create(self, conn, request):
+        seats = request.get('seats', list(PLAYERS))
+        if not isinstance(seats, list) or not all(isinstance(seat, str) for seat in seats) or not set(seats) <= set(PLAYERS):
+            return "Seats are 'X' and 'O'"
+        if len(self.sessions) >= self.max_sessions:
+            return "Server is full"
+        session = self._open_session()
+        self._seated(session, conn, seats, request, 'created')
+        return None
+
+    def _op_join(self, conn, request):
+        session = self.sessions.get(session_id(request))
+        seat = request.get('seat')
+        if session is None:
+            return "No such session"
+        if seat not in PLAYERS or session.seats[seat] is not None:
+            return "That seat isn't free"
+        session.last_active = time.monotonic()
+        self._seated(session, conn, [seat], request, 'joined')
+        return None
+
+    def _op_state(self, conn, request):
+        session = self._session_for(conn, request)
+        if session is None:
+            return "Not in that session"
+        conn.send(self._state_message(session, request.get('id')))
+        return None
+
+    def _op_snapshot(self, conn, request):
+        session = self._session_for(conn, request)
+        if session is None:
+            return "Not in that session"
+        if session.deltas is None:
+            return "The session has no delta sync"
+        conn.send({'type': 'snapshot', 'session': session.id, 'snapshot': session.deltas.snapshot(), 'id': request.get('id')})
+        return None
+
+    def _op_leave(self, conn, request):
+        session = self._session_for(conn, request)
+        if session is None:
+            return "Not in that session"
+        self._close_session(session, 'left')
+        return None
+
+    def _op_move(self, conn, request):
+        session = self._session_for(conn, request)
+        if session is None:
+            return "Not in that session"
+        engine = session.engine
+        if engine.game_over:
+            return "The game is over"
+        if engine.loop is not None:
+            return "Waiting for the collapse choice"
+        if session.seats[engine.state.current_player] is not conn:
+            return "Not your turn"
+        boxes = request.get('boxes')
+        if not isinstance(boxes, list) or len(boxes) != 2 or not all(is_int(box) for box in boxes):
+            return 'A move needs "boxes": [box1, box2]'
+        box1, box2 = boxes
+        reason = engine.validate(box1, box2)
+        if reason is not None:
+            return f"Illegal move ({reason})"
+
+        engine.place_particle(box1, box2)
+        self._broadcast(session, conn, request.get('id'))
+        if engine.loop is not None:
+            self._request_collapse(session)
+        return None
+
+    def _request_collapse(self, session):
+        # Asks the deciding seat where the closing particle goes. The future exists before this
+        # returns, so an answer read right after the move always finds it.
+        engine = session.engine
+        chooser = PLAYERS[engine.state.turn ^ 1]
+        box_a, box_b = PAIRS[engine.state.moves[-1]]
+        session.collapse = asyncio.get_running_loop().create_future()
+        conn = session.seats[chooser]
+        if conn is not None:
+            conn.send({'type': 'collapse_request', 'session': session.id, 'chooser': chooser, 'boxes': [box_a, box_b]})
+        session.task = asyncio.ensure_future(self._await_collapse(session, box_a))
+
+    async def _await_collapse(self, session, default_box):
+        try:
+            box, request_id, conn = await asyncio.wait_for(session.collapse, self.collapse_timeout)
+        except asyncio.TimeoutError:
+            box, request_id, conn = default_box, None, None
+        session.collapse = None
+        session.task = None
+        try:
+            session.engine.resolve_collapse(box)
+        except Exception:
+            # The engine may be half way through the collapse, so the game can't go on; without
+            # this the session would wait forever for a collapse nobody is asked for
+            self._close_session(session, 'error')
+            return
+        session.last_active = time.monotonic()
+        self._broadcast(session, conn, request_id)
+
+    def _op_collapse(self, conn, request):
+        session = self._session_for(conn, request)
+        if session is None:
+            return "Not in that session"
+        engine = session.engine
+        if session.collapse is None or session.collapse.done():
+            return "No collapse is pending"
+        if session.seats[PLAYERS[engine.state.turn ^ 1]] is not conn:
+            return "The other player chooses this collapse"
+        box = request.get('box')
+        if not is_int(box) or box not in PAIRS[engine.state.moves[-1]]:
+            return "The box must be one of the closing particle's two boxes"
+        session.collapse.set_result((box, request.get('id'), conn))
+        return None
+
+
+async def serve(host, port, **options):
+    server = QuantumServer(**options)
+    listener = await server.start(host, port)
+    print(f"Serving on {', '.join(str(sock.getsockname()) for sock in listener.sockets)}")
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantum Tic-Tac-Toe game server (JSON lines over TCP).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds before an idle session is closed")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, max_sessions=args.max_sessions, idle_timeout=args.idle_timeout))
+    except KeyboardInterrupt:
+        pass
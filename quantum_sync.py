@@ -0,0 +1,197 @@
+# State sync for remote front ends: the engine side emits small versioned deltas, the client side
+# keeps a mirror of the game up to date from them.
+#
+# Deltas are JSON-ready dicts, numbered from 1 with no gaps:
+#   {'version': 5, 'kind': 'particle', 'player': 'X', 'boxes': [0, 4]}
+#   {'version': 6, 'kind': 'loop', 'chooser': 'O', 'boxes': [0, 4]}      collapse of that particle pending
+#   {'version': 7, 'kind': 'resolved', 'marks': [[4, 'X'], [3, 'O']]}     boxes that became classical
+#   {'version': 8, 'kind': 'removed', 'pairs': [[0, 4], [3, 4]]}          entanglements gone in the collapse
+#   {'version': 9, 'kind': 'turn', 'player': 'O'}
+#   {'version': 10, 'kind': 'game_over', 'winner': 'X'}                   'X', 'O', 'Both' or None for a draw
+#   {'version': 11, 'kind': 'reset'}
+# A snapshot is the whole game at a version (see snapshot()). A mirror that sees a version it
+# didn't expect, e.g. after dropped messages or on joining late, reloads from a snapshot.
+
+from collections import deque
+
+from quantum_engine import BOX_COUNT, PAIRS, PLAYERS
+
+
+def snapshot(engine, version):
+    state = engine.state
+    pending = None
+    if engine.loop is not None:
+        pending = {'chooser': PLAYERS[state.turn ^ 1], 'boxes': list(PAIRS[state.moves[-1]])}
+    return {
+        'version': version, 'board': state.board_list(),
+        'particles': [[state.owner_of(p), list(PAIRS[p])] for p in state.moves],
+        'turn': state.current_player, 'pending': pending,
+        'game_over': engine.game_over, 'winner': engine.winner,
+    }
+
+
+class StateDeltas:
+    # Engine subscriber turning events into deltas. New deltas collect in `pending` until take();
+    # the last `history` of them are kept so a client that is a little behind can catch up with
+    # since() instead of a snapshot.
+
+    def __init__(self, engine, history=256):
+        self.engine = engine
+        self.version = 0
+        self.history = deque(maxlen=history)
+        self.pending = []
+        engine.events.subscribe(self)
+
+    def close(self):
+        self.engine.events.unsubscribe(self)
+
+    def take(self):
+        # Returns the deltas since the last call
+        deltas = self.pending
+        self.pending = []
+        return deltas
+
+    def since(self, version):
+        # The deltas after `version`, or None if they are no longer all in the history
+        if version >= self.version:
+            return []
+        if not self.history or self.history[0]['version'] > version + 1:
+            return None
+        return [delta for delta in self.history if delta['version'] > version]
+
+    def snapshot(self):
+        return snapshot(self.engine, self.version)
+
+    def _push(self, kind, **fields):
+        self.version += 1
+        delta = {'version': self.version, 'kind': kind}
+        delta.update(fields)
+        self.history.append(delta)
+        self.pending.append(delta)
+
+    # --- Engine events ---
+
+    def on_reset(self):
+        self._push('reset')
+
+    def on_particle_placed(self, player, box1, box2):
+        # The boxes in PAIRS order, as 'removed' lists them, whichever order the move gave them in
+        self._push('particle', player=player, boxes=list(PAIRS[self.engine.state.moves[-1]]))
+
+    def on_loop_detected(self, loop_boxes, loop_pairs, chooser):
+        self._push('loop', chooser=chooser, boxes=list(PAIRS[self.engine.state.moves[-1]]))
+
+    def on_collapse_resolved(self, result):
+        lost = set(result.lost) # Resolved, but into a box an earlier resolution had taken
+        marks = [[box, player] for pair, box, player in result.resolved if (pair, box, player) not in lost]
+        self._push('resolved', marks=marks)
+        if result.resolved:
+            self._push('removed', pairs=[list(PAIRS[p]) for p, _, _ in result.resolved])
+
+    def on_turn_changed(self, player):
+        self._push('turn', player=player)
+
+    def on_win(self, player):
+        self._push('game_over', winner=self.engine.winner)
+
+    def on_draw(self, reason):
+        self._push('game_over', winner=self.engine.winner)
+
+
+class StateMirror:
+    # Client-side copy of a game kept current from deltas. `resync` is called with no arguments
+    # when the mirror needs a snapshot and must return one (e.g. by asking the server).
+
+    def __init__(self, resync):
+        self.resync = resync
+        self.version = None # Unknown until the first snapshot
+        self._clear()
+
+    def _clear(self):
+        self.board = [None] * BOX_COUNT
+        self.particles = [] # [player, (box1, box2)] in placement order
+        self.turn = PLAYERS[0]
+        self.pending = None # (chooser, (box_a, box_b)) while a collapse waits to be chosen
+        self.game_over = False
+        self.winner = None
+
+    def load(self, snapshot):
+        self.version = snapshot['version']
+        self.board = list(snapshot['board'])
+        self.particles = [[player, tuple(boxes)] for player, boxes in snapshot['particles']]
+        self.turn = snapshot['turn']
+        pending = snapshot['pending']
+        self.pending = (pending['chooser'], tuple(pending['boxes'])) if pending else None
+        self.game_over = snapshot['game_over']
+        self.winner = snapshot['winner']
+
+    def snapshot(self):
+        # The mirror in the format of snapshot(), to compare with the game it follows
+        pending = {'chooser': self.pending[0], 'boxes': list(self.pending[1])} if self.pending else None
+        return {
+            'version': self.version, 'board': list(self.board),
+            'particles': [[player, list(boxes)] for player, boxes in self.particles],
+            'turn': self.turn, 'pending': pending,
+            'game_over': self.game_over, 'winner': self.winner,
+        }
+
+    def apply(self, delta):
+        # Applies one delta. Returns the set of boxes whose contents changed, so a renderer can
+        # redraw just those, or None after a resync, when everything should be redrawn.
+        version = delta['version']
+        if self.version is not None and version <= self.version:
+            return set() # Already seen
+        if self.version is None or version != self.version + 1:
+            self.load(self.resync())
+            return None
+        self.version = version
+        kind = delta['kind']
+        if kind == 'particle':
+            boxes = tuple(delta['boxes'])
+            self.particles.append([delta['player'], boxes])
+            return set(boxes)
+        if kind == 'loop':
+            self.pending = (delta['chooser'], tuple(delta['boxes']))
+            return set(delta['boxes'])
+        if kind == 'resolved':
+            self.pending = None
+            for box, player in delta['marks']:
+                self.board[box] = player
+            return {box for box, _ in delta['marks']}
+        if kind == 'removed':
+            removed = {tuple(boxes) for boxes in delta['pairs']}
+            self.particles = [particle for particle in self.particles if particle[1] not in removed]
+            return {box for boxes in removed for box in boxes}
+        if kind == 'turn':
+            self.turn = delta['player']
+        elif kind == 'game_over':
+            self.game_over = True
+            self.winner = delta['winner']
+        elif kind == 'reset':
+            self._clear()
+            return set(range(BOX_COUNT))
+        return set()
+
+    def apply_all(self, deltas):
+        # Applies a batch; returns the union of the changed boxes, or None if it resynced
+        changed = set()
+        resynced = False
+        for delta in deltas:
+            boxes = self.apply(delta)
+            if boxes is None:
+                resynced = True # Deltas the snapshot already covers are skipped as seen
+            else:
+                changed |= boxes
+        return None if resynced else changed
+
+    # --- Views in the shapes GameState offers the front ends ---
+
+    def particle_list(self):
+        return [(player.lower(), boxes) for player, boxes in self.particles]
+
+    def entanglement_map(self):
+        entanglements = {}
+        for _, (b1, b2) in self.particles:
+            entanglements.setdefault(b1, []).append(b2)
+            entanglements.setdefault(b2, []).append(b1)
+        return entanglements
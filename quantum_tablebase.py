@@ -0,0 +1,278 @@
+# Endgame tablebase: exact game values for every position with few free boxes left.
+#
+# Building (offline, slow):   python quantum_tablebase.py --max-free 5 -o quantum-ttt.tb
+# Using (instant):            Tablebase("quantum-ttt.tb").lookup(engine)
+#
+# Live particles only ever connect free boxes, and play never frees a box again, so "at most N
+# free boxes" is closed under play: every position in the table is solved exactly from positions
+# in the table. The whole game doesn't fit (the loop-free positions alone run to hundreds of
+# millions), but the endgame, where mistakes cost the most, does.
+#
+# File layout, all big-endian:
+#   header  (16 bytes): magic b'QTTB', version, max_free, reserved, record count
+#   records (16 bytes each), sorted by key:
+#     key (12 bytes): x_board | o_board << 9 | x_pairs << 18 | o_pairs << 54 | turn << 90 of the
+#                     canonical position (see canonicalize in quantum_engine)
+#     value (int8):   1 if the player to move wins with perfect play, -1 if they lose, 0 for a draw
+#     move (uint8):   the best pair index, in the canonical orientation
+#     plies (uint8):  placements until the game ends with perfect play
+#     reserved (1 byte)
+# Lookups binary-search the memory-mapped file, so the table is never read into memory.
+
+import argparse
+import mmap
+import struct
+import sys
+import time
+
+from quantum_engine import (BOX_COUNT, FULL_BOARD, INVERSE_SYMMETRY, PAIR_SYMMETRIES, PAIRS, PAIRS_WITHIN, PLAYERS,
+                            STANDARD, WIN_LINES, DisjointSet, GameState, QuantumEngine, canonicalize, iter_bits)
+
+MAGIC = b'QTTB'
+VERSION = 1
+HEADER = struct.Struct('>4sBBHQ')
+RECORD = struct.Struct('>12sbBBx')
+KEY_SIZE = 12
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+
+def pack_key(key):
+    x_board, o_board, x_pairs, o_pairs, turn = key
+    return (x_board | o_board << 9 | x_pairs << 18 | o_pairs << 54 | turn << 90).to_bytes(KEY_SIZE, 'big')
+
+
+def enumerate_positions(max_free):
+    # Yields one GameState per symmetry class of every position that can arise in play with at
+    # most max_free free boxes and the game still on. "Can arise" is checked by the counting
+    # rules (players alternate placements, each resolved particle is one classical mark, live
+    # particles form a forest on the free boxes); that admits a few positions no game reaches,
+    # which only costs table space.
+    for free in range(1, 1 << BOX_COUNT):
+        free_count = bin(free).count('1')
+        if free_count > max_free:
+            continue
+        classical = FULL_BOARD ^ free
+        forests = _forests(free)
+        for x_board in _submasks(classical):
+            o_board = classical ^ x_board
+            if any(x_board & line == line or o_board & line == line for line in WIN_LINES):
+                continue
+            for live in forests:
+                if live == PAIRS_WITHIN[free]:
+                    continue # No pair left to place: the game ended in a draw
+                for x_pairs in _submasks(live):
+                    o_pairs = live ^ x_pairs
+                    placed = bin(classical).count('1') + bin(live).count('1')
+                    if bin(x_board).count('1') + bin(x_pairs).count('1') != (placed + 1) // 2:
+                        continue
+                    state = GameState()
+                    state.x_board = x_board
+                    state.o_board = o_board
+                    state.x_pairs = x_pairs
+                    state.o_pairs = o_pairs
+                    state.moves = tuple(iter_bits(live))
+                    state.turn = placed & 1
+                    if canonicalize(state)[0][:4] == (x_board, o_board, x_pairs, o_pairs):
+                        state.rehash()
+                        yield state
+
+
+def _submasks(mask):
+    sub = mask
+    while True:
+        yield sub
+        if not sub:
+            return
+        sub = (sub - 1) & mask
+
+
+def _forests(free):
+    # Every set of pairs within the free boxes that contains no loop
+    forests = []
+    for pairs in _submasks(PAIRS_WITHIN[free]):
+        components = DisjointSet()
+        if all(components.union(*PAIRS[p]) for p in iter_bits(pairs)):
+            forests.append(pairs)
+    return forests
+
+
+class Solver:
+    # Memoized negamax over canonical positions. Collapses are decided by the player who didn't
+    # close the loop, as in play. Results are (value, move, plies) for the player to move, with
+    # the move in the canonical orientation; faster wins and slower losses are preferred.
+
+    def __init__(self):
+        self.memo = {}
+        self.engine = QuantumEngine()
+
+    def solve(self, state):
+        self.engine.load(state)
+        if self.engine.game_over:
+            raise ValueError("The game is already over")
+        return self._solve()
+
+    def _solve(self):
+        engine = self.engine
+        key, t = canonicalize(engine.state)
+        result = self.memo.get(key)
+        if result is not None:
+            return result
+
+        best = None
+        best_rank = None
+        legal, closing = engine.legal_moves()
+        for pair in iter_bits(legal):
+            if closing >> pair & 1:
+                engine.make_move(*PAIRS[pair])
+                # The opponent picks the collapse that is best for them
+                value, plies = max((self._after_collapse(box) for box in PAIRS[pair]), key=_rank)
+                engine.unmake_move()
+            else:
+                engine.make_move(*PAIRS[pair])
+                if engine.game_over:
+                    value, plies = DRAW, 0 # The opponent is left without a move
+                else:
+                    value, _, plies = self._solve()
+                engine.unmake_move()
+            # The value is from the opponent's side; flip it to ours
+            value, plies = -value, plies + 1
+            rank = _rank((value, plies))
+            if best_rank is None or rank > best_rank:
+                best = (value, PAIR_SYMMETRIES[t][pair], plies)
+                best_rank = rank
+                if value == WIN and plies == 1:
+                    break # Can't do better than winning now
+
+        self.memo[key] = best
+        return best
+
+    def _after_collapse(self, box):
+        # (value, plies) of resolving the pending collapse into box, for the player choosing it
+        engine = self.engine
+        chooser = PLAYERS[engine.state.turn ^ 1]
+        engine.make_collapse(box)
+        if engine.game_over:
+            if engine.winner == chooser:
+                result = (WIN, 0)
+            elif engine.winner in PLAYERS:
+                result = (LOSS, 0)
+            else:
+                result = (DRAW, 0)
+        else:
+            value, _, plies = self._solve()
+            result = (value, plies)
+        engine.unmake_collapse()
+        return result
+
+
+def _rank(outcome):
+    # Orders (value, plies) from the mover's side: win soonest > draw > lose latest
+    value, plies = outcome
+    return (value, -plies if value == WIN else plies)
+
+
+def build(path, max_free, progress=None):
+    solver = Solver()
+    started = time.perf_counter()
+    for count, state in enumerate(enumerate_positions(max_free), 1):
+        solver.solve(state)
+        if progress and not count % 10000:
+            progress(f"{count} positions enumerated, {len(solver.memo)} solved, {time.perf_counter() - started:.0f}s")
+
+    records = sorted((pack_key(key), value, move, plies) for key, (value, move, plies) in solver.memo.items())
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_free, 0, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return len(records)
+
+
+class Tablebase:
+    # Read-only view of a tablebase file. lookup() answers for any position the table covers.
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_free, _, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase")
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def covers(self, engine):
+        state = engine.state
+        return (engine.geometry is STANDARD and not engine.game_over and engine.loop is None
+                and bin(FULL_BOARD ^ (state.x_board | state.o_board)).count('1') <= self.max_free)
+
+    def lookup(self, engine):
+        # Returns (value, (box1, box2), plies) for the player to move, or None if the
+        # position isn't in the table
+        if not self.covers(engine):
+            return None
+        key, t = canonicalize(engine.state)
+        wanted = pack_key(key)
+        data = self.data
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            found = data[offset:offset + KEY_SIZE]
+            if found < wanted:
+                low = middle + 1
+            elif found > wanted:
+                high = middle
+            else:
+                _, value, move, plies = RECORD.unpack_from(data, offset)
+                return value, PAIRS[PAIR_SYMMETRIES[INVERSE_SYMMETRY[t]][move]], plies
+        return None
+
+    def choose_collapse(self, engine):
+        # The collapse choice that is best for the chooser, or None if an outcome isn't covered
+        chooser = PLAYERS[engine.state.turn ^ 1]
+        scratch = engine.copy()
+        best = None
+        best_rank = None
+        for box in PAIRS[scratch.state.moves[-1]]:
+            scratch.make_collapse(box)
+            if scratch.game_over:
+                outcome = (WIN if scratch.winner == chooser else LOSS if scratch.winner in PLAYERS else DRAW, 0)
+            else:
+                result = self.lookup(scratch)
+                if result is None:
+                    return None
+                outcome = (result[0], result[2])
+            scratch.unmake_collapse()
+            if best_rank is None or _rank(outcome) > best_rank:
+                best = box
+                best_rank = _rank(outcome)
+        return best
+
+    def describe(self, engine):
+        # "X wins in 3", "Draw", ... for the position, or None if it isn't covered
+        result = self.lookup(engine)
+        if result is None:
+            return None
+        value, _, plies = result
+        player = engine.state.current_player
+        if value == WIN:
+            return f"{player} wins in {plies} with perfect play"
+        if value == LOSS:
+            return f"{PLAYERS[engine.state.turn ^ 1]} wins in {plies} with perfect play"
+        return "Draw with perfect play"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Quantum Tic-Tac-Toe endgame tablebase.")
+    parser.add_argument("--max-free", type=int, default=5, help="solve every position with at most this many free boxes (default 5)")
+    parser.add_argument("-o", "--output", default="quantum-ttt.tb", help="file to write (default quantum-ttt.tb)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = build(args.output, args.max_free, progress=lambda message: print(message, file=sys.stderr))
+    print(f"Wrote {count} positions to {args.output} in {time.perf_counter() - started:.1f}s")